@@ -0,0 +1,206 @@
+"""
+Analyzer pool module that scans long messages with the analyzers' pattern
+tables in warm worker processes, so the regex work of one message runs on
+several cores instead of one after another behind the GIL.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, wait
+
+from pattern_matcher import NormalizedMessage
+
+# Pattern tables of the detection halves the stages run, scanned one per task, in the
+# order the response pipeline runs the stages
+TABLES = ("therapist_request", "wellness_routine", "positive_mood", "negative_mood", "deep_thought", "mental_health")
+
+# Modules registering the tables, imported by workers that don't inherit them
+ANALYZER_MODULES = ("therapist_contacts", "wellness_routines", "positive_responses", "mood_encouragement",
+                    "deep_listening", "mental_health_analysis")
+
+
+def _warm_worker():
+    # Forked workers inherit the compiled tables; spawned ones compile them here
+    for module in ANALYZER_MODULES:
+        __import__(module)
+    NormalizedMessage("warm up").spans(TABLES[0])
+
+
+def _scan_table(text, name):
+    return NormalizedMessage(text).spans(name)
+
+
+class AnalyzerPool:
+    """
+    Warm process pool scanning a message's pattern tables in parallel.
+
+    Each table of a message is scanned by its own task, and the spans that
+    come back before the deadline are stored on the request's
+    NormalizedMessage. The analyzers then run as usual in the request
+    process, reading the scans from the message, so detection results and
+    the per-user state updates built on them don't change. A table whose
+    scan misses the deadline or fails is simply scanned in the request
+    process when an analyzer first needs it.
+
+    Short messages are left alone: for them sending the text to the workers
+    costs more than scanning it.
+
+    Every table is submitted, in pipeline order, even though the pipeline
+    usually stops at the first stage that replies: which stage that is only
+    becomes known by scanning, and waiting for each answer before submitting
+    the next table would run the scans one after another again. With fewer
+    workers than tables the early stages' tables are scanned first; the
+    others cost idle worker time, not request latency.
+
+    If the pool breaks, for example because a worker was killed, messages
+    are scanned in the request process while a new pool is started. If the
+    new pool's workers don't all start within start_timeout, they are
+    killed and the pool stays off, with every message scanned in the
+    request process, rather than waiting on workers that may never start.
+    """
+
+    def __init__(self, workers=None, deadline=0.05, min_length=256, start_timeout=10.0):
+        """
+        Create a pool and start its workers.
+
+        Args:
+            workers (int, optional): Worker processes, defaults to the CPU count
+            deadline (float): Seconds a message waits for the workers' scans
+            min_length (int): Shortest message, in characters, sent to the workers
+            start_timeout (float): Seconds the workers get to start
+
+        Raises:
+            TimeoutError: If the workers didn't start in time
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.deadline = deadline
+        self.min_length = min_length
+        self.start_timeout = start_timeout
+        self.stats = {"messages": 0, "scans": 0, "missed": 0}
+
+        self._restarting = False
+        self._lock = threading.Lock()
+        self._executor = self._start_executor()
+
+    def _start_executor(self):
+        # Forking starts the workers with the tables already compiled. The first pool forks at
+        # import, before the backends start any threads, but a restart forks a busy process,
+        # where another thread may hold a lock when it forks: the fork copies it held, and a
+        # worker needing it waits forever. The matcher and request_logging replace their locks
+        # in forked children; a worker stuck on any other lock misses start_timeout
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_warm_worker)
+        # Start every worker now rather than on the first long message
+        warm_ups = [executor.submit(_scan_table, "warm up", TABLES[0]) for _ in range(self.workers)]
+        _, not_done = wait(warm_ups, timeout=self.start_timeout)
+        if not_done:
+            # Shutting down would wait on the stuck workers, kill them instead
+            for process in list((executor._processes or {}).values()):
+                process.kill()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise TimeoutError(f"Analyzer pool workers didn't start within {self.start_timeout}s")
+        return executor
+
+    def _restart(self, error):
+        with self._lock:
+            if self._restarting:
+                return
+            self._restarting = True
+        logging.error(f"Analyzer pool broke, scanning in the request process while it restarts: {error}")
+
+        def restart():
+            broken = self._executor
+            broken.shutdown(wait=False, cancel_futures=True)
+            try:
+                self._executor = self._start_executor()
+            except Exception as e:
+                logging.error(f"Analyzer pool restart failed, scanning every message in the request process: {e}")
+                self._executor = None
+            finally:
+                with self._lock:
+                    self._restarting = False
+
+        threading.Thread(target=restart, name="analyzer-pool-restart", daemon=True).start()
+
+    def scan(self, message):
+        """
+        Scan a message's tables in the workers and store the spans on the message.
+
+        Args:
+            message (NormalizedMessage): The normalized user message
+
+        Returns:
+            int: Number of tables scanned in the workers in time
+        """
+        executor = self._executor
+        if len(message.text) < self.min_length or self._restarting or executor is None:
+            return 0
+
+        try:
+            futures = {executor.submit(_scan_table, message.raw, name): name for name in TABLES}
+        except (BrokenExecutor, RuntimeError) as e:
+            # The message's tables are then scanned in this process when the stages need them
+            self._restart(e)
+            return 0
+        done, not_done = wait(futures, timeout=self.deadline)
+        for future in not_done:
+            future.cancel()
+
+        scanned = 0
+        for future in done:
+            try:
+                message.set_spans(futures[future], future.result())
+                scanned += 1
+            except BrokenExecutor as e:
+                self._restart(e)
+            except Exception as e:
+                logging.warning(f"Analyzer pool scan of {futures[future]} failed: {e}")
+
+        self.stats["messages"] += 1
+        self.stats["scans"] += scanned
+        self.stats["missed"] += len(TABLES) - scanned
+        return scanned
+
+    def close(self):
+        """Stop the workers."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_analyzer_pool():
+    """
+    Get the shared analyzer pool, creating it from the environment on first use.
+
+    The pool is opt-in: without ANALYZER_POOL_WORKERS messages are scanned in
+    the request process as before.
+
+    Environment variables:
+        ANALYZER_POOL_WORKERS: Worker processes, 0 disables the pool (default 0)
+        ANALYZER_POOL_DEADLINE: Seconds a message waits for the workers (default 0.05)
+        ANALYZER_POOL_MIN_LENGTH: Shortest message sent to the workers (default 256)
+        ANALYZER_POOL_START_TIMEOUT: Seconds the workers get to start (default 10)
+
+    Returns:
+        AnalyzerPool: The shared pool, or None if it's disabled
+    """
+    global _pool
+    workers = int(os.getenv("ANALYZER_POOL_WORKERS", 0))
+    if workers <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = AnalyzerPool(
+                workers=workers,
+                deadline=float(os.getenv("ANALYZER_POOL_DEADLINE", 0.05)),
+                min_length=int(os.getenv("ANALYZER_POOL_MIN_LENGTH", 256)),
+                start_timeout=float(os.getenv("ANALYZER_POOL_START_TIMEOUT", 10))
+            )
+        return _pool
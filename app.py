@@ -1,65 +1,84 @@
 from flask import Flask, request, jsonify
-from flask_cors import CORS
 import random
 import logging
 import os
-import uuid
+import time
 from datetime import datetime
+from keyword_index import KeywordIndex
+from chat_history import ChatHistory
+from session_store import get_session_store, new_session_id, session_turn
+from session_expiry import start_session_expiry
+from session_log import log_turn, start_session_log
+from request_logging import get_request_logger, start_logging
+from frontend import register_frontend
+from cors import enable_cors
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # For session management
 
-# Configure CORS to allow requests from any origin
-CORS(app,
-     supports_credentials=True,  # Enable CORS with credentials support
-     resources={r"/*": {"origins": "*"}},  # Allow all origins
-     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-     methods=["GET", "POST", "OPTIONS"]
-)
+# Answer CORS preflights and add the CORS headers to every response in one place, before Flask's routing
+enable_cors(app)
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Serve the frontend from this process too if SERVE_FRONTEND is set, so chat requests are same-origin
+register_frontend(app)
 
-# Store conversation history
-conversation_history = {}
+# Set up logging: JSON records written from a background thread, chat requests sampled
+start_logging()
+request_log = get_request_logger()
+
+# Store conversation history, bounded by the session store's caps
+conversation_history = get_session_store("app.conversation_history")
+
+# Clean up old conversations periodically, on a background thread instead of before each request
+start_session_expiry()
+
+# Restore the sessions from the durable session log and keep logging turns, if SESSION_LOG_DIR is set
+start_session_log()
+
+# Messages kept per conversation to prevent memory issues
+HISTORY_CAPACITY = 10
+
+# Keyword lists for the rule-based responses, indexed once for a single-pass scan
+RESPONSE_KEYWORDS = KeywordIndex({
+    "greetings": ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening'],
+    "feelings": ['sad', 'depressed', 'unhappy', 'stress', 'anxiety', 'lonely', 'tired', 'angry', 'worried', 'overwhelmed'],
+    "help": ['help'],
+    "thanks": ['thank', 'thanks']
+})
 
 # Simple rules-based response logic for mental health chatbot
 def generate_response(message, session_id):
     message = message.lower()
 
     # Get or create conversation history for this session
-    if session_id not in conversation_history:
-        conversation_history[session_id] = []
+    history = conversation_history.get(session_id)
+    if history is None:
+        history = ChatHistory(HISTORY_CAPACITY)
 
-    # Add user message to history
-    conversation_history[session_id].append({
+    # Add user message to history, the oldest message drops out past HISTORY_CAPACITY
+    history.append({
         'role': 'user',
         'content': message,
         'timestamp': datetime.now().isoformat()
     })
 
-    # Limit history to last 10 messages to prevent memory issues
-    if len(conversation_history[session_id]) > 10:
-        conversation_history[session_id] = conversation_history[session_id][-10:]
-
-    # Check for patterns in the message
-    greetings = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening']
-    feelings = ['sad', 'depressed', 'unhappy', 'stress', 'anxiety', 'lonely', 'tired', 'angry', 'worried', 'overwhelmed']
+    # Find the hits of every keyword list in one scan
+    hits = RESPONSE_KEYWORDS.scan(message)
 
     # Check if this is a follow-up question
-    is_followup = len(conversation_history[session_id]) > 2
+    is_followup = len(history) > 2
 
     # Generate appropriate response based on context
     response = ""
 
-    if any(greet in message for greet in greetings):
+    if hits["greetings"]:
         response = random.choice([
             "Hello! How are you feeling today?",
             "Hi there! How can I support you today?",
             "Hey! What's on your mind?"
         ])
-    elif any(feel in message for feel in feelings):
-        if is_followup and any(feel in conversation_history[session_id][-3]['content'] for feel in feelings):
+    elif hits["feelings"]:
+        if is_followup and RESPONSE_KEYWORDS.scan(history[-3]['content'])["feelings"]:
             # If user mentioned feelings before, provide a deeper response
             response = random.choice([
                 "You've mentioned feeling this way before. Has anything changed since we last talked?",
@@ -72,9 +91,9 @@ def generate_response(message, session_id):
                 "That sounds tough. Remember, it's okay to feel this way.",
                 "Have you tried any strategies to help you feel better?"
             ])
-    elif 'help' in message:
+    elif hits["help"]:
         response = "I'm here to listen. Please share what you're feeling."
-    elif 'thank' in message or 'thanks' in message:
+    elif hits["thanks"]:
         response = "You're welcome! I'm here whenever you need to talk."
     else:
         # Default fallback response
@@ -82,91 +101,50 @@ def generate_response(message, session_id):
                 "If you feel overwhelmed, consider reaching out to a mental health professional.")
 
     # Add bot response to history
-    conversation_history[session_id].append({
+    history.append({
         'role': 'bot',
         'content': response,
         'timestamp': datetime.now().isoformat()
     })
+    conversation_history[session_id] = history
 
     return response
 
 @app.route('/chat', methods=['POST'])
 def chat():
+    start = time.perf_counter()
     try:
-        # Log request details for debugging
-        logging.info(f"Received request: {request.method} {request.path}")
-        logging.info(f"Request headers: {dict(request.headers)}")
-
         data = request.get_json()
-        logging.info(f"Request data: {data}")
-
+        # Request bodies are only built when DEBUG logging is on
+        request_log.debug("Chat request body", lambda: {"headers": dict(request.headers), "data": data})
         user_message = data.get('message', '')
-        logging.info(f"User message: {user_message}")
 
         # Get or create session ID
         session_id = request.cookies.get('session_id')
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            logging.info(f"Created new session ID: {session_id}")
-        else:
-            logging.info(f"Using existing session ID: {session_id}")
+        new_session = not session_id
+        if new_session:
+            session_id = new_session_id()
 
         # Generate response based on message and conversation history
-        reply = generate_response(user_message, session_id)
-        logging.info(f"Generated reply: {reply}")
+        with session_turn(session_id):
+            reply = generate_response(user_message, session_id)
+            log_turn(session_id, user_message, reply)
+        request_log.debug("Chat reply", lambda: {"session_id": session_id, "user_message": user_message, "reply": reply})
 
         # Create response with session cookie
         response = jsonify({'reply': reply})
         response.set_cookie('session_id', session_id, max_age=86400)  # 24 hour expiry
 
-        # Add CORS headers explicitly
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-
-        logging.info(f"Sending response: {response.data}")
+        request_log.info("Chat request", method=request.method, path=request.path, session_id=session_id,
+                         new_session=new_session, status=200, message_chars=len(user_message),
+                         reply_chars=len(reply), duration_ms=round((time.perf_counter() - start) * 1000, 1))
         return response
     except Exception as e:
         logging.error(f"Error processing request: {e}", exc_info=True)
         error_response = jsonify({'reply': f"Sorry, I couldn't process your request. Error: {str(e)}"})
 
-        # Add CORS headers to error response too
-        error_response.headers.add('Access-Control-Allow-Origin', '*')
-        error_response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        error_response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        error_response.headers.add('Access-Control-Allow-Credentials', 'true')
-
         return error_response, 400
 
-# Add OPTIONS method handler for CORS preflight requests
-@app.route('/chat', methods=['OPTIONS'])
-def handle_options():
-    response = app.make_default_options_response()
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    return response
-
-# Clean up old conversations periodically
-@app.before_request
-def cleanup_old_sessions():
-    # This is a simple cleanup that runs before each request
-    # In a production app, you'd want to do this in a background task
-    current_time = datetime.now()
-    sessions_to_remove = []
-
-    for session_id, history in conversation_history.items():
-        if history:
-            last_message_time = datetime.fromisoformat(history[-1]['timestamp'])
-            # Remove sessions older than 24 hours
-            if (current_time - last_message_time).total_seconds() > 86400:
-                sessions_to_remove.append(session_id)
-
-    for session_id in sessions_to_remove:
-        del conversation_history[session_id]
-
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port)
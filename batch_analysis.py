@@ -0,0 +1,234 @@
+"""
+Batch analysis module that runs the message analyzers over exported chat
+transcripts offline and writes the labels of every message to a file.
+
+Usage:
+    python batch_analysis.py transcripts.jsonl labels.jsonl --workers 8
+    python batch_analysis.py transcripts.csv labels.jsonl --field text --id-field session_id
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+# The analyzer modules open their session stores on import; keep those in the
+# batch processes' own memory so an offline run never reaches live session state
+os.environ["SESSION_STORE_BACKEND"] = "memory"
+
+from deep_listening import detect_deep_thought
+from mental_health_analysis import detect_concerns
+from mood_encouragement import detect_moods
+from pattern_matcher import normalize
+from positive_responses import detect_positive_mood
+from therapist_contacts import detect_therapist_request
+from wellness_routines import detect_wellness_routine_request
+
+# Malformed rows logged one by one; the rest are only counted
+MAX_ROW_WARNINGS = 10
+
+
+def label_message(text):
+    """
+    Label a message with every analyzer, without touching any user's history.
+
+    Uses the detection halves of the analyzers, so the mental health and
+    mood labels are what analyze_text and detect_negative_mood would detect,
+    without the per-user tracking and coping strategies built on top of them.
+
+    Args:
+        text (str): The user's message
+
+    Returns:
+        dict: Labels of the message, empty values for analyzers that didn't match
+    """
+    message = normalize(text)
+    concerns = detect_concerns(message)
+    deep_thought = detect_deep_thought(message)
+    routine = detect_wellness_routine_request(message)
+    return {
+        "concerns": {concern: data["severity"] for concern, data in concerns.items()},
+        "crisis": "self_harm" in concerns or any(data["severity"] == "high" for data in concerns.values()),
+        "negative_moods": list(detect_moods(message)),
+        "positive_mood": detect_positive_mood(message)["has_positive_mood"],
+        "deep_thought": deep_thought.get("categories", []),
+        "therapist_request": detect_therapist_request(message)["is_therapist_request"],
+        "wellness_routine": routine.get("routine_type") if routine["is_routine_request"] else None
+    }
+
+
+def label_chunk(chunk):
+    """
+    Label a chunk of messages, in a worker process.
+
+    Args:
+        chunk (list): (index, id, text) tuples
+
+    Returns:
+        list: Labelled records, in the order of the chunk
+    """
+    records = []
+    for index, message_id, text in chunk:
+        record = {"index": index}
+        if message_id is not None:
+            record["id"] = message_id
+        record.update(label_message(text))
+        records.append(record)
+    return records
+
+
+def parse_row(line):
+    """Parse a JSONL line, None if it isn't a JSON object."""
+    try:
+        row = json.loads(line)
+    except ValueError:
+        return None
+    return row if isinstance(row, dict) else None
+
+
+def check_row(row, field, id_field):
+    """
+    Check that a row can be labelled.
+
+    Args:
+        row (dict or None): Parsed row, None if it couldn't be parsed
+        field (str): Field or column holding the message text
+        id_field (str, optional): Field or column copied to the labels
+
+    Returns:
+        str: Why the row is malformed, or None if it's fine
+    """
+    if row is None:
+        return "not a JSON object"
+    text = row.get(field)
+    if text is not None and not isinstance(text, str):
+        return f"{field} is a {type(text).__name__}, not a string"
+    message_id = row.get(id_field) if id_field else None
+    if message_id is not None and not isinstance(message_id, (str, int, float)):
+        return f"{id_field} is a {type(message_id).__name__}, not a string or number"
+    return None
+
+
+def read_messages(path, field="message", id_field=None, skipped=None):
+    """
+    Stream the messages of a JSONL or CSV transcript.
+
+    Rows without a text are passed over; malformed rows (lines that aren't
+    JSON objects, texts that aren't strings, ids that aren't strings or
+    numbers) are skipped with a warning, so one bad row doesn't fail a run.
+
+    Args:
+        path (str): Path of the transcript, CSV if it ends in .csv, JSONL otherwise
+        field (str): Field or column holding the message text
+        id_field (str, optional): Field or column copied to the labels to identify the message
+        skipped (collections.Counter, optional): Counts the malformed rows skipped, by reason
+
+    Yields:
+        tuple: (index, id, text) of every message with a text, index counting rows from 0
+    """
+    if skipped is None:
+        skipped = Counter()
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (parse_row(line) for line in f if line.strip())
+        for index, row in enumerate(rows):
+            reason = check_row(row, field, id_field)
+            if reason is not None:
+                if sum(skipped.values()) < MAX_ROW_WARNINGS:
+                    logging.warning(f"Skipping row {index} of {path}: {reason}")
+                skipped[reason] += 1
+                continue
+            text = row.get(field)
+            if text:
+                yield index, row.get(id_field) if id_field else None, text
+
+
+def chunked(messages, chunk_size):
+    """Group messages into lists of up to chunk_size."""
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(input_path, output_path, field="message", id_field=None, workers=None, chunk_size=2000, skipped=None):
+    """
+    Label every message of a transcript and write the labels as JSONL.
+
+    Chunks are fanned out over a process pool with a bounded number in
+    flight, so memory stays flat however long the transcript is, and their
+    labels are written in input order.
+
+    Args:
+        input_path (str): Path of the JSONL or CSV transcript
+        output_path (str): Path of the JSONL labels file
+        field (str): Field or column holding the message text
+        id_field (str, optional): Field or column copied to the labels
+        workers (int, optional): Worker processes, defaults to the CPU count; 1 runs in this process
+        chunk_size (int): Messages sent to a worker at a time
+        skipped (collections.Counter, optional): Counts the malformed rows skipped, by reason
+
+    Returns:
+        int: Number of messages labelled
+    """
+    workers = workers or os.cpu_count() or 1
+    if skipped is None:
+        skipped = Counter()
+    chunks = chunked(read_messages(input_path, field, id_field, skipped), chunk_size)
+    count = 0
+
+    with open(output_path, "w", encoding="utf-8") as out:
+        def write(records):
+            out.writelines(json.dumps(record) + "\n" for record in records)
+            return len(records)
+
+        if workers == 1:
+            for chunk in chunks:
+                count += write(label_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(label_chunk, chunk))
+                    # Keep every worker busy without reading the whole transcript ahead
+                    if len(pending) >= workers * 2:
+                        count += write(pending.popleft().result())
+                while pending:
+                    count += write(pending.popleft().result())
+
+    if skipped:
+        logging.warning(f"Skipped {sum(skipped.values())} malformed rows of {input_path}: {dict(skipped)}")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label exported chat transcripts with the message analyzers.")
+    parser.add_argument("input", help="JSONL or CSV transcript")
+    parser.add_argument("output", help="JSONL file the labels are written to")
+    parser.add_argument("--field", default="message", help="field or column holding the message text")
+    parser.add_argument("--id-field", help="field or column copied to the labels")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="messages per worker task")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    skipped = Counter()
+    count = run(args.input, args.output, args.field, args.id_field, args.workers, args.chunk_size, skipped)
+    elapsed = time.perf_counter() - start
+    print(f"Labelled {count} messages in {elapsed:.2f}s ({count / elapsed:.1f} messages/s), "
+          f"skipped {sum(skipped.values())} malformed rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Load test for the /chat endpoint of a running or freshly started backend.
+
+Each client thread keeps one keep-alive connection and one session cookie,
+like a browser tab, and sends chat messages back to back for --duration
+seconds. Requests per second, latency percentiles and errors are reported.
+
+With --backend, the backend is started with serve.py first; the llama_api
+backend is pointed at the local mock inference endpoint.
+
+Usage:
+    python benchmarks/chat_load_test.py --backend app --clients 16 --duration 10
+    python benchmarks/chat_load_test.py --url http://127.0.0.1:5000/chat
+"""
+
+import argparse
+import itertools
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_inference_server import start_mock_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGES = [
+    "Hello there",
+    "I've been feeling really anxious about my exams",
+    "Can you suggest a morning routine?",
+    "I feel sad and lonely lately",
+    "Recommend me a song to cheer up",
+    "How do I find a therapist near me?",
+    "Thanks, that helps a lot",
+]
+
+
+def percentile(latencies, p):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The backend exited with code {process.returncode}")
+        try:
+            requests.post(url, json={"message": "Hello"}, timeout=5)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"The backend didn't answer on {url} within {timeout}s")
+
+
+def start_backend(args):
+    env = dict(os.environ, SESSION_LOG_DIR="")
+    if args.backend == "llama_api":
+        env["LLAMA_API_URL"] = start_mock_server(latency=args.mock_latency)[1]
+        env.setdefault("HUGGINGFACE_API_KEY", "load-test")
+    command = [sys.executable, os.path.join(ROOT, "serve.py"), args.backend, "--bind", f"127.0.0.1:{args.port}"]
+    if args.workers:
+        command += ["--workers", str(args.workers)]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    # The backend logs every turn, which would bury the results
+    output = None if args.show_logs else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=output, stderr=output)
+
+
+def client(url, stop, latencies, errors, index):
+    session = requests.Session()
+    # A session cookie per client, so every client has its own conversation
+    session.cookies.set("session_id", f"load-test-{index}")
+    for message in itertools.cycle(MESSAGES):
+        if stop.is_set():
+            return
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json={"message": message}, timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(1)
+
+
+def run(url, clients, duration, warm_up):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [threading.Thread(target=client, args=(url, stop, latencies, errors, i)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    # Leave the warm-up requests out of the results
+    time.sleep(warm_up)
+    latencies.clear()
+    errors.clear()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f"{clients} clients for {duration:.0f}s: {len(latencies) / duration:.1f} req/s, {len(errors)} errors")
+    if latencies:
+        print(f"latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="/chat URL of a running backend")
+    parser.add_argument("--backend", choices=("app", "gpti", "llama_api"), help="backend to start with serve.py")
+    parser.add_argument("--port", type=int, default=5055, help="port for the started backend")
+    parser.add_argument("--workers", type=int, help="workers for the started backend")
+    parser.add_argument("--threads", type=int, help="threads per worker for the started backend")
+    parser.add_argument("--mock-latency", type=float, default=0.2, help="mock inference latency for llama_api")
+    parser.add_argument("--show-logs", action="store_true", help="show the started backend's logs")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warm-up", type=float, default=2)
+    args = parser.parse_args()
+    if not args.url and not args.backend:
+        parser.error("pass --url or --backend")
+
+    process = None
+    url = args.url
+    if args.backend:
+        process = start_backend(args)
+        url = f"http://127.0.0.1:{args.port}/chat"
+    try:
+        if process is not None:
+            wait_until_up(url, process)
+        run(url, args.clients, args.duration, args.warm_up)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
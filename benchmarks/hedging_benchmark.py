@@ -0,0 +1,66 @@
+"""
+Tail latency benchmark for hedged inference requests against the local mock endpoint.
+
+The mock answers most requests after --latency seconds and a --tail-rate
+share of them after --tail-latency seconds. The same workload is sent from
+several threads once without hedging and once with it, and the latency
+percentiles and the share of hedged requests are reported.
+
+Usage:
+    python benchmarks/hedging_benchmark.py --requests 400 --tail-rate 0.03
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_inference_server import start_mock_server
+from inference_client import HedgePolicy, InferenceClient
+
+
+def percentile(latencies, p):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def run(label, client, total, threads):
+    def timed(i):
+        start = time.perf_counter()
+        client.generate(f"unique message {i}")
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(timed, range(total)))
+    print(f"{label:>10}: p50 {percentile(latencies, 0.5) * 1000:7.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:7.1f} ms, p99 {percentile(latencies, 0.99) * 1000:7.1f} ms, "
+          f"max {max(latencies) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="usual mock latency in seconds")
+    parser.add_argument("--tail-rate", type=float, default=0.03, help="share of slow requests")
+    parser.add_argument("--tail-latency", type=float, default=1.0, help="latency of slow requests in seconds")
+    parser.add_argument("--percentile", type=float, default=0.9, help="latency percentile before hedging")
+    parser.add_argument("--budget", type=float, default=0.1, help="largest share of hedged requests")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(latency=args.latency, tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+
+    run("unhedged", InferenceClient(api_url=url, pool_size=args.threads), args.requests, args.threads)
+
+    hedge = HedgePolicy(percentile=args.percentile, budget=args.budget)
+    run("hedged", InferenceClient(api_url=url, pool_size=args.threads, hedge=hedge), args.requests, args.threads)
+    print(f"hedge stats: {hedge.stats}, hedge rate {hedge.stats['hedged'] / hedge.stats['requests']:.1%}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Throughput benchmark for the inference gateway against the local mock endpoint.
+
+Sends the same workload from many threads directly through the
+InferenceClient, through the InferenceGateway and through the gateway with
+micro-batching, and reports requests per second, upstream calls, coalesced
+requests and the batch fill rate and queueing delay.
+
+Usage:
+    python benchmarks/inference_gateway_benchmark.py --threads 32 --requests 20 --batch-size 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_inference_server import start_mock_server
+from inference_client import InferenceClient
+from inference_gateway import InferenceGateway
+
+# Short messages repeat a lot in real traffic, so most prompts come from a small set
+COMMON_MESSAGES = ["hi", "hello", "I'm sad", "I feel anxious", "thanks", "help"]
+
+
+def build_workload(total, seed=0):
+    rng = random.Random(seed)
+    return [
+        rng.choice(COMMON_MESSAGES) if rng.random() < 0.7 else f"unique message {i}"
+        for i in range(total)
+    ]
+
+
+def run(label, generate, workload, threads, server):
+    served_before = server.requests_served
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(generate, workload))
+    elapsed = time.perf_counter() - start
+    upstream = server.requests_served - served_before
+    print(f"{label:>8}: {len(workload) / elapsed:8.1f} req/s, {upstream} upstream calls, {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20, help="requests per thread")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock endpoint latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="gateway concurrency cap")
+    parser.add_argument("--batch-size", type=int, default=8, help="most prompts per batch")
+    parser.add_argument("--batch-window", type=float, default=0.02, help="batching window in seconds")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(latency=args.latency)
+    workload = build_workload(args.threads * args.requests)
+    client = InferenceClient(api_url=url, pool_size=args.threads)
+
+    run("direct", lambda message: client.generate(message), workload, args.threads, server)
+
+    gateway = InferenceGateway(client, max_concurrency=args.concurrency, deadline=60)
+    run("gateway", lambda message: gateway.generate(message), workload, args.threads, server)
+    print(f"gateway stats: {gateway.stats}")
+    gateway.close()
+
+    batching = InferenceGateway(client, max_concurrency=args.concurrency, deadline=60,
+                                max_batch_size=args.batch_size, batch_window=args.batch_window)
+    run("batched", lambda message: batching.generate(message), workload, args.threads, server)
+    stats = batching.batcher.stats
+    print(f"batched stats: {batching.stats}, {stats['batches']} batches, fill rate {stats['fill_rate']:.0%}, "
+          f"mean queueing delay {stats['queue_delay'] / max(stats['prompts'], 1) * 1000:.1f} ms, "
+          f"max {stats['max_queue_delay'] * 1000:.1f} ms")
+
+    batching.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
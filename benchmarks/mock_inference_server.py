@@ -0,0 +1,128 @@
+"""
+Local mock of the HuggingFace text-generation endpoint for benchmarks.
+
+Answers every POST with a canned completion after a configurable delay, or
+with one completion per prompt when "inputs" is a list of prompts. A share of
+the requests can be made much slower, to reproduce a latency tail.
+Requests with "stream": true get the completion as server-sent token events
+instead, one word per event, spreading the delay across the tokens. The first
+requests can be answered with given error statuses, to exercise retries.
+
+Usage:
+    python benchmarks/mock_inference_server.py --port 8081 --latency 0.2
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+MOCK_REPLY = "This is a mock reply."
+
+
+class MockInferenceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.requests_served += 1
+        if self.server.failures:
+            self.send_failure(self.server.failures.popleft())
+            return
+        if body.get("stream"):
+            self.stream_tokens(MOCK_REPLY)
+            return
+        slow = random.random() < self.server.tail_rate
+        time.sleep(self.server.tail_latency if slow else self.server.latency)
+
+        prompt = body.get("inputs", "")
+        if isinstance(prompt, list):
+            # A batch costs about as much as a single prompt, like on a GPU
+            self.server.batches_served += 1
+            self.server.prompts_served += len(prompt)
+            data = json.dumps([[{"generated_text": f"{p} {MOCK_REPLY}"}] for p in prompt]).encode()
+        else:
+            self.server.prompts_served += 1
+            data = json.dumps([{"generated_text": f"{prompt} {MOCK_REPLY}"}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_failure(self, status):
+        data = json.dumps({"error": f"Mock failure {status}"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream_tokens(self, text):
+        words = text.split(" ")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(self.server.latency / len(words))
+            event = {
+                "token": {"id": i, "text": word if i == 0 else f" {word}", "special": False},
+                "generated_text": text if i == len(words) - 1 else None
+            }
+            self.write_chunk(f"data:{json.dumps(event)}\n\n".encode())
+        self.write_chunk(b"")
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(port=0, latency=0.2, tail_rate=0.0, tail_latency=2.0, failures=()):
+    """
+    Start the mock endpoint on a background thread.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free port
+        latency (float): Seconds to wait before answering
+        tail_rate (float): Share of requests answered after tail_latency instead
+        tail_latency (float): Seconds to wait before answering a slow request
+        failures (iterable): Status codes the first requests are answered with, in order
+
+    Returns:
+        tuple: (server, endpoint URL)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockInferenceHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.tail_rate = tail_rate
+    server.tail_latency = tail_latency
+    server.failures = deque(failures)
+    server.requests_served = 0
+    server.batches_served = 0
+    server.prompts_served = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server, url = start_mock_server(args.port, args.latency)
+    logging.info(f"Mock inference endpoint at {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
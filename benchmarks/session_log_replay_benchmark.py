@@ -0,0 +1,75 @@
+"""
+Write and replay benchmark for the session log.
+
+Logs chat turns from many sessions into a temporary directory through the
+SessionLog, then times how long replay takes to rebuild the session stores
+from the segments, and reports turns and megabytes per second.
+
+Usage:
+    python benchmarks/session_log_replay_benchmark.py --sessions 2000 --turns 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_history import ChatHistory
+from session_log import SessionLog, replay, segment_paths
+from session_store import get_session_store
+
+MESSAGES = ["hi", "I'm sad", "I feel anxious about work", "thanks for listening", "can you help me sleep better?"]
+
+
+def write_log(directory, sessions, turns, segment_bytes, seed=0):
+    rng = random.Random(seed)
+    histories = {f"session-{i}": ChatHistory(10, system={"role": "system", "content": "You are a helpful assistant."})
+                 for i in range(sessions)}
+    log = SessionLog(directory, segment_bytes=segment_bytes)
+
+    start = time.perf_counter()
+    for _ in range(turns):
+        for session_id, history in histories.items():
+            message = rng.choice(MESSAGES)
+            reply = f"Reply to {message}"
+            history.append({"role": "user", "content": message})
+            history.append({"role": "assistant", "content": reply})
+            log.append(session_id, {
+                "session_id": session_id,
+                "message": message,
+                "reply": reply
+            }, {"benchmark.conversation_history": history, "benchmark.moods": {"mood": "calm"}})
+    log.close()
+    elapsed = time.perf_counter() - start
+
+    total = sessions * turns
+    print(f"  write: {total / elapsed:10.1f} turns/s, {log.stats['commits']} commits, "
+          f"{log.stats['bytes'] / 1e6:.1f} MB in {len(segment_paths(directory))} segments")
+    return log.stats["bytes"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=20, help="turns per session")
+    parser.add_argument("--segment-bytes", type=int, default=16 * 1024 * 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        size = write_log(directory, args.sessions, args.turns, args.segment_bytes)
+
+        store = get_session_store("benchmark.conversation_history")
+        store.clear()
+        start = time.perf_counter()
+        turns, sessions = replay(directory)
+        elapsed = time.perf_counter() - start
+        print(f" replay: {turns / elapsed:10.1f} turns/s, {size / 1e6 / elapsed:.1f} MB/s, "
+              f"{sessions} sessions ({len(store)} restored) in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Throughput benchmark of the static file server against the socketserver.TCPServer
+with SimpleHTTPRequestHandler it replaced.
+
+Several client threads fetch index.html back to back for --duration seconds
+from each server: the old one, which handles one connection at a time and
+closes it after every response, and the new one with keep-alive, then with
+gzip and with revalidation by ETag as a browser would. Requests per second
+and bytes transferred per request are reported.
+
+Usage:
+    python benchmarks/static_server_benchmark.py --clients 8 --duration 5
+"""
+
+import argparse
+import http.server
+import os
+import socketserver
+import sys
+import threading
+import time
+from functools import partial
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_old_server():
+    httpd = socketserver.TCPServer(("127.0.0.1", 0), partial(QuietHandler, directory=ROOT))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def start_new_server():
+    httpd = create_server(0, ROOT, host="127.0.0.1")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def client(url, stop, counts, headers, revalidate):
+    session = requests.Session()
+    etag = None
+    while not stop.is_set():
+        request_headers = dict(headers)
+        if revalidate and etag:
+            request_headers["If-None-Match"] = etag
+        # Stream to count the bytes on the wire rather than the decoded body
+        response = session.get(url, headers=request_headers, stream=True)
+        size = len(response.raw.read(decode_content=False))
+        if response.status_code not in (200, 304):
+            counts["errors"] += 1
+            continue
+        etag = response.headers.get("ETag")
+        counts["requests"] += 1
+        counts["bytes"] += size
+
+
+def run(label, url, clients, duration, headers, revalidate=False):
+    stop = threading.Event()
+    counts = {"requests": 0, "bytes": 0, "errors": 0}
+    threads = [threading.Thread(target=client, args=(url, stop, counts, headers, revalidate)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"{label:>28}: {counts['requests'] / duration:8.1f} req/s, "
+          f"{counts['bytes'] / max(1, counts['requests']):8.0f} bytes/request, {counts['errors']} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--path", default="/index.html")
+    args = parser.parse_args()
+
+    old, new = start_old_server(), start_new_server()
+    old_url = f"http://127.0.0.1:{old.server_address[1]}{args.path}"
+    new_url = f"http://127.0.0.1:{new.server_address[1]}{args.path}"
+    identity = {"Accept-Encoding": "identity"}
+
+    run("TCPServer", old_url, args.clients, args.duration, identity)
+    run("threaded, keep-alive", new_url, args.clients, args.duration, identity)
+    run("threaded, keep-alive, gzip", new_url, args.clients, args.duration, {"Accept-Encoding": "gzip"})
+    run("threaded, keep-alive, 304s", new_url, args.clients, args.duration, {"Accept-Encoding": "gzip"}, True)
+    print(f"cache stats: {new.cache.stats}")
+
+    old.shutdown()
+    new.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Chat history module with a bounded conversation history type that keeps the
+most recent messages in a ring and an optional system message pinned in front.
+"""
+
+from collections import deque
+
+from session_store import session_record
+
+
+@session_record
+class ChatHistory:
+    """
+    Conversation history of one session.
+
+    Messages go into a deque with a maximum length, so appending is O(1) and
+    the oldest message drops out once the history is full, without copying
+    the rest. A system message is pinned in a slot of its own that never
+    drops out and counts towards the capacity. Iterating yields the system
+    message first and then the messages, oldest first, without building a
+    new list.
+    """
+
+    __slots__ = ("system", "messages")
+
+    def __init__(self, capacity=10, system=None):
+        """
+        Create a history.
+
+        Args:
+            capacity (int): Maximum number of messages kept, including the system message
+            system (dict, optional): System message pinned in front of the history
+        """
+        self.system = system
+        self.messages = deque(maxlen=max(1, capacity - (system is not None)))
+
+    @property
+    def capacity(self):
+        """Maximum number of messages kept, including the system message."""
+        return self.messages.maxlen + (self.system is not None)
+
+    def append(self, message):
+        """Add a message, dropping the oldest non-system message once the history is full."""
+        self.messages.append(message)
+
+    def __len__(self):
+        return len(self.messages) + (self.system is not None)
+
+    def __iter__(self):
+        if self.system is not None:
+            yield self.system
+        yield from self.messages
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if self.system is not None:
+            if index == 0:
+                return self.system
+            index -= 1
+        if not 0 <= index < len(self.messages):
+            raise IndexError("chat history index out of range")
+        return self.messages[index]
+
+    def to_state(self):
+        """Get the history as JSON compatible values."""
+        return [self.capacity, self.system, list(self.messages)]
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a history from to_state()."""
+        capacity, system, messages = state
+        history = cls(capacity, system)
+        history.messages.extend(messages)
+        return history
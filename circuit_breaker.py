@@ -0,0 +1,191 @@
+"""
+Circuit breaker module that stops calls to a failing or slow upstream service
+until it recovers, so callers fall back at once instead of waiting on it.
+"""
+
+import threading
+import time
+from collections import deque
+
+import requests
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# What allow() returns for a call let through as a half-open probe
+PROBE = "probe"
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling an upstream service whose circuit is open."""
+
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker over the rolling error rate and latency of an upstream service.
+
+    Every call's outcome and latency is recorded in a window of the last
+    window_size calls no older than window_seconds. While closed, the
+    circuit opens once the window holds min_requests calls and either the
+    error rate reaches error_rate or the latency percentile reaches
+    slow_seconds. While open, calls are refused for open_seconds; after
+    that the circuit is half open and lets up to probes calls through at a
+    time: a successful probe closes it, a failed or slow one opens it again.
+    Only probes decide that: calls let through before the circuit opened
+    that finish while it's half open are not counted.
+    """
+
+    def __init__(self, error_rate=0.5, slow_seconds=8.0, percentile=0.95, min_requests=10,
+                 window_size=200, window_seconds=60.0, open_seconds=30.0, probes=1):
+        """
+        Create a closed breaker.
+
+        Args:
+            error_rate (float): Share of failed calls that opens the circuit
+            slow_seconds (float): Latency percentile that opens the circuit
+            percentile (float): Latency percentile compared to slow_seconds
+            min_requests (int): Calls in the window needed before the circuit can open
+            window_size (int): Most recent calls considered
+            window_seconds (float): Age in seconds after which a call leaves the window
+            open_seconds (float): Seconds calls are refused before probing again
+            probes (int): Concurrent probe calls allowed while half open
+        """
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.percentile = percentile
+        self.min_requests = min_requests
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+        # (time, succeeded, latency) of the most recent calls
+        self._window = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        # Make room for one more call, dropping the calls that aged out on the way
+        cutoff = now - self.window_seconds
+        while self._window and (self._window[0][0] < cutoff or len(self._window) >= self.window_size):
+            _, succeeded, _ = self._window.popleft()
+            if not succeeded:
+                self._failures -= 1
+
+    def latency_percentile(self, percentile=None):
+        """
+        Get a latency percentile of the calls in the window.
+
+        Args:
+            percentile (float, optional): Percentile between 0 and 1, defaults to the breaker's
+
+        Returns:
+            float: Latency in seconds, or None if the window is empty
+        """
+        with self._lock:
+            latencies = [latency for _, _, latency in self._window]
+        if not latencies:
+            return None
+        return _percentile(latencies, self.percentile if percentile is None else percentile)
+
+    def is_open(self):
+        """
+        Check whether calls are being refused, without taking a probe slot.
+
+        Lets callers that queue before calling upstream fall back at once
+        instead of queueing behind calls to a failing service.
+
+        Returns:
+            bool: True while the circuit is open and not yet due for probing
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at < self.open_seconds:
+                self.stats["rejected"] += 1
+                return True
+            return False
+
+    def allow(self):
+        """
+        Check whether a call may go upstream now.
+
+        A call allowed while half open is a probe and must be followed by
+        record() with probe=True.
+
+        Returns:
+            bool or str: False if the call should fall back instead, PROBE for a probe, else True
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.stats["rejected"] += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probing = 0
+            if self.state == HALF_OPEN:
+                if self._probing >= self.probes:
+                    self.stats["rejected"] += 1
+                    return False
+                self._probing += 1
+                return PROBE
+            return True
+
+    def record(self, succeeded, latency, probe=False):
+        """
+        Record the outcome of a call and open or close the circuit accordingly.
+
+        Args:
+            succeeded (bool): Whether the upstream service answered successfully
+            latency (float): Seconds the call took
+            probe (bool): Whether allow() let the call through as a probe
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.stats["calls"] += 1
+            if not succeeded:
+                self.stats["failures"] += 1
+
+            if self.state == HALF_OPEN:
+                if not probe:
+                    # A call let through before the circuit opened, only the probes decide
+                    return
+                self._probing = max(0, self._probing - 1)
+                if succeeded and latency < self.slow_seconds:
+                    # Recovered: start over with an empty window
+                    self.state = CLOSED
+                    self._window.clear()
+                    self._failures = 0
+                else:
+                    self._open(now)
+                return
+            if self.state == OPEN:
+                # A call let through before the circuit opened
+                return
+
+            self._prune(now)
+            self._window.append((now, succeeded, latency))
+            if not succeeded:
+                self._failures += 1
+            if len(self._window) < self.min_requests:
+                return
+
+            if self._failures / len(self._window) >= self.error_rate:
+                self._open(now)
+                return
+            if _percentile([latency for _, _, latency in self._window], self.percentile) >= self.slow_seconds:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        self._probing = 0
+        self.stats["opened"] += 1
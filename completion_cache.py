@@ -0,0 +1,167 @@
+"""
+Completion cache module that keeps recent Llama completions in memory, keyed
+by a hash of the normalized prompt and the generation parameters.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+
+class CompletionCache:
+    """
+    LRU cache of completions with a TTL and a byte budget.
+
+    Each key can hold several sampled completions. Until a key has
+    samples_per_key completions, lookups miss so a new sample is fetched;
+    after that, lookups rotate through the stored samples so repeated
+    messages don't always get the same reply.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, ttl=3600, samples_per_key=3):
+        """
+        Create a cache.
+
+        Args:
+            max_bytes (int): Budget for the stored completions in bytes, 0 disables caching
+            ttl (float): Seconds a key stays valid after its first completion
+            samples_per_key (int): Number of completions kept and rotated per key
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.samples_per_key = max(1, samples_per_key)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.size = 0
+
+        # key -> [created, completions, next sample, size in bytes, sources of the completions]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt, parameters):
+        """
+        Hash a prompt and its generation parameters.
+
+        Args:
+            prompt (str): The formatted prompt
+            parameters (dict): Generation parameters such as max_new_tokens, temperature, top_p
+
+        Returns:
+            str: The cache key
+        """
+        normalized = " ".join(prompt.lower().split())
+        params = ",".join(f"{name}={parameters[name]}" for name in sorted(parameters))
+        return hashlib.sha256(f"{normalized}\x00{params}".encode("utf-8")).hexdigest()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.size -= entry[3]
+
+    def get(self, prompt, parameters):
+        """
+        Look up a completion.
+
+        Args:
+            prompt (str): The formatted prompt
+            parameters (dict): Generation parameters
+
+        Returns:
+            str: A cached completion, or None on a miss
+        """
+        if self.max_bytes <= 0:
+            return None
+
+        key = self.make_key(prompt, parameters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None or len(entry[1]) < self.samples_per_key:
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            completion = entry[1][entry[2]]
+            entry[2] = (entry[2] + 1) % len(entry[1])
+            self.stats["hits"] += 1
+            return completion
+
+    def put(self, prompt, parameters, completion, source=None):
+        """
+        Store a completion, evicting least recently used keys over the byte budget.
+
+        Every caller sharing a coalesced upstream request puts the same
+        completion, and copies of it would crowd out the different samples
+        the key rotates, so callers pass the response they parsed it from
+        and only the first completion from a response is stored. Equal
+        completions from different responses are separate samples: an
+        endpoint that keeps answering the same way fills the key that way.
+
+        Args:
+            prompt (str): The formatted prompt
+            parameters (dict): Generation parameters
+            completion (str): The completion to store
+            source (object, optional): Response the completion was parsed from
+        """
+        if self.max_bytes <= 0:
+            return
+
+        key = self.make_key(prompt, parameters)
+        completion_size = len(completion.encode("utf-8"))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [time.monotonic(), [], 0, len(key), weakref.WeakSet()]
+                self._entries[key] = entry
+                self.size += len(key)
+            if len(entry[1]) >= self.samples_per_key:
+                return
+            if source is not None:
+                if source in entry[4]:
+                    return
+                entry[4].add(source)
+            entry[1].append(completion)
+            entry[3] += completion_size
+            self.size += completion_size
+            self._entries.move_to_end(key)
+
+            while self.size > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        """Remove every cached completion."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    """
+    Get the shared completion cache, creating it from the environment on first use.
+
+    Environment variables:
+        COMPLETION_CACHE_MAX_BYTES: Byte budget, 0 disables the cache (default 8 MB)
+        COMPLETION_CACHE_TTL: Seconds a cached prompt stays valid (default 3600)
+        COMPLETION_CACHE_SAMPLES: Completions kept and rotated per prompt (default 3)
+
+    Returns:
+        CompletionCache: The shared cache
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompletionCache(
+                max_bytes=int(os.getenv("COMPLETION_CACHE_MAX_BYTES", 8 * 1024 * 1024)),
+                ttl=float(os.getenv("COMPLETION_CACHE_TTL", 3600)),
+                samples_per_key=int(os.getenv("COMPLETION_CACHE_SAMPLES", 3))
+            )
+        return _cache
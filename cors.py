@@ -0,0 +1,106 @@
+"""
+CORS module that answers preflight requests and adds the CORS headers to
+responses in a WSGI middleware, in front of Flask's routing.
+"""
+
+import os
+
+# Request headers and methods cross-origin pages may use
+ALLOW_HEADERS = ("Content-Type", "Authorization", "X-Requested-With")
+ALLOW_METHODS = ("GET", "POST", "OPTIONS")
+
+
+class CORSMiddleware:
+    """
+    WSGI middleware implementing CORS for a whole app.
+
+    OPTIONS requests from a browser are answered here with a 204, without
+    entering the app, and carry an Access-Control-Max-Age so browsers reuse
+    the preflight for max_age seconds. Other responses to allowed origins
+    get the CORS headers appended in one step. The header lists are built
+    once per origin and reused for every later request from it.
+    """
+
+    def __init__(self, app, origins="*", max_age=86400, max_cached_origins=1024):
+        """
+        Wrap a WSGI app.
+
+        Args:
+            app (callable): The WSGI app, e.g. a Flask app's wsgi_app
+            origins (str or iterable): Allowed origins, or "*" for any origin
+            max_age (int): Seconds browsers may cache a preflight response
+            max_cached_origins (int): Most origins whose header lists are kept
+        """
+        self.app = app
+        self.origins = origins if origins == "*" else frozenset(origins)
+        self.max_cached_origins = max_cached_origins
+        self._preflight = (
+            ("Access-Control-Allow-Methods", ", ".join(ALLOW_METHODS)),
+            ("Access-Control-Allow-Headers", ", ".join(ALLOW_HEADERS)),
+            ("Access-Control-Max-Age", str(max_age)),
+            ("Content-Length", "0")
+        )
+        # origin -> (headers for responses, headers for preflight responses)
+        self._headers = {}
+
+    def headers_for(self, origin):
+        """
+        Get the CORS headers for an origin.
+
+        Args:
+            origin (str): The request's Origin header
+
+        Returns:
+            tuple: (headers for responses, headers for preflight responses), empty for disallowed origins
+        """
+        headers = self._headers.get(origin)
+        if headers is None:
+            if self.origins != "*" and origin not in self.origins:
+                headers = ((), (("Content-Length", "0"),))
+            else:
+                # Echo the origin rather than "*", which browsers refuse for requests with credentials
+                response = (
+                    ("Access-Control-Allow-Origin", origin),
+                    ("Access-Control-Allow-Credentials", "true"),
+                    ("Vary", "Origin")
+                )
+                headers = (response, response + self._preflight)
+            if len(self._headers) < self.max_cached_origins:
+                self._headers[origin] = headers
+        return headers
+
+    def __call__(self, environ, start_response):
+        origin = environ.get("HTTP_ORIGIN")
+        if origin is None:
+            # Not a cross-origin request from a browser
+            return self.app(environ, start_response)
+
+        response_headers, preflight_headers = self.headers_for(origin)
+        if environ["REQUEST_METHOD"] == "OPTIONS":
+            start_response("204 No Content", list(preflight_headers))
+            return []
+        if not response_headers:
+            return self.app(environ, start_response)
+
+        def start_cors_response(status, headers, exc_info=None):
+            headers.extend(response_headers)
+            return start_response(status, headers, exc_info)
+
+        return self.app(environ, start_cors_response)
+
+
+def enable_cors(app):
+    """
+    Put a CORSMiddleware configured from the environment in front of a Flask app.
+
+    Environment variables:
+        CORS_ORIGINS: Comma-separated allowed origins, or * for any origin (default *)
+        CORS_MAX_AGE: Seconds browsers may cache a preflight response (default 86400)
+
+    Args:
+        app (flask.Flask): The app
+    """
+    origins = os.getenv("CORS_ORIGINS", "*").strip()
+    if origins != "*":
+        origins = [origin.strip() for origin in origins.split(",") if origin.strip()]
+    app.wsgi_app = CORSMiddleware(app.wsgi_app, origins=origins, max_age=int(os.getenv("CORS_MAX_AGE", 86400)))
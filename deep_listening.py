@@ -3,9 +3,10 @@ Deep listening module for detecting personal stories, deep thoughts, and past ex
 and providing positive, encouraging responses.
 """
 
-import re
 import random
 from datetime import datetime
+from pattern_matcher import MATCHER, normalize
+from keyword_index import KeywordIndex
 
 # Patterns to identify deep thoughts or personal stories
 DEEP_THOUGHT_PATTERNS = [
@@ -157,6 +158,12 @@ THOUGHT_CATEGORIES = {
     ]
 }
 
+# Deep thought patterns compiled once into the shared matcher
+DEEP_THOUGHT_TABLE = MATCHER.register("deep_thought", DEEP_THOUGHT_PATTERNS, word_boundary=True)
+
+# Category keywords indexed once for a single-pass scan
+THOUGHT_CATEGORY_INDEX = KeywordIndex(THOUGHT_CATEGORIES)
+
 # Encouraging responses for different categories
 ENCOURAGING_RESPONSES = {
     "past_experiences": [
@@ -290,27 +297,22 @@ def detect_deep_thought(text):
     Detect if the text contains deep thoughts or personal stories.
     
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
         
     Returns:
         dict: Detection results including category and matched patterns
     """
-    text = text.lower()
+    message = normalize(text)
     
     # Check for deep thought patterns
-    matches = []
-    for pattern in DEEP_THOUGHT_PATTERNS:
-        if re.search(r'\b' + pattern + r'\b', text):
-            matches.append(pattern)
+    matches = DEEP_THOUGHT_TABLE.matched_patterns(message.hits("deep_thought"))
     
     if not matches:
         return {"is_deep_thought": False}
     
     # Determine the category of the deep thought
-    categories = []
-    for category, keywords in THOUGHT_CATEGORIES.items():
-        if any(keyword in text for keyword in keywords):
-            categories.append(category)
+    category_hits = message.keyword_hits(THOUGHT_CATEGORY_INDEX)
+    categories = [category for category in THOUGHT_CATEGORIES if category_hits[category]]
     
     # Default to general category if no specific one is found
     if not categories:
@@ -354,7 +356,7 @@ def process_deep_thought(text):
     Process text to detect deep thoughts and generate an encouraging response.
     
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
         
     Returns:
         dict: Processing results including detection and response
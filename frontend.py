@@ -0,0 +1,147 @@
+"""
+Frontend module that lets a Flask backend serve index.html and its assets
+itself, so the page and the chat API share an origin and chat requests need
+no CORS preflight.
+
+The bundle is built once at startup: every asset is fingerprinted with a
+hash of its contents and compressed, and index.html is rewritten to refer
+to the fingerprinted URLs, which can then be cached for good.
+"""
+
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from flask import Response, request
+
+from server import etag_matches, precompress, preferred_encoding
+
+# Directory the frontend files are in
+FRONTEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Page served at / and rewritten to point at the fingerprinted assets
+FRONTEND_PAGE = "index.html"
+
+# Extensions of the files bundled as assets
+ASSET_EXTENSIONS = (".css", ".js", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".ico", ".webp", ".woff", ".woff2")
+
+# URL prefix of the fingerprinted assets
+ASSET_PREFIX = "/assets/"
+
+# Fingerprinted URLs change with their contents, so they can be cached for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class BundledAsset:
+    """A frontend file's contents, compressed copies, validators and cache policy."""
+
+    __slots__ = ("body", "content_type", "encoded", "etags", "cache_control")
+
+    def __init__(self, body, content_type, cache_control):
+        self.body = body
+        self.content_type = content_type
+        self.encoded = precompress(body, content_type)
+        tag = hashlib.sha256(body).hexdigest()[:16]
+        self.etags = {None: f'"{tag}"'}
+        self.etags.update((coding, f'"{tag}-{coding}"') for coding in self.encoded)
+        self.cache_control = cache_control
+
+
+def _content_type(name):
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if content_type.startswith("text/"):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+def build_bundle(directory=FRONTEND_DIR):
+    """
+    Fingerprint and compress the frontend files.
+
+    Args:
+        directory (str): Directory containing FRONTEND_PAGE and the assets
+
+    Returns:
+        tuple: (BundledAsset of the page, dict of fingerprinted asset name -> BundledAsset)
+    """
+    assets = {}
+    # Original name -> fingerprinted URL
+    urls = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.lower().endswith(ASSET_EXTENSIONS) or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            body = f.read()
+        stem, extension = os.path.splitext(name)
+        fingerprinted = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{extension}"
+        assets[fingerprinted] = BundledAsset(body, _content_type(name), IMMUTABLE_CACHE_CONTROL)
+        urls[name] = ASSET_PREFIX + fingerprinted
+
+    with open(os.path.join(directory, FRONTEND_PAGE), encoding="utf-8") as f:
+        page = f.read()
+    if urls:
+        # Rewrite quoted or url(...) references to the assets, relative or from the root
+        pattern = re.compile(r"""(?<=["'(])(?:\./|/)?(""" + "|".join(map(re.escape, urls)) + r""")(?=["')])""")
+        page = pattern.sub(lambda match: urls[match.group(1)], page)
+    # Tell the page to call the chat API on its own origin
+    page = page.replace("<head>", '<head>\n    <meta name="api-base" content="" />', 1)
+    # The page's URL never changes, so browsers revalidate it on every use
+    page_asset = BundledAsset(page.encode("utf-8"), _content_type(FRONTEND_PAGE), "no-cache")
+    return page_asset, assets
+
+
+def _respond(asset):
+    coding = preferred_encoding(request.headers.get("Accept-Encoding", ""), asset.encoded)
+    headers = {"ETag": asset.etags[coding], "Cache-Control": asset.cache_control}
+    if asset.encoded:
+        headers["Vary"] = "Accept-Encoding"
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None and etag_matches(if_none_match, asset.etags.values()):
+        return Response(status=304, headers=headers)
+
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(asset.encoded[coding] if coding else asset.body, headers=headers,
+                    content_type=asset.content_type)
+
+
+def register_frontend(app):
+    """
+    Serve the frontend from a Flask app, if SERVE_FRONTEND is set.
+
+    Adds / and /index.html for the page and /assets/<name> for the
+    fingerprinted assets, all answered from the bundle built here.
+
+    Environment variables:
+        SERVE_FRONTEND: Set to 1 to serve the frontend (default off)
+        FRONTEND_DIR: Directory of the frontend files (default the project directory)
+
+    Args:
+        app (flask.Flask): The backend's app
+
+    Returns:
+        bool: True if the frontend is served
+    """
+    if os.getenv("SERVE_FRONTEND", "").lower() not in ("1", "true", "yes"):
+        return False
+
+    page, assets = build_bundle(os.getenv("FRONTEND_DIR", FRONTEND_DIR))
+    logging.info(f"Serving the frontend from this process, with {len(assets)} fingerprinted assets")
+
+    def frontend_page():
+        return _respond(page)
+
+    def frontend_asset(name):
+        asset = assets.get(name)
+        if asset is None:
+            return Response("Not found", status=404)
+        return _respond(asset)
+
+    app.add_url_rule("/", "frontend_page", frontend_page)
+    app.add_url_rule(f"/{FRONTEND_PAGE}", "frontend_page_file", frontend_page)
+    app.add_url_rule(f"{ASSET_PREFIX}<path:name>", "frontend_asset", frontend_asset)
+    return True
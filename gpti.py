@@ -2,14 +2,22 @@ import logging
 from flask import Flask, jsonify, request
 import requests
 import os
-import uuid
+import time
 import random
 from datetime import datetime
-from flask_cors import CORS
 from dotenv import load_dotenv
-
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from keyword_index import KeywordIndex
+from chat_history import ChatHistory
+from session_store import get_session_store, new_session_id, session_turn
+from session_expiry import start_session_expiry
+from session_log import log_turn, start_session_log
+from request_logging import get_request_logger, start_logging
+from frontend import register_frontend
+from cors import enable_cors
+
+# Set up logging: JSON records written from a background thread, chat requests sampled
+start_logging()
+request_log = get_request_logger()
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,51 +26,70 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # For session management
 
-# Configure CORS to allow requests from any origin
-CORS(app,
-     supports_credentials=True,  # Enable CORS with credentials support
-     resources={r"/*": {"origins": "*"}},  # Allow all origins
-     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-     methods=["GET", "POST", "OPTIONS"]
-)
+# Answer CORS preflights and add the CORS headers to every response in one place, before Flask's routing
+enable_cors(app)
+
+# Serve the frontend from this process too if SERVE_FRONTEND is set, so chat requests are same-origin
+register_frontend(app)
+
+# Messages kept per conversation
+HISTORY_CAPACITY = 10
+
+# Store conversation history, bounded by the session store's caps
+app.conversation_history = get_session_store("gpti.conversation_history")
+
+# Clean up old conversations periodically, on a background thread
+start_session_expiry()
+
+# Restore the sessions from the durable session log and keep logging turns, if SESSION_LOG_DIR is set
+start_session_log()
+
+# Keyword lists for the enhanced responses, indexed once for a single-pass scan
+RESPONSE_KEYWORDS = KeywordIndex({
+    "greetings": ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'howdy', 'greetings', 'what\'s up'],
+    "feelings_negative": ['sad', 'depressed', 'unhappy', 'stress', 'anxiety', 'lonely', 'tired', 'angry', 'worried', 'overwhelmed', 'exhausted', 'frustrated', 'upset', 'down', 'miserable', 'hopeless'],
+    "feelings_positive": ['happy', 'good', 'great', 'excellent', 'amazing', 'wonderful', 'fantastic', 'joyful', 'excited', 'content', 'peaceful', 'relaxed', 'cheerful', 'delighted', 'pleased'],
+    "jokes": ['joke', 'funny', 'laugh', 'humor', 'comedy', 'amuse', 'entertain'],
+    "thanks": ['thank', 'thanks', 'appreciate', 'grateful', 'gratitude'],
+    "music": ['song', 'music', 'playlist', 'recommend', 'listen', 'tune', 'melody', 'artist', 'band', 'album', 'track'],
+    "help_requests": ['help', 'advice', 'suggestion', 'guidance', 'assist', 'support', 'tip', 'recommendation'],
+    "wellness": ['routine', 'wellness', 'mental health', 'physical health', 'daily habit', 'healthy habit', 'morning routine', 'evening routine', 'meditation', 'exercise', 'sleep', 'diet', 'nutrition'],
+    "wellness_centers": ['wellness center', 'wellness centre', 'mental health center', 'mental health clinic', 'healing center', 'holistic center', 'mindfulness center', 'meditation center', 'yoga studio', 'health spa'],
+    "therapist": ['therapist', 'psychologist', 'psychiatrist', 'counselor', 'counselling', 'therapy', 'mental health professional', 'consultation', 'consultancy']
+})
 
 # Function to generate responses (using enhanced fallback responses)
 def get_chatgpt_response(user_message):
-    # Store conversation history in a dictionary with session IDs as keys
-    conversation_history = getattr(app, 'conversation_history', {})
+    # Conversation history is kept in a session store with session IDs as keys
+    conversation_history = app.conversation_history
 
     # Get or create session ID from request
     session_id = request.cookies.get('session_id')
     if not session_id:
-        session_id = str(uuid.uuid4())
+        session_id = new_session_id()
 
     # Get or initialize conversation history for this session
-    if session_id not in conversation_history:
-        conversation_history[session_id] = []
+    history = conversation_history.get(session_id)
+    if history is None:
+        history = ChatHistory(HISTORY_CAPACITY)
 
-    # Add the new user message to history
-    conversation_history[session_id].append({
+    # Add the new user message to history, the oldest message drops out past HISTORY_CAPACITY
+    history.append({
         'role': 'user',
         'content': user_message,
         'timestamp': datetime.now().isoformat()
     })
 
-    # Limit history to last 10 messages
-    if len(conversation_history[session_id]) > 10:
-        conversation_history[session_id] = conversation_history[session_id][-10:]
-
-    # Save the conversation history back to the app
-    app.conversation_history = conversation_history
-
     # Generate a response using our enhanced rule-based system
     reply = enhanced_response(user_message, session_id)
 
     # Add the bot's reply to the conversation history
-    conversation_history[session_id].append({
+    history.append({
         'role': 'assistant',
         'content': reply,
         'timestamp': datetime.now().isoformat()
     })
+    conversation_history[session_id] = history
 
     return reply
 
@@ -70,20 +97,11 @@ def get_chatgpt_response(user_message):
 def enhanced_response(message, session_id=None):
     message = message.lower()
 
-    # Expanded patterns for better response matching
-    greetings = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening', 'howdy', 'greetings', 'what\'s up']
-    feelings_negative = ['sad', 'depressed', 'unhappy', 'stress', 'anxiety', 'lonely', 'tired', 'angry', 'worried', 'overwhelmed', 'exhausted', 'frustrated', 'upset', 'down', 'miserable', 'hopeless']
-    feelings_positive = ['happy', 'good', 'great', 'excellent', 'amazing', 'wonderful', 'fantastic', 'joyful', 'excited', 'content', 'peaceful', 'relaxed', 'cheerful', 'delighted', 'pleased']
-    jokes = ['joke', 'funny', 'laugh', 'humor', 'comedy', 'amuse', 'entertain']
-    thanks = ['thank', 'thanks', 'appreciate', 'grateful', 'gratitude']
-    music = ['song', 'music', 'playlist', 'recommend', 'listen', 'tune', 'melody', 'artist', 'band', 'album', 'track']
-    help_requests = ['help', 'advice', 'suggestion', 'guidance', 'assist', 'support', 'tip', 'recommendation']
-    wellness = ['routine', 'wellness', 'mental health', 'physical health', 'daily habit', 'healthy habit', 'morning routine', 'evening routine', 'meditation', 'exercise', 'sleep', 'diet', 'nutrition']
-    wellness_centers = ['wellness center', 'wellness centre', 'mental health center', 'mental health clinic', 'healing center', 'holistic center', 'mindfulness center', 'meditation center', 'yoga studio', 'health spa']
-    therapist = ['therapist', 'psychologist', 'psychiatrist', 'counselor', 'counselling', 'therapy', 'mental health professional', 'consultation', 'consultancy']
+    # Find the hits of every keyword list in one scan
+    hits = RESPONSE_KEYWORDS.scan(message)
 
     # Check for song recommendations
-    if any(word in message for word in music):
+    if hits["music"]:
         return random.choice([
             "I'd love to suggest some songs! For a happy mood, try 'Happy' by Pharrell Williams or 'Can't Stop the Feeling' by Justin Timberlake. For a more relaxed vibe, 'Weightless' by Marconi Union is wonderful.",
             "Music can be so therapeutic! If you're feeling down, 'Fix You' by Coldplay might resonate. For an energy boost, 'Don't Stop Me Now' by Queen is perfect!",
@@ -92,7 +110,7 @@ def enhanced_response(message, session_id=None):
         ])
 
     # Check for wellness center requests first (more specific than general wellness)
-    if any(center in message for center in wellness_centers):
+    if hits["wellness_centers"]:
         return """Here are some recommended wellness centers that provide mental health services:
 
 1. **Mindful Healing Center**
@@ -126,7 +144,7 @@ def enhanced_response(message, session_id=None):
    - Website: www.tranquilmindwellness.com"""
 
     # Check for wellness routine requests
-    if any(word in message for word in wellness):
+    if hits["wellness"]:
         return random.choice([
             "Here's a simple morning wellness routine: 1) Start with 5 minutes of deep breathing or meditation. 2) Drink a glass of water. 3) Stretch for 5-10 minutes. 4) Write down 3 things you're grateful for. 5) Eat a nutritious breakfast.",
             "For mental wellness, try this daily routine: 1) Practice mindfulness for 10 minutes. 2) Take short breaks throughout your day. 3) Go for a 15-minute walk outdoors. 4) Connect with a loved one. 5) Before bed, reflect on 3 positive moments from your day.",
@@ -135,11 +153,11 @@ def enhanced_response(message, session_id=None):
         ])
 
     # Check for therapist recommendations
-    if any(word in message for word in therapist):
+    if hits["therapist"]:
         return "If you're looking for professional mental health support, here are some options: 1) Dr. Jennifer Reynolds, Licensed Clinical Psychologist (212-555-7890), specializing in anxiety and depression. 2) Sophia Rodriguez, LMFT (310-555-9876), focusing on relationship issues. 3) David Kim, LCSW (206-555-7654), specializing in trauma recovery. You can also use online directories like Psychology Today or BetterHelp to find therapists in your area."
 
     # Check for greetings
-    if any(word in message for word in greetings):
+    if hits["greetings"]:
         return random.choice([
             "Hello! I'm happiRay, your mental health companion. How are you feeling today?",
             "Hi there! I'm here to chat and support you. What's on your mind?",
@@ -148,7 +166,7 @@ def enhanced_response(message, session_id=None):
         ])
 
     # Check for positive feelings
-    if any(word in message for word in feelings_positive):
+    if hits["feelings_positive"]:
         return random.choice([
             "That's wonderful to hear! It's so important to acknowledge and celebrate positive feelings. What's contributing to your good mood?",
             "I'm so happy to hear you're feeling good! Those positive emotions are worth savoring. Would you like to share what's going well?",
@@ -157,7 +175,7 @@ def enhanced_response(message, session_id=None):
         ])
 
     # Check for negative feelings
-    if any(word in message for word in feelings_negative):
+    if hits["feelings_negative"]:
         return random.choice([
             "I'm sorry to hear you're feeling that way. Your feelings are valid, and it takes courage to express them. Would you like to talk more about what's going on?",
             "It sounds like you're going through a difficult time. Remember that it's okay to not be okay sometimes. Is there anything specific that's troubling you?",
@@ -166,7 +184,7 @@ def enhanced_response(message, session_id=None):
         ])
 
     # Check for jokes
-    if any(word in message for word in jokes):
+    if hits["jokes"]:
         return random.choice([
             "Why don't scientists trust atoms? Because they make up everything!",
             "What did the ocean say to the beach? Nothing, it just waved!",
@@ -178,7 +196,7 @@ def enhanced_response(message, session_id=None):
         ])
 
     # Check for thanks
-    if any(word in message for word in thanks):
+    if hits["thanks"]:
         return random.choice([
             "You're very welcome! I'm here whenever you need to talk.",
             "It's my pleasure to be here for you. How else can I help?",
@@ -187,7 +205,7 @@ def enhanced_response(message, session_id=None):
         ])
 
     # Check for help requests
-    if any(word in message for word in help_requests):
+    if hits["help_requests"]:
         return random.choice([
             "I'm here to help! I can suggest coping strategies, recommend songs to match your mood, provide wellness routines, or just be someone to talk to. What would be most helpful right now?",
             "I'd be happy to help. I can listen, offer support, suggest self-care activities, or provide information about mental wellness. What kind of support are you looking for?",
@@ -208,67 +226,42 @@ def enhanced_response(message, session_id=None):
 
 @app.route('/chat', methods=['POST'])
 def chat():
+    start = time.perf_counter()
     try:
-        # Log request details for debugging
-        logging.info(f"Received request: {request.method} {request.path}")
-        logging.info(f"Request headers: {dict(request.headers)}")
-
         data = request.get_json()
-        logging.info(f"Request data: {data}")
-
+        # Request bodies are only built when DEBUG logging is on
+        request_log.debug("Chat request body", lambda: {"headers": dict(request.headers), "data": data})
         user_message = data.get('message', '').strip()
-        logging.info(f"User message: {user_message}")
 
         if not user_message:
             return jsonify({'reply': "Please provide a message."}), 400
 
         # Get or create session ID
         session_id = request.cookies.get('session_id')
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            logging.info(f"Created new session ID: {session_id}")
-        else:
-            logging.info(f"Using existing session ID: {session_id}")
+        new_session = not session_id
+        if new_session:
+            session_id = new_session_id()
 
         # Call the OpenAI API
-        reply = get_chatgpt_response(user_message)
-        logging.info(f"Generated reply: {reply}")
+        with session_turn(session_id):
+            reply = get_chatgpt_response(user_message)
+            log_turn(session_id, user_message, reply)
+        request_log.debug("Chat reply", lambda: {"session_id": session_id, "user_message": user_message, "reply": reply})
 
         # Create response with session cookie
         response = jsonify({'reply': reply})
         response.set_cookie('session_id', session_id, max_age=86400)  # 24 hour expiry
 
-        # Add CORS headers explicitly
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-
-        logging.info(f"Sending response: {response.data}")
+        request_log.info("Chat request", method=request.method, path=request.path, session_id=session_id,
+                         new_session=new_session, status=200, message_chars=len(user_message),
+                         reply_chars=len(reply), duration_ms=round((time.perf_counter() - start) * 1000, 1))
         return response
     except Exception as e:
         logging.error(f"Error processing request: {e}", exc_info=True)
         error_response = jsonify({'reply': f"Sorry, I couldn't process your request. Error: {str(e)}"})
 
-        # Add CORS headers to error response too
-        error_response.headers.add('Access-Control-Allow-Origin', '*')
-        error_response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        error_response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        error_response.headers.add('Access-Control-Allow-Credentials', 'true')
-
         return error_response, 400
 
-# Add OPTIONS method handler for CORS preflight requests
-@app.route('/chat', methods=['OPTIONS'])
-def handle_options():
-    response = app.make_default_options_response()
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    return response
-
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)  # Set up logging
     app.run(host="0.0.0.0", port=5000)  # Run the app
 
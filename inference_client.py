@@ -0,0 +1,413 @@
+"""
+Inference client module for calling the HuggingFace text-generation API over
+a shared, keep-alive HTTP session with bounded timeouts and retries.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import PROBE, CircuitBreaker, CircuitOpenError
+
+# Default Llama model endpoint on the HuggingFace Inference API
+DEFAULT_API_URL = "https://api-inference.huggingface.co/models/meta-llama/Llama-2-7b-chat-hf"
+
+# Status codes worth retrying: rate limiting and transient server errors
+# (the Inference API answers 503 while a model is loading)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class HedgePolicy:
+    """
+    When to hedge a request, and how many hedges are allowed.
+
+    A request that hasn't returned after the given percentile of recent
+    request latencies gets a second, identical request. Hedges are paid
+    for from a token bucket that every request adds budget tokens to, so at
+    most that share of requests is hedged, with short bursts up to burst.
+    """
+
+    def __init__(self, percentile=0.95, budget=0.1, burst=10, min_samples=20, window=200):
+        """
+        Create a policy.
+
+        Args:
+            percentile (float): Latency percentile after which a request is hedged
+            budget (float): Largest share of requests that may be hedged
+            burst (float): Most hedges that may be sent back to back
+            min_samples (int): Latencies recorded before hedging starts
+            window (int): Most recent latencies the percentile is taken over
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+
+        self._latencies = deque(maxlen=window)
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Count a new request and get how long to wait before hedging it.
+
+        Returns:
+            float: Seconds to wait, or None until enough latencies were recorded
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            self._tokens = min(self.burst, self._tokens + self.budget)
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(self.percentile * len(latencies)))]
+
+    def acquire(self):
+        """Take a token for a hedge, returning False if the budget is spent."""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.stats["hedged"] += 1
+            return True
+
+    def record(self, latency):
+        """Record the latency of a completed request."""
+        with self._lock:
+            self._latencies.append(latency)
+
+    def record_win(self):
+        """Count a hedge whose response arrived before the original request's."""
+        with self._lock:
+            self.stats["hedge_wins"] += 1
+
+
+def _close_response(future):
+    # The body of a non-streamed response has already been read, and its connection is back in the
+    # pool; closing it is only housekeeping, so the losing response holds nothing once it's done
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class InferenceClient:
+    """
+    HTTP client for a text-generation endpoint.
+
+    Connections are pooled and kept alive in one requests.Session, so a chat
+    turn reuses an open TCP/TLS connection instead of opening a new one.
+    Every request has a connect and read timeout, and failed attempts are
+    retried a bounded number of times with exponential backoff and jitter.
+    With a circuit breaker, every attempt is recorded in it, and while its
+    circuit is open requests fail at once with CircuitOpenError instead of
+    waiting on the endpoint. With a hedge policy, a completion request that
+    is slower than usual is sent a second time and the first response wins.
+    """
+
+    def __init__(self, api_url=DEFAULT_API_URL, api_key=None, pool_size=16,
+                 connect_timeout=3.05, read_timeout=10.0, max_retries=2,
+                 backoff=0.25, max_backoff=2.0, breaker=None, hedge=None):
+        """
+        Create a client.
+
+        Args:
+            api_url (str): Text-generation endpoint URL
+            api_key (str, optional): Bearer token for the endpoint
+            pool_size (int): Maximum number of pooled connections, usually the
+                number of worker threads that may call the endpoint at once
+            connect_timeout (float): Seconds to wait for a connection
+            read_timeout (float): Seconds to wait for the response
+            max_retries (int): Retries after the first attempt
+            backoff (float): Base delay in seconds for the first retry
+            max_backoff (float): Upper bound for a single retry delay
+            breaker (CircuitBreaker, optional): Breaker guarding the endpoint
+            hedge (HedgePolicy, optional): Policy for hedging completion requests
+        """
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker
+        self.hedge = hedge
+
+        # A hedged request runs both of its attempts on this executor, so every caller may need two connections
+        self._hedge_executor = None
+        if hedge is not None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix="inference-hedge")
+            pool_size *= 2
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _retry_delay(self, attempt):
+        """Full-jitter exponential backoff for the given retry attempt."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def post(self, payload, timeout=None, stream=False):
+        """
+        Send a JSON payload to the endpoint, retrying transient failures.
+
+        Args:
+            payload (dict): JSON request body
+            timeout (float or tuple, optional): Overrides the client timeouts
+            stream (bool): Return as soon as the headers arrive and leave the body unread
+
+        Returns:
+            requests.Response: The last response received
+
+        Raises:
+            CircuitOpenError: If the circuit breaker refused the request
+            requests.RequestException: If every attempt failed without a response
+        """
+        timeout = timeout if timeout is not None else self.timeout
+
+        for attempt in range(self.max_retries + 1):
+            permit = self.breaker.allow() if self.breaker is not None else True
+            if not permit:
+                raise CircuitOpenError(f"Circuit open for {self.api_url}")
+            probe = permit == PROBE
+            start = time.monotonic()
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=timeout, stream=stream)
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record(False, time.monotonic() - start, probe)
+                if not isinstance(e, (requests.ConnectionError, requests.Timeout)) or attempt == self.max_retries:
+                    raise
+                logging.warning(f"Inference request failed ({e}), retrying")
+            else:
+                if self.breaker is not None:
+                    self.breaker.record(response.status_code not in RETRY_STATUS_CODES, time.monotonic() - start,
+                                        probe)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                logging.warning(f"Inference request returned {response.status_code}, retrying")
+                response.close()
+            time.sleep(self._retry_delay(attempt))
+
+    def generate(self, prompt, max_new_tokens=150, temperature=0.7, top_p=0.9, do_sample=True, timeout=None):
+        """
+        Request a completion for a prompt.
+
+        Args:
+            prompt (str): The formatted prompt
+            max_new_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature
+            top_p (float): Nucleus sampling probability
+            do_sample (bool): Whether to sample
+            timeout (float or tuple, optional): Overrides the client timeouts
+
+        Returns:
+            requests.Response: The endpoint's response
+        """
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_new_tokens,
+                "temperature": temperature,
+                "top_p": top_p,
+                "do_sample": do_sample
+            }
+        }
+        if self.hedge is not None:
+            return self._hedged_post(payload, timeout)
+        return self.post(payload, timeout=timeout)
+
+    def _hedged_post(self, payload, timeout):
+        """
+        Post a payload, sending it again if the first attempt is slower than the hedge percentile.
+
+        The attempt that loses is cancelled if it hasn't started yet, so it
+        never takes a worker or a connection; one already running is left to
+        finish and its response closed as soon as it arrives.
+
+        Returns:
+            requests.Response: Whichever response arrived first
+
+        Raises:
+            requests.RequestException: If both attempts failed
+        """
+        def submit():
+            started = time.monotonic()
+
+            # Every completed attempt, winner or not, is a sample of the endpoint's latency
+            def record(future):
+                if future.exception() is None:
+                    self.hedge.record(time.monotonic() - started)
+
+            future = self._hedge_executor.submit(self.post, payload, timeout)
+            future.add_done_callback(record)
+            return future
+
+        delay = self.hedge.start()
+        primary = submit()
+        if delay is None or wait([primary], timeout=delay).done or not self.hedge.acquire():
+            return primary.result()
+
+        hedged = submit()
+        errors = []
+        for future in as_completed([primary, hedged]):
+            try:
+                response = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            loser = primary if future is hedged else hedged
+            if not loser.cancel():
+                loser.add_done_callback(_close_response)
+            if future is hedged:
+                self.hedge.record_win()
+            return response
+        raise errors[0]
+
+    def generate_batch(self, prompts, max_new_tokens=150, temperature=0.7, top_p=0.9, do_sample=True,
+                       timeout=None):
+        """
+        Request completions for several prompts in one request.
+
+        Text-generation endpoints accept a list of inputs sharing the same
+        parameters and answer with one result per input, in order. Batches
+        are never hedged: a batch is much slower than a single prompt, so it
+        would always look slow, and a hedge would repeat the work of every
+        prompt in it.
+
+        Args:
+            prompts (list): The formatted prompts
+            max_new_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature
+            top_p (float): Nucleus sampling probability
+            do_sample (bool): Whether to sample
+            timeout (float or tuple, optional): Overrides the client timeouts
+
+        Returns:
+            requests.Response: The endpoint's response
+        """
+        payload = {
+            "inputs": list(prompts),
+            "parameters": {
+                "max_new_tokens": max_new_tokens,
+                "temperature": temperature,
+                "top_p": top_p,
+                "do_sample": do_sample
+            }
+        }
+        return self.post(payload, timeout=timeout)
+
+    def stream(self, prompt, max_new_tokens=150, temperature=0.7, top_p=0.9, do_sample=True, timeout=None):
+        """
+        Request a streamed completion and yield the text of each token as it arrives.
+
+        The endpoint answers with server-sent events in the text-generation
+        format, one `data: {"token": {...}}` line per token. Only the
+        connection is retried; once tokens are flowing a failure is raised
+        to the caller, since the tokens already yielded can't be taken back.
+
+        Args:
+            prompt (str): The formatted prompt
+            max_new_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature
+            top_p (float): Nucleus sampling probability
+            do_sample (bool): Whether to sample
+            timeout (float or tuple, optional): Overrides the client timeouts,
+                the read timeout applies between tokens
+
+        Yields:
+            str: Generated text of the next token
+
+        Raises:
+            requests.RequestException: If the request failed or the endpoint answered an error
+        """
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_new_tokens,
+                "temperature": temperature,
+                "top_p": top_p,
+                "do_sample": do_sample
+            },
+            "stream": True
+        }
+        with self.post(payload, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            # chunk_size=None hands over each chunk as it arrives instead of
+            # waiting for a full read buffer
+            for line in response.iter_lines(chunk_size=None):
+                if not line.startswith(b"data:"):
+                    continue
+                token = json.loads(line[5:]).get("token") or {}
+                if token.get("text") and not token.get("special"):
+                    yield token["text"]
+
+    def close(self):
+        """Close the pooled connections."""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_inference_client():
+    """
+    Get the shared inference client, creating it from the environment on first use.
+
+    Environment variables:
+        LLAMA_API_URL: Endpoint URL (defaults to the HuggingFace Llama-2 model)
+        HUGGINGFACE_API_KEY: API key
+        INFERENCE_POOL_SIZE: Pooled connections, sized to worker concurrency (default 16)
+        INFERENCE_CONNECT_TIMEOUT / INFERENCE_READ_TIMEOUT: Timeouts in seconds
+        INFERENCE_MAX_RETRIES: Retries after the first attempt (default 2)
+        INFERENCE_BREAKER_ERROR_RATE: Error rate opening the circuit, 0 disables the breaker (default 0.5)
+        INFERENCE_BREAKER_SLOW_SECONDS: p95 latency opening the circuit (default 8)
+        INFERENCE_BREAKER_MIN_REQUESTS: Requests in the window before the circuit can open (default 10)
+        INFERENCE_BREAKER_OPEN_SECONDS: Seconds the circuit stays open before probing (default 30)
+        INFERENCE_HEDGE_PERCENTILE: Latency percentile after which a completion request is
+            sent again, 0 disables hedging (default 0)
+        INFERENCE_HEDGE_BUDGET: Largest share of requests hedged (default 0.1)
+
+    Returns:
+        InferenceClient: The shared client
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            breaker = None
+            error_rate = float(os.getenv("INFERENCE_BREAKER_ERROR_RATE", 0.5))
+            if error_rate > 0:
+                breaker = CircuitBreaker(
+                    error_rate=error_rate,
+                    slow_seconds=float(os.getenv("INFERENCE_BREAKER_SLOW_SECONDS", 8)),
+                    min_requests=int(os.getenv("INFERENCE_BREAKER_MIN_REQUESTS", 10)),
+                    open_seconds=float(os.getenv("INFERENCE_BREAKER_OPEN_SECONDS", 30))
+                )
+            hedge = None
+            hedge_percentile = float(os.getenv("INFERENCE_HEDGE_PERCENTILE", 0))
+            if hedge_percentile > 0:
+                hedge = HedgePolicy(percentile=hedge_percentile, budget=float(os.getenv("INFERENCE_HEDGE_BUDGET", 0.1)))
+            _client = InferenceClient(
+                api_url=os.getenv("LLAMA_API_URL", DEFAULT_API_URL),
+                api_key=os.getenv("HUGGINGFACE_API_KEY", "hf_dummy_key"),
+                pool_size=int(os.getenv("INFERENCE_POOL_SIZE", 16)),
+                connect_timeout=float(os.getenv("INFERENCE_CONNECT_TIMEOUT", 3.05)),
+                read_timeout=float(os.getenv("INFERENCE_READ_TIMEOUT", 10)),
+                max_retries=int(os.getenv("INFERENCE_MAX_RETRIES", 2)),
+                breaker=breaker,
+                hedge=hedge
+            )
+        return _client
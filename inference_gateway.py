@@ -0,0 +1,268 @@
+"""
+Inference gateway module that schedules Llama requests on an asyncio event
+loop with a global concurrency cap, coalescing of identical in-flight prompts,
+optional micro-batching of different prompts and per-request deadlines.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+from functools import partial
+
+import requests
+
+from circuit_breaker import CircuitOpenError
+from inference_client import get_inference_client
+
+# Generation parameters in the order they follow the prompt in request keys
+PARAMETER_NAMES = ("max_new_tokens", "temperature", "top_p", "do_sample")
+
+
+def _item_response(response, item):
+    """Build the response a single-prompt request would have got from one result of a batch."""
+    single = requests.Response()
+    single.status_code = response.status_code
+    single.headers = response.headers
+    single.url = response.url
+    single.encoding = "utf-8"
+    # Endpoints answer a batch with a list of results per prompt or one result per prompt
+    single._content = json.dumps(item if isinstance(item, list) else [item]).encode("utf-8")
+    return single
+
+
+class MicroBatcher:
+    """
+    Collects prompts on a gateway's event loop and sends them upstream in batches.
+
+    Prompts with the same generation parameters that arrive within window
+    seconds of the first one go upstream as one request, or as soon as
+    max_batch_size of them are waiting, and each caller gets the response
+    a request of its own would have got. A batch counts against the
+    gateway's concurrency cap as one upstream request.
+
+    stats records the batches sent, the prompts they carried, the average
+    batch fill rate (prompts per batch over max_batch_size) and the queueing
+    delay the window added to the prompts, in total and at most.
+    """
+
+    def __init__(self, gateway, window=0.02, max_batch_size=8):
+        """
+        Create a batcher.
+
+        Args:
+            gateway (InferenceGateway): Gateway whose loop, executor and concurrency cap are used
+            window (float): Seconds a batch waits for more prompts after its first one
+            max_batch_size (int): Most prompts sent in one request
+        """
+        self.gateway = gateway
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.stats = {"batches": 0, "prompts": 0, "fill_rate": 0.0, "queue_delay": 0.0, "max_queue_delay": 0.0}
+
+        # generation parameters -> [(prompt, future, enqueue time)], and the timers flushing them
+        self._batches = {}
+        self._timers = {}
+
+    async def generate(self, prompt, parameters):
+        """
+        Queue a prompt for the next batch with the same parameters.
+
+        Args:
+            prompt (str): The formatted prompt
+            parameters (tuple): Generation parameter values in PARAMETER_NAMES order
+
+        Returns:
+            requests.Response: The response for this prompt
+        """
+        loop = self.gateway._loop
+        future = loop.create_future()
+        batch = self._batches.setdefault(parameters, [])
+        batch.append((prompt, future, time.monotonic()))
+        if len(batch) >= self.max_batch_size:
+            self._flush(parameters)
+        elif len(batch) == 1:
+            self._timers[parameters] = loop.call_later(self.window, self._flush, parameters)
+        return await future
+
+    def _flush(self, parameters):
+        timer = self._timers.pop(parameters, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(parameters, None)
+        if batch:
+            self.gateway._loop.create_task(self._send(parameters, batch))
+
+    async def _send(self, parameters, batch):
+        delays = [time.monotonic() - queued for _, _, queued in batch]
+        self.stats["batches"] += 1
+        self.stats["prompts"] += len(batch)
+        self.stats["fill_rate"] = self.stats["prompts"] / (self.stats["batches"] * self.max_batch_size)
+        self.stats["queue_delay"] += sum(delays)
+        self.stats["max_queue_delay"] = max(self.stats["max_queue_delay"], *delays)
+
+        gateway = self.gateway
+        call = partial(gateway.client.generate_batch, [prompt for prompt, _, _ in batch],
+                       **dict(zip(PARAMETER_NAMES, parameters)))
+        try:
+            async with gateway._semaphore:
+                gateway._count("upstream")
+                response = await gateway._loop.run_in_executor(gateway._executor, call)
+            results = response.json() if response.status_code == 200 else None
+            if results is not None and len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} results for the batch, got {len(results)}")
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for i, (_, future, _) in enumerate(batch):
+            if not future.done():
+                # A failed batch fails every prompt in it with the same response
+                future.set_result(_item_response(response, results[i]) if results is not None else response)
+
+
+class InferenceGateway:
+    """
+    Asyncio front end for an InferenceClient.
+
+    The event loop runs on a background thread; Flask worker threads submit
+    prompts with generate() and wait at most until their deadline. Identical
+    prompts with identical generation parameters that are already in flight
+    share one upstream request, and no more than max_concurrency upstream
+    requests run at once. The blocking HTTP calls themselves run on a
+    bounded executor over the client's pooled session.
+
+    With max_batch_size above 1, different prompts are also collected into
+    batches by a MicroBatcher, trading up to batch_window seconds of
+    queueing for fewer upstream requests.
+    """
+
+    def __init__(self, client, max_concurrency=8, deadline=12.0, max_batch_size=1, batch_window=0.02):
+        """
+        Start a gateway.
+
+        Args:
+            client (InferenceClient): Client used for upstream requests
+            max_concurrency (int): Maximum number of concurrent upstream requests
+            deadline (float): Default seconds a caller waits before giving up
+            max_batch_size (int): Most prompts sent in one upstream request, 1 disables batching
+            batch_window (float): Seconds a batch waits for more prompts after its first one
+        """
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.stats = {"submitted": 0, "coalesced": 0, "upstream": 0, "timeouts": 0}
+
+        self._inflight = {}
+        self._stats_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="inference"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="inference-gateway", daemon=True)
+        self._thread.start()
+        self._semaphore = asyncio.run_coroutine_threadsafe(self._create_semaphore(), self._loop).result()
+        self.batcher = MicroBatcher(self, batch_window, max_batch_size) if max_batch_size > 1 else None
+
+    async def _create_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrency)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    async def _fetch(self, key):
+        prompt, parameters = key[0], key[1:]
+        try:
+            if self.batcher is not None:
+                return await self.batcher.generate(prompt, parameters)
+            async with self._semaphore:
+                self._count("upstream")
+                call = partial(self.client.generate, prompt, **dict(zip(PARAMETER_NAMES, parameters)))
+                return await self._loop.run_in_executor(self._executor, call)
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _submit(self, key):
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._loop.create_task(self._fetch(key))
+            self._inflight[key] = task
+        else:
+            self._count("coalesced")
+        # A caller that gives up must not cancel the request other callers share
+        return await asyncio.shield(task)
+
+    def generate(self, prompt, max_new_tokens=150, temperature=0.7, top_p=0.9, do_sample=True, deadline=None):
+        """
+        Request a completion, sharing it with identical in-flight requests.
+
+        Args:
+            prompt (str): The formatted prompt
+            max_new_tokens (int): Maximum number of tokens to generate
+            temperature (float): Sampling temperature
+            top_p (float): Nucleus sampling probability
+            do_sample (bool): Whether to sample
+            deadline (float, optional): Seconds to wait, defaults to the gateway deadline
+
+        Returns:
+            requests.Response: The endpoint's response
+
+        Raises:
+            TimeoutError: If no response arrived before the deadline
+            CircuitOpenError: If the client's circuit breaker is open
+        """
+        self._count("submitted")
+        # Don't queue behind the calls to an endpoint that is failing
+        if self.client.breaker is not None and self.client.breaker.is_open():
+            raise CircuitOpenError(f"Circuit open for {self.client.api_url}")
+        deadline = deadline if deadline is not None else self.deadline
+        key = (prompt, max_new_tokens, temperature, top_p, do_sample)
+
+        future = asyncio.run_coroutine_threadsafe(self._submit(key), self._loop)
+        try:
+            return future.result(timeout=deadline)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._count("timeouts")
+            raise TimeoutError(f"Inference deadline of {deadline}s exceeded")
+
+    def close(self):
+        """Stop the event loop and the executor."""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=False)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_inference_gateway():
+    """
+    Get the shared inference gateway, creating it from the environment on first use.
+
+    Environment variables:
+        INFERENCE_MAX_CONCURRENCY: Concurrent upstream requests (default 8)
+        INFERENCE_DEADLINE: Seconds a chat turn waits for the model (default 12)
+        INFERENCE_MAX_BATCH_SIZE: Most prompts per upstream request, 1 disables batching (default 1)
+        INFERENCE_BATCH_WINDOW: Seconds a batch waits for more prompts (default 0.02)
+
+    Returns:
+        InferenceGateway: The shared gateway
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = InferenceGateway(
+                get_inference_client(),
+                max_concurrency=int(os.getenv("INFERENCE_MAX_CONCURRENCY", 8)),
+                deadline=float(os.getenv("INFERENCE_DEADLINE", 12)),
+                max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 1)),
+                batch_window=float(os.getenv("INFERENCE_BATCH_WINDOW", 0.02))
+            )
+        return _gateway
@@ -0,0 +1,117 @@
+"""
+Keyword index module that finds every keyword of several keyword lists in a
+single linear scan of a message, using an Aho-Corasick automaton built once
+per set of lists.
+"""
+
+from collections import deque
+
+
+class KeywordIndex:
+    """
+    Aho-Corasick automaton over named keyword lists.
+
+    Keywords match as plain substrings, exactly like `keyword in message`,
+    but the message is scanned once no matter how many keywords there are.
+    """
+
+    def __init__(self, keyword_lists):
+        """
+        Build the automaton.
+
+        Args:
+            keyword_lists (dict): Keyword lists keyed by list name
+        """
+        self.keywords = {name: list(keywords) for name, keywords in keyword_lists.items()}
+
+        # Trie of the keywords: transitions, failure links and outputs per state
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for name, keywords in self.keywords.items():
+            for keyword in keywords:
+                self._add(name, keyword)
+        self._link()
+
+    def _add(self, name, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((name, keyword))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # Inherit the keywords that end at the fallback state
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def scan(self, text):
+        """
+        Find the keywords of every list that occur in the text.
+
+        Args:
+            text (str): The (lowercased) message
+
+        Returns:
+            dict: Set of matched keywords keyed by list name
+        """
+        hits = {name: set() for name in self.keywords}
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for name, keyword in output[state]:
+                hits[name].add(keyword)
+
+        return hits
+
+    def counts(self, text):
+        """
+        Count the distinct keywords of every list that occur in the text.
+
+        Args:
+            text (str): The (lowercased) message
+
+        Returns:
+            dict: Number of matched keywords keyed by list name
+        """
+        return {name: len(found) for name, found in self.scan(text).items()}
+
+    def first(self, hits, *names):
+        """
+        Get the first matched keyword in list order.
+
+        Args:
+            hits (dict): Result of scan
+            *names (str): Lists to search, in order
+
+        Returns:
+            str: The first matched keyword, or None
+        """
+        for name in names:
+            found = hits[name]
+            if found:
+                for keyword in self.keywords[name]:
+                    if keyword in found:
+                        return keyword
+        return None
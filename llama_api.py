@@ -1,12 +1,11 @@
+import json
 import logging
-from flask import Flask, jsonify, request
-import requests
+from flask import Flask, Response, jsonify, request, stream_with_context
 import os
-import uuid
+import time
 import random
 import re
 from datetime import datetime
-from flask_cors import CORS
 from dotenv import load_dotenv
 from songs_data import get_song_recommendations
 from mental_health_analysis import analyze_text, get_mental_health_trend, format_analysis_response
@@ -15,9 +14,28 @@ from mood_encouragement import process_mood
 from positive_responses import process_positive_mood
 from wellness_routines import process_wellness_routine_request
 from therapist_contacts import process_therapist_request
-
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from keyword_index import KeywordIndex
+from chat_history import ChatHistory
+from inference_client import get_inference_client
+from inference_gateway import get_inference_gateway
+from completion_cache import get_completion_cache
+from message_pipeline import MessagePipeline
+from analyzer_pool import get_analyzer_pool
+from pattern_matcher import normalize
+from session_store import get_session_store, new_session_id, session_turn
+from session_expiry import start_session_expiry
+from session_log import log_turn, start_session_log
+from request_logging import get_request_logger, start_logging
+from frontend import register_frontend
+from cors import enable_cors
+
+# Scan long messages in parallel worker processes if ANALYZER_POOL_WORKERS is set, forked
+# before this module starts its background threads
+analyzer_pool = get_analyzer_pool()
+
+# Set up logging: JSON records written from a background thread, chat requests sampled
+start_logging()
+request_log = get_request_logger()
 
 # Load environment variables from .env file
 load_dotenv()
@@ -26,287 +44,326 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # For session management
 
-# Configure CORS to allow requests from any origin
-CORS(app,
-     supports_credentials=True,  # Enable CORS with credentials support
-     resources={r"/*": {"origins": "*"}},  # Allow all origins
-     allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
-     methods=["GET", "POST", "OPTIONS"]
-)
+# Answer CORS preflights and add the CORS headers to every response in one place, before Flask's routing
+enable_cors(app)
+
+# Serve the frontend from this process too if SERVE_FRONTEND is set, so chat requests are same-origin
+register_frontend(app)
+
+# Store conversation history, bounded by the session store's caps
+conversation_history = get_session_store("llama_api.conversation_history")
+
+# Clean up old conversations periodically, on a background thread instead of before each request
+start_session_expiry()
+
+# Restore the sessions from the durable session log and keep logging turns, if SESSION_LOG_DIR is set
+start_session_log()
+
+# Keyword lists for the rule-based fallback responses, indexed once for a single-pass scan
+FALLBACK_KEYWORDS = KeywordIndex({
+    "greetings": ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening'],
+    "feelings": ['sad', 'depressed', 'unhappy', 'stress', 'anxiety', 'lonely', 'tired', 'angry', 'worried', 'overwhelmed'],
+    "positive_feelings": ['happy', 'joy', 'excited', 'cheerful', 'good', 'great', 'calm', 'peaceful', 'relaxed'],
+    "jokes": ['joke', 'funny', 'laugh', 'humor'],
+    "thanks": ['thank', 'thanks', 'appreciate'],
+    "music_requests": ['song', 'music', 'playlist', 'recommend', 'listen'],
+    "wellness_requests": ['routine', 'wellness', 'mental health', 'physical health', 'daily habit', 'healthy habit', 'morning routine', 'evening routine'],
+    "therapist_requests": ['therapist', 'psychologist', 'psychiatrist', 'counselor', 'counselling', 'therapy', 'mental health professional', 'consultation', 'consultancy', 'wellness center', 'wellness centre', 'recommend therapist', 'recommend psychologist', 'recommend mental health', 'suggest therapist', 'suggest psychologist', 'mental health specialist']
+})
+
+# Mood words used to pick song recommendations when no mood phrase is found
+MOOD_WORDS = KeywordIndex({
+    "moods": [
+        "happy", "sad", "calm", "energetic", "focused", "relaxed",
+        "joy", "excited", "cheerful", "depressed", "unhappy", "peaceful",
+        "active", "motivated", "concentrated", "chill", "mellow"
+    ]
+})
 
-# Store conversation history
-conversation_history = {}
+# Patterns to extract a mood from song recommendation requests
+MOOD_PATTERNS = [
+    re.compile(r"(?:i(?:'m| am) feeling|i feel|make me feel|when i(?:'m| am)) (\w+)"),
+    re.compile(r"(?:recommend|suggest) (?:some|a few|) (?:songs|music) (?:for|when) (?:i(?:'m| am) feeling |i feel |feeling |)(\w+)"),
+    re.compile(r"(?:songs|music) (?:for|when) (?:i(?:'m| am)|one is) (\w+)"),
+    re.compile(r"(?:i want to|i need to|help me) (?:feel|be) (\w+)"),
+    re.compile(r"(?:i(?:'m| am)|i want to be) in a (\w+) mood")
+]
 
-# Function to call Llama API (using a free API endpoint)
-def get_llama_response(user_message, session_id):
+# Llama prompt templates; the chat prompt may also suggest songs
+SUPPORT_PROMPT = "<s>[INST] <<SYS>>\nYou are a supportive mental health chatbot. Respond with empathy and care. Provide helpful suggestions but make it clear you are not a replacement for professional help. Keep responses concise and focused on the user's well-being.\n<</SYS>>\n\n{message} [/INST]"
+CHAT_PROMPT = "<s>[INST] <<SYS>>\nYou are a supportive mental health chatbot. Respond with empathy and care. Provide helpful suggestions but make it clear you are not a replacement for professional help. Keep responses concise and focused on the user's well-being. You can also suggest songs to match the user's mood if they ask for music recommendations.\n<</SYS>>\n\n{message} [/INST]"
+
+# Messages kept per conversation, including the system message, to prevent token limits
+HISTORY_CAPACITY = 10
+
+# Generation parameters for the Llama chat reply
+CHAT_PARAMETERS = {"max_new_tokens": 150, "temperature": 0.7, "top_p": 0.9}
+
+# Add a user message to the session's conversation history
+def add_user_message(user_message, session_id):
     # Get or initialize conversation history for this session
-    if session_id not in conversation_history:
-        conversation_history[session_id] = []
-        # Add system message to set the context
-        conversation_history[session_id].append({
+    history = conversation_history.get(session_id)
+    if history is None:
+        # Pin a system message to set the context
+        history = ChatHistory(HISTORY_CAPACITY, system={
             'role': 'system',
             'content': 'You are a supportive mental health chatbot. Respond with empathy and care. ' +
                       'Provide helpful suggestions but make it clear you are not a replacement for professional help. ' +
                       'Keep responses concise and focused on the user\'s well-being.'
         })
 
-    # Add the new user message to history
-    conversation_history[session_id].append({
+    # Add the new user message to history, keeping the system message and the most recent messages
+    history.append({
         'role': 'user',
         'content': user_message,
         'timestamp': datetime.now().isoformat()
     })
 
-    # Limit history to last 10 messages to prevent token limits
-    if len(conversation_history[session_id]) > 10:
-        # Keep the system message and the most recent messages
-        conversation_history[session_id] = [conversation_history[session_id][0]] + conversation_history[session_id][-9:]
+    conversation_history[session_id] = history
 
-    # Check if this is a music recommendation request
-    music_keywords = ['song', 'music', 'playlist', 'recommend', 'listen']
-    is_music_request = any(keyword in user_message.lower() for keyword in music_keywords)
+# Add the bot's reply to the session's conversation history
+def add_bot_reply(reply, session_id):
+    # The session may have been evicted while the reply was generated
+    history = conversation_history.get(session_id)
+    if history is None:
+        return
+
+    history.append({
+        'role': 'assistant',
+        'content': reply,
+        'timestamp': datetime.now().isoformat()
+    })
+    conversation_history[session_id] = history
+
+# Function to call Llama API (using a free API endpoint)
+def get_llama_response(user_message, session_id):
+    add_user_message(user_message, session_id)
+
+    # Normalize the message once and route it through the analyzers in priority order
+    message = normalize(user_message)
+    if analyzer_pool is not None:
+        analyzer_pool.scan(message)
+    stage, reply = RESPONSE_PIPELINE.run(message, session_id)
+    logging.debug("Reply produced by the %s stage", stage)
+
+    add_bot_reply(reply, session_id)
+    return stage, reply
+
+# Stream the reply to a message chunk by chunk: a rule-based reply is a
+# single chunk, a Llama reply is streamed token by token as it's generated
+def stream_llama_response(user_message, session_id):
+    with session_turn(session_id):
+        add_user_message(user_message, session_id)
+
+        message = normalize(user_message)
+        if analyzer_pool is not None:
+            analyzer_pool.scan(message)
+        stage, reply = RULE_PIPELINE.run(message, session_id)
+        if reply is not None:
+            logging.debug("Reply produced by the %s stage", stage)
+            yield reply
+        else:
+            stage = "llama"
+            chunks = []
+            for chunk in stream_completion(message):
+                chunks.append(chunk)
+                yield chunk
+            reply = "".join(chunks).strip()
+
+        add_bot_reply(reply, session_id)
+        log_turn(session_id, user_message, reply, stage)
+
+# Get a Llama completion, serving repeated prompts from the completion cache
+def generate_completion(prompt, **parameters):
+    completion_cache = get_completion_cache()
+    completion = completion_cache.get(prompt, parameters)
+    if completion is not None:
+        return completion
+
+    response = get_inference_gateway().generate(prompt, **parameters)
+    if response.status_code != 200:
+        logging.error(f"API error: {response.status_code} - {response.text}")
+        return None
+
+    # Parse the response based on the API's format
+    completion = response.json()[0]["generated_text"]
+    completion_cache.put(prompt, parameters, completion, source=response)
+    return completion
+
+# Stream the Llama chat reply to a message; a cached completion is served as one chunk
+def stream_completion(message):
+    prompt = CHAT_PROMPT.format(message=message.raw)
+    completion_cache = get_completion_cache()
+    completion = completion_cache.get(prompt, CHAT_PARAMETERS)
+    if completion is not None:
+        parts = completion.split("[/INST]")
+        yield parts[1].strip() if len(parts) > 1 else completion
+        return
+
+    # Streaming bypasses the gateway: a token stream can't be shared between callers
+    tokens = []
+    try:
+        for token in get_inference_client().stream(prompt, **CHAT_PARAMETERS):
+            tokens.append(token)
+            yield token
+    except Exception as e:
+        logging.error(f"Error streaming from API: {str(e)}")
+        if tokens:
+            return
+
+    if not "".join(tokens).strip():
+        # Nothing was generated, fall back to the rule-based responses
+        yield fallback_response(message)
+        return
+
+    completion_cache.put(prompt, CHAT_PARAMETERS, f"{prompt} {''.join(tokens)}")
+
+# Pipeline stages, each returning a reply or None to pass the message on
+
+# If this is a music request, handle it directly
+def music_stage(message, session_id):
+    if message.keyword_hits(FALLBACK_KEYWORDS)["music_requests"]:
+        return get_song_recommendation_response(message.raw)
+    return None
+
+# If therapist contact was requested, prioritize the therapist recommendations
+def therapist_stage(message, session_id):
+    therapist_request_result = process_therapist_request(message)
+    if therapist_request_result.get("is_therapist_request", False):
+        return therapist_request_result.get("response")
+    return None
+
+# If wellness routine was requested, prioritize the routine response
+def wellness_routine_stage(message, session_id):
+    wellness_routine_result = process_wellness_routine_request(message)
+    if wellness_routine_result.get("is_routine_request", False):
+        return wellness_routine_result.get("response")
+    return None
+
+# If positive mood was detected, prioritize the enthusiastic response
+def positive_mood_stage(message, session_id):
+    positive_mood_result = process_positive_mood(message)
+    if positive_mood_result.get("has_positive_mood", False):
+        return positive_mood_result.get("response")
+    return None
+
+# If negative mood was detected, prioritize the mood encouragement
+def mood_stage(message, session_id):
+    mood_result = process_mood(message, session_id)
+    if mood_result.get("has_negative_mood", False):
+        return mood_result.get("response")
+    return None
+
+# If deep thought was detected, prioritize the encouraging response
+def deep_thought_stage(message, session_id):
+    deep_thought_result = process_deep_thought(message)
+    if deep_thought_result.get("is_deep_thought", False):
+        return deep_thought_result.get("response")
+    return None
+
+# If mental health concerns were detected, provide coping strategies
+def mental_health_stage(message, session_id):
+    user_message = message.raw
 
     # Analyze message for mental health concerns
-    mental_health_analysis = analyze_text(user_message, session_id)
+    mental_health_analysis = analyze_text(message, session_id)
     mental_health_trend = get_mental_health_trend(session_id)
     mental_health_response = format_analysis_response(mental_health_analysis, mental_health_trend)
 
-    # Process message for deep thoughts and generate encouraging response
-    deep_thought_result = process_deep_thought(user_message)
-
-    # Process message for negative moods and generate encouragement
-    mood_result = process_mood(user_message, session_id)
-
-    # Process message for positive moods and generate enthusiastic responses
-    positive_mood_result = process_positive_mood(user_message)
-
-    # Process message for wellness routine requests
-    wellness_routine_result = process_wellness_routine_request(user_message)
+    if not mental_health_response:
+        return None
 
-    # Process message for therapist contact requests
-    therapist_request_result = process_therapist_request(user_message)
-
-    # Format conversation history for the API
-    messages = []
-    for msg in conversation_history[session_id]:
-        if 'role' in msg and 'content' in msg:
-            messages.append({"role": msg['role'], "content": msg['content']})
-
-    # If this is a music request, handle it directly
-    if is_music_request:
-        reply = get_song_recommendation_response(user_message)
-        # Add the bot's reply to the conversation history
-        conversation_history[session_id].append({
-            'role': 'assistant',
-            'content': reply,
-            'timestamp': datetime.now().isoformat()
-        })
-        return reply
-
-    # If therapist contact was requested, prioritize the therapist recommendations
-    if therapist_request_result.get("is_therapist_request", False) and therapist_request_result.get("response"):
-        therapist_response = therapist_request_result.get("response", "")
-
-        # Add the bot's reply to the conversation history
-        conversation_history[session_id].append({
-            'role': 'assistant',
-            'content': therapist_response,
-            'timestamp': datetime.now().isoformat()
-        })
-
-        return therapist_response
-
-    # If wellness routine was requested, prioritize the routine response
-    elif wellness_routine_result.get("is_routine_request", False) and wellness_routine_result.get("response"):
-        routine_response = wellness_routine_result.get("response", "")
-
-        # Add the bot's reply to the conversation history
-        conversation_history[session_id].append({
-            'role': 'assistant',
-            'content': routine_response,
-            'timestamp': datetime.now().isoformat()
-        })
-
-        return routine_response
-
-    # If positive mood was detected, prioritize the enthusiastic response
-    elif positive_mood_result.get("has_positive_mood", False) and positive_mood_result.get("response"):
-        positive_response = positive_mood_result.get("response", "")
-
-        # Add the bot's reply to the conversation history
-        conversation_history[session_id].append({
-            'role': 'assistant',
-            'content': positive_response,
-            'timestamp': datetime.now().isoformat()
-        })
-
-        return positive_response
-
-    # If negative mood was detected, prioritize the mood encouragement
-    elif mood_result.get("has_negative_mood", False) and mood_result.get("response"):
-        mood_response = mood_result.get("response", "")
-
-        # Add the bot's reply to the conversation history
-        conversation_history[session_id].append({
-            'role': 'assistant',
-            'content': mood_response,
-            'timestamp': datetime.now().isoformat()
-        })
-
-        return mood_response
+    # Get a regular response first
+    regular_reply = None
+    try:
+        # Try to use the API for a regular response
+        # Format the prompt for Llama
+        prompt = SUPPORT_PROMPT.format(message=user_message)
 
-    # If deep thought was detected, prioritize the encouraging response
-    elif deep_thought_result.get("is_deep_thought", False):
-        deep_thought_response = deep_thought_result.get("response", "")
+        regular_reply = generate_completion(prompt, max_new_tokens=100, temperature=0.7, top_p=0.9)
 
-        # Add the bot's reply to the conversation history
-        conversation_history[session_id].append({
-            'role': 'assistant',
-            'content': deep_thought_response,
-            'timestamp': datetime.now().isoformat()
-        })
+        if regular_reply is not None:
+            try:
+                regular_reply = regular_reply.split("[/INST]")[1].strip()
+            except IndexError:
+                regular_reply = fallback_response(message)
+        else:
+            regular_reply = fallback_response(message)
+    except Exception as e:
+        logging.error(f"Error calling API: {str(e)}")
+        regular_reply = fallback_response(message)
 
-        return deep_thought_response
-
-    # If mental health concerns were detected, provide coping strategies
-    elif mental_health_response:
-        # Get a regular response first
-        regular_reply = None
-        try:
-            # Try to use the API for a regular response
-            api_url = "https://api-inference.huggingface.co/models/meta-llama/Llama-2-7b-chat-hf"
-            headers = {
-                "Authorization": f"Bearer {os.getenv('HUGGINGFACE_API_KEY', 'hf_dummy_key')}",
-                "Content-Type": "application/json"
-            }
-
-            # Format the prompt for Llama
-            prompt = f"<s>[INST] <<SYS>>\nYou are a supportive mental health chatbot. Respond with empathy and care. Provide helpful suggestions but make it clear you are not a replacement for professional help. Keep responses concise and focused on the user's well-being.\n<</SYS>>\n\n{user_message} [/INST]"
-
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "max_new_tokens": 100,
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "do_sample": True
-                }
-            }
-
-            response = requests.post(api_url, headers=headers, json=payload, timeout=10)
-
-            if response.status_code == 200:
-                try:
-                    regular_reply = response.json()[0]["generated_text"]
-                    regular_reply = regular_reply.split("[/INST]")[1].strip()
-                except (KeyError, IndexError, ValueError):
-                    regular_reply = fallback_response(user_message)
-            else:
-                regular_reply = fallback_response(user_message)
-        except Exception as e:
-            logging.error(f"Error calling API: {str(e)}")
-            regular_reply = fallback_response(user_message)
-
-        # Combine the regular reply with mental health coping strategies
-        combined_reply = f"{regular_reply}\n\n{mental_health_response}"
-
-        # Add the bot's reply to the conversation history
-        conversation_history[session_id].append({
-            'role': 'assistant',
-            'content': combined_reply,
-            'timestamp': datetime.now().isoformat()
-        })
+    # Combine the regular reply with mental health coping strategies
+    return f"{regular_reply}\n\n{mental_health_response}"
 
-        return combined_reply
+# Using HuggingFace Inference API (free tier)
+def llama_stage(message, session_id):
+    user_message = message.raw
 
-    # Using HuggingFace Inference API (free tier)
     # You'll need to replace this with an actual free API endpoint
     try:
         # Try to use a free API service
         # This is a placeholder - you'll need to replace with an actual working API
-        api_url = "https://api-inference.huggingface.co/models/meta-llama/Llama-2-7b-chat-hf"
-        headers = {
-            "Authorization": f"Bearer {os.getenv('HUGGINGFACE_API_KEY', 'hf_dummy_key')}",
-            "Content-Type": "application/json"
-        }
-
         # Format the prompt for Llama
-        prompt = f"<s>[INST] <<SYS>>\nYou are a supportive mental health chatbot. Respond with empathy and care. Provide helpful suggestions but make it clear you are not a replacement for professional help. Keep responses concise and focused on the user's well-being. You can also suggest songs to match the user's mood if they ask for music recommendations.\n<</SYS>>\n\n{user_message} [/INST]"
-
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_new_tokens": 150,
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "do_sample": True
-            }
-        }
-
-        response = requests.post(api_url, headers=headers, json=payload)
-
-        if response.status_code == 200:
-            # Parse the response based on the API's format
-            try:
-                reply = response.json()[0]["generated_text"]
-                # Extract just the assistant's reply (after the prompt)
-                reply = reply.split("[/INST]")[1].strip()
-            except (KeyError, IndexError, ValueError):
-                # If we can't parse the response properly, use the full text
-                reply = response.json()
-                if isinstance(reply, list) and len(reply) > 0:
-                    reply = reply[0].get("generated_text", "I'm having trouble understanding. Could you try again?")
-                else:
-                    reply = "I'm having trouble understanding. Could you try again?"
-        else:
-            # If the API call fails, fall back to the rule-based responses
-            logging.error(f"API error: {response.status_code} - {response.text}")
-            reply = fallback_response(user_message)
+        prompt = CHAT_PROMPT.format(message=user_message)
+
+        reply = generate_completion(prompt, **CHAT_PARAMETERS)
+
+        if reply is not None:
+            # Extract just the assistant's reply (after the prompt)
+            parts = reply.split("[/INST]")
+            # If we can't parse the response properly, use the full text
+            reply = parts[1].strip() if len(parts) > 1 else reply
+        if not reply:
+            # If the API call fails or generates nothing, fall back to the rule-based responses
+            reply = fallback_response(message)
 
     except Exception as e:
         logging.error(f"Error calling API: {str(e)}")
-        reply = fallback_response(user_message)
-
-    # Add bot response to history
-    conversation_history[session_id].append({
-        'role': 'assistant',
-        'content': reply,
-        'timestamp': datetime.now().isoformat()
-    })
+        reply = fallback_response(message)
 
     return reply
 
+# Analyzer stages in the order the router prioritizes them. Only the stages up to the one that replies
+# run, so a session's mood and mental health histories only record the messages that reach their stages
+RESPONSE_PIPELINE = MessagePipeline([
+    ("music", music_stage),
+    ("therapist", therapist_stage),
+    ("wellness_routine", wellness_routine_stage),
+    ("positive_mood", positive_mood_stage),
+    ("negative_mood", mood_stage),
+    ("deep_thought", deep_thought_stage),
+    ("mental_health", mental_health_stage),
+    ("llama", llama_stage)
+])
+
+# The rule-based stages only, for streaming where the Llama reply is streamed instead
+RULE_PIPELINE = MessagePipeline([stage for stage in RESPONSE_PIPELINE.stages if stage[0] != "llama"])
+
 # Fallback response generator when API is unavailable
 def fallback_response(message):
-    message = message.lower()
+    message = normalize(message)
 
-    # Simple patterns for fallback responses
-    greetings = ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening']
-    feelings = ['sad', 'depressed', 'unhappy', 'stress', 'anxiety', 'lonely', 'tired', 'angry', 'worried', 'overwhelmed']
-    positive_feelings = ['happy', 'joy', 'excited', 'cheerful', 'good', 'great', 'calm', 'peaceful', 'relaxed']
-    jokes = ['joke', 'funny', 'laugh', 'humor']
-    thanks = ['thank', 'thanks', 'appreciate']
-    music_requests = ['song', 'music', 'playlist', 'recommend', 'listen']
-    wellness_requests = ['routine', 'wellness', 'mental health', 'physical health', 'daily habit', 'healthy habit', 'morning routine', 'evening routine']
-    therapist_requests = ['therapist', 'psychologist', 'psychiatrist', 'counselor', 'counselling', 'therapy', 'mental health professional', 'consultation', 'consultancy', 'wellness center', 'wellness centre', 'recommend therapist', 'recommend psychologist', 'recommend mental health', 'suggest therapist', 'suggest psychologist', 'mental health specialist']
+    # Find the hits of every keyword list in one scan
+    hits = message.keyword_hits(FALLBACK_KEYWORDS)
 
     # Check for therapist contact requests
-    if any(word in message for word in therapist_requests):
+    if hits["therapist_requests"]:
         therapist_result = process_therapist_request(message)
         if therapist_result.get("is_therapist_request", False) and therapist_result.get("response"):
             return therapist_result.get("response")
 
     # Check for wellness routine requests
-    if any(word in message for word in wellness_requests):
+    if hits["wellness_requests"]:
         wellness_result = process_wellness_routine_request(message)
         if wellness_result.get("is_routine_request", False) and wellness_result.get("response"):
             return wellness_result.get("response")
 
     # Check for song recommendation requests
-    if any(word in message for word in music_requests):
-        return get_song_recommendation_response(message)
+    if hits["music_requests"]:
+        return get_song_recommendation_response(message.text)
 
-    if any(word in message for word in greetings):
+    if hits["greetings"]:
         return random.choice([
             "Hello! How are you feeling today?",
             "Hi there! How can I support you today?",
@@ -314,26 +371,27 @@ def fallback_response(message):
         ])
 
     # Check for feelings to suggest songs
-    for feeling in feelings + positive_feelings:
-        if feeling in message:
+    for feeling in FALLBACK_KEYWORDS.keywords["feelings"] + FALLBACK_KEYWORDS.keywords["positive_feelings"]:
+        if feeling in hits["feelings"] or feeling in hits["positive_feelings"]:
             # Get song recommendations for this feeling
             songs = get_song_recommendations(feeling, count=2)
             if songs:
                 song_text = format_song_recommendations(songs, feeling)
-                return f"I notice you're feeling {feeling}. {random.choice([
+                encouragement = random.choice([
                     'Music can help with your mood.',
                     'Sometimes music can be therapeutic.',
                     'The right song might help you process these feelings.'
-                ])} {song_text}"
+                ])
+                return f"I notice you're feeling {feeling}. {encouragement} {song_text}"
 
-    if any(word in message for word in feelings):
+    if hits["feelings"]:
         return random.choice([
             "I'm sorry to hear you're feeling that way. Would you like to talk more about it? I could also suggest some songs that might help.",
             "That sounds tough. Remember, it's okay to feel this way. Would you like me to recommend some music that might resonate with you?",
             "Have you tried any strategies to help you feel better? Music can be therapeutic - I can suggest some songs if you'd like."
         ])
 
-    if any(word in message for word in jokes):
+    if hits["jokes"]:
         return random.choice([
             "Why don't scientists trust atoms? Because they make up everything!",
             "What did the ocean say to the beach? Nothing, it just waved!",
@@ -341,7 +399,7 @@ def fallback_response(message):
             "Why did the bicycle fall over? It was two-tired!"
         ])
 
-    if any(word in message for word in thanks):
+    if hits["thanks"]:
         return "You're welcome! I'm here whenever you need to talk."
 
     # Default response
@@ -349,34 +407,19 @@ def fallback_response(message):
 
 # Function to handle song recommendation requests
 def get_song_recommendation_response(message):
-    # Try to extract mood from the message
-    mood_patterns = [
-        r"(?:i(?:'m| am) feeling|i feel|make me feel|when i(?:'m| am)) (\w+)",
-        r"(?:recommend|suggest) (?:some|a few|) (?:songs|music) (?:for|when) (?:i(?:'m| am) feeling |i feel |feeling |)(\w+)",
-        r"(?:songs|music) (?:for|when) (?:i(?:'m| am)|one is) (\w+)",
-        r"(?:i want to|i need to|help me) (?:feel|be) (\w+)",
-        r"(?:i(?:'m| am)|i want to be) in a (\w+) mood"
-    ]
+    message = message.lower()
 
     # Try to extract mood using patterns
     mood = None
-    for pattern in mood_patterns:
-        match = re.search(pattern, message.lower())
+    for pattern in MOOD_PATTERNS:
+        match = pattern.search(message)
         if match:
             mood = match.group(1)
             break
 
     # If no mood found, check for common mood words
     if not mood:
-        mood_words = [
-            "happy", "sad", "calm", "energetic", "focused", "relaxed",
-            "joy", "excited", "cheerful", "depressed", "unhappy", "peaceful",
-            "active", "motivated", "concentrated", "chill", "mellow"
-        ]
-        for word in mood_words:
-            if word in message.lower():
-                mood = word
-                break
+        mood = MOOD_WORDS.first(MOOD_WORDS.scan(message), "moods")
 
     # If still no mood found, ask for clarification
     if not mood:
@@ -409,84 +452,90 @@ def format_song_recommendations(songs, mood):
 
 @app.route('/chat', methods=['POST'])
 def chat():
+    start = time.perf_counter()
     try:
-        # Log request details for debugging
-        logging.info(f"Received request: {request.method} {request.path}")
-        logging.info(f"Request headers: {dict(request.headers)}")
-
         data = request.get_json()
-        logging.info(f"Request data: {data}")
-
+        # Request bodies are only built when DEBUG logging is on
+        request_log.debug("Chat request body", lambda: {"headers": dict(request.headers), "data": data})
         user_message = data.get('message', '').strip()
-        logging.info(f"User message: {user_message}")
 
         if not user_message:
             return jsonify({'reply': "Please provide a message."}), 400
 
         # Get or create session ID
         session_id = request.cookies.get('session_id')
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            logging.info(f"Created new session ID: {session_id}")
-        else:
-            logging.info(f"Using existing session ID: {session_id}")
+        new_session = not session_id
+        if new_session:
+            session_id = new_session_id()
 
-        # Call the Llama API
-        reply = get_llama_response(user_message, session_id)
-        logging.info(f"Generated reply: {reply}")
+        # Call the Llama API, loading and saving the session state once for the turn
+        with session_turn(session_id):
+            stage, reply = get_llama_response(user_message, session_id)
+            log_turn(session_id, user_message, reply, stage)
+        request_log.debug("Chat reply", lambda: {"session_id": session_id, "user_message": user_message, "reply": reply})
 
         # Create response with session cookie
         response = jsonify({'reply': reply})
         response.set_cookie('session_id', session_id, max_age=86400)  # 24 hour expiry
 
-        # Add CORS headers explicitly
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        response.headers.add('Access-Control-Allow-Credentials', 'true')
-
-        logging.info(f"Sending response: {response.data}")
+        request_log.info("Chat request", method=request.method, path=request.path, session_id=session_id,
+                         new_session=new_session, status=200, message_chars=len(user_message),
+                         reply_chars=len(reply), duration_ms=round((time.perf_counter() - start) * 1000, 1))
         return response
     except Exception as e:
         logging.error(f"Error processing request: {e}", exc_info=True)
         error_response = jsonify({'reply': f"Sorry, I couldn't process your request. Error: {str(e)}"})
 
-        # Add CORS headers to error response too
-        error_response.headers.add('Access-Control-Allow-Origin', '*')
-        error_response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-        error_response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-        error_response.headers.add('Access-Control-Allow-Credentials', 'true')
-
         return error_response, 400
 
-# Add OPTIONS method handler for CORS preflight requests
-@app.route('/chat', methods=['OPTIONS'])
-def handle_options():
-    response = app.make_default_options_response()
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    return response
+# Same as /chat, but streams the reply as server-sent events while it's generated:
+# one `data: {"chunk": ...}` event per chunk, then an `event: done` with the full reply
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    start = time.perf_counter()
+    try:
+        data = request.get_json()
+        # Request bodies are only built when DEBUG logging is on
+        request_log.debug("Chat request body", lambda: {"headers": dict(request.headers), "data": data})
+        user_message = data.get('message', '').strip()
 
-# Clean up old conversations periodically
-@app.before_request
-def cleanup_old_sessions():
-    # This is a simple cleanup that runs before each request
-    # In a production app, you'd want to do this in a background task
-    current_time = datetime.now()
-    sessions_to_remove = []
+        if not user_message:
+            return jsonify({'reply': "Please provide a message."}), 400
 
-    for session_id, history in conversation_history.items():
-        if history:
-            last_message_time = datetime.fromisoformat(history[-1]['timestamp'])
-            # Remove sessions older than 24 hours
-            if (current_time - last_message_time).total_seconds() > 86400:
-                sessions_to_remove.append(session_id)
+        # Get or create session ID
+        session_id = request.cookies.get('session_id')
+        new_session = not session_id
+        if new_session:
+            session_id = new_session_id()
+        method, path = request.method, request.path
+
+        def events():
+            chunks = []
+            try:
+                for chunk in stream_llama_response(user_message, session_id):
+                    chunks.append(chunk)
+                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+            except Exception as e:
+                logging.error(f"Error streaming reply: {e}", exc_info=True)
+            reply = ''.join(chunks).strip()
+            yield f"event: done\ndata: {json.dumps({'reply': reply})}\n\n"
+            request_log.debug("Chat reply", lambda: {"session_id": session_id, "user_message": user_message, "reply": reply})
+            request_log.info("Chat request", method=method, path=path, session_id=session_id,
+                             new_session=new_session, status=200, message_chars=len(user_message),
+                             reply_chars=len(reply), duration_ms=round((time.perf_counter() - start) * 1000, 1))
+
+        # Disable caching and proxy buffering so each chunk is flushed as it's produced
+        response = Response(stream_with_context(events()), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.set_cookie('session_id', session_id, max_age=86400)  # 24 hour expiry
+
+        return response
+    except Exception as e:
+        logging.error(f"Error processing request: {e}", exc_info=True)
+        error_response = jsonify({'reply': f"Sorry, I couldn't process your request. Error: {str(e)}"})
 
-    for session_id in sessions_to_remove:
-        del conversation_history[session_id]
+        return error_response, 400
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)  # Set up logging
     app.run(host="0.0.0.0", port=5000)  # Run the app
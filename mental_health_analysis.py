@@ -3,9 +3,16 @@ Mental health analysis module for detecting potential mental health concerns
 and providing appropriate coping strategies.
 """
 
-import re
 import random
-from datetime import datetime, timedelta
+import time
+from array import array
+from pattern_matcher import MATCHER, normalize
+from session_store import get_session_store, session_record
+
+try:
+    import numpy as np
+except ImportError:  # Only needed to vectorize trend reports
+    np = None
 
 # Dictionary of mental health indicators and their severity levels
 MENTAL_HEALTH_INDICATORS = {
@@ -174,56 +181,164 @@ CRISIS_RESOURCES = {
     }
 }
 
-# User mental health tracking
-user_mental_health_history = {}
+# Indicator keywords compiled once into the shared matcher, labelled by concern
+MENTAL_HEALTH_TABLE = MATCHER.register(
+    "mental_health",
+    [keyword for data in MENTAL_HEALTH_INDICATORS.values() for keyword in data["keywords"]],
+    labels=[concern for concern, data in MENTAL_HEALTH_INDICATORS.items() for _ in data["keywords"]],
+    literal=True
+)
 
-def analyze_text(text, user_id):
+# Concerns and severities in the order the per-user arrays are indexed by
+CONCERNS = tuple(MENTAL_HEALTH_INDICATORS)
+CONCERN_INDEX = {concern: i for i, concern in enumerate(CONCERNS)}
+SEVERITIES = ("none", "low", "medium", "high")
+SEVERITY_INDEX = {severity: i for i, severity in enumerate(SEVERITIES)}
+
+# Messages kept per user, and seconds before coping strategies for a concern are repeated
+MAX_MESSAGES = 20
+STRATEGY_INTERVAL = 3600
+
+# Recent messages a concern must be mentioned in to count as active, messages needed
+# before there's a trend, and per-message decay of the severity scores and slopes
+TREND_WINDOW = 3
+TREND_MIN_MESSAGES = 5
+TREND_DECAY = 0.7
+
+# Trend of a concern by its state code in trend reports
+TREND_STATES = ("insufficient_data", "not_detected", "improving", "active_low", "active_medium", "active_high")
+
+@session_record
+class MentalHealthRecord:
     """
-    Analyze text for mental health indicators and track changes over time.
+    Mental health history of one user.
+
+    Per-concern values are kept in arrays indexed like CONCERNS, severities
+    as indexes into SEVERITIES and timestamps as epoch seconds, 0 meaning
+    never. The last MAX_MESSAGES messages are kept in a fixed-size ring of
+    parallel timestamp and text slots, and the severity each concern was
+    mentioned with in them in a matching ring of rows of a flat
+    MAX_MESSAGES x CONCERNS matrix.
+
+    The trend is kept up to date as each message arrives: the number of the
+    last TREND_WINDOW messages mentioning each concern, a severity score
+    decayed by TREND_DECAY per message and the decayed change of that score
+    as its slope. Looking up a trend never rescans the messages.
+    """
+
+    __slots__ = ("message_times", "message_texts", "message_count", "counts", "severities",
+                 "first_detected", "last_detected", "last_strategy_provided",
+                 "message_severities", "window_counts", "scores", "slopes")
+
+    def __init__(self):
+        self.message_times = array("d", [0.0] * MAX_MESSAGES)
+        self.message_texts = [None] * MAX_MESSAGES
+        # Messages ever added, the next one goes to slot message_count % MAX_MESSAGES
+        self.message_count = 0
+        self.counts = array("I", [0] * len(CONCERNS))
+        self.severities = array("B", [0] * len(CONCERNS))
+        self.first_detected = array("d", [0.0] * len(CONCERNS))
+        self.last_detected = array("d", [0.0] * len(CONCERNS))
+        self.last_strategy_provided = array("d", [0.0] * len(CONCERNS))
+        self.message_severities = array("B", [0] * (MAX_MESSAGES * len(CONCERNS)))
+        self.window_counts = array("B", [0] * len(CONCERNS))
+        self.scores = array("d", [0.0] * len(CONCERNS))
+        self.slopes = array("d", [0.0] * len(CONCERNS))
+
+    def __len__(self):
+        return min(self.message_count, MAX_MESSAGES)
+
+    def add_message(self, timestamp, text, severities=None):
+        """
+        Add a message, replacing the oldest one once the ring is full, and update the trend.
+
+        Args:
+            timestamp (float): Epoch seconds the message arrived at
+            text (str): The message text
+            severities (list, optional): Index into SEVERITIES each concern was mentioned with
+        """
+        concerns = len(CONCERNS)
+        slot = self.message_count % MAX_MESSAGES
+        row = slot * concerns
+        self.message_times[slot] = timestamp
+        self.message_texts[slot] = text
+        self.message_severities[row:row + concerns] = array("B", severities or [0] * concerns)
+
+        # The message leaving the window is still in the ring, since the window is shorter
+        if self.message_count >= TREND_WINDOW:
+            old_row = (self.message_count - TREND_WINDOW) % MAX_MESSAGES * concerns
+        else:
+            old_row = None
+        for i in range(concerns):
+            severity = self.message_severities[row + i]
+            if severity:
+                self.window_counts[i] += 1
+            if old_row is not None and self.message_severities[old_row + i]:
+                self.window_counts[i] -= 1
+
+            score = self.scores[i] * TREND_DECAY + severity
+            self.slopes[i] = self.slopes[i] * TREND_DECAY + (1 - TREND_DECAY) * (score - self.scores[i])
+            self.scores[i] = score
+        self.message_count += 1
+
+    def recent_texts(self, n):
+        """Get the texts of the n most recent messages, oldest first."""
+        n = min(n, len(self))
+        return [self.message_texts[(self.message_count - i) % MAX_MESSAGES] for i in range(n, 0, -1)]
+
+    def to_state(self):
+        """Get the record as JSON compatible lists, messages oldest first."""
+        concerns = len(CONCERNS)
+        slots = [(self.message_count - i) % MAX_MESSAGES for i in range(len(self), 0, -1)]
+        return [[self.message_times[slot] for slot in slots], [self.message_texts[slot] for slot in slots],
+                list(self.counts), list(self.severities), list(self.first_detected),
+                list(self.last_detected), list(self.last_strategy_provided),
+                [list(self.message_severities[slot * concerns:(slot + 1) * concerns]) for slot in slots],
+                list(self.scores), list(self.slopes)]
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a record from to_state()."""
+        record = cls()
+        times, texts, counts, severities, first_detected, last_detected, last_strategy_provided = state[:7]
+        # Records saved before the trend was kept have no per-message severities
+        message_severities = state[7] if len(state) > 7 else [None] * len(times)
+        for timestamp, text, row in zip(times, texts, message_severities):
+            record.add_message(timestamp, text, row)
+        if len(state) > 7:
+            # Older messages fell out of the ring but still count towards the decayed values
+            record.scores = array("d", state[8])
+            record.slopes = array("d", state[9])
+        record.counts = array("I", counts)
+        record.severities = array("B", severities)
+        record.first_detected = array("d", first_detected)
+        record.last_detected = array("d", last_detected)
+        record.last_strategy_provided = array("d", last_strategy_provided)
+        return record
+
+# User mental health tracking, bounded by the session store's caps
+user_mental_health_history = get_session_store("mental_health_history")
+
+def detect_concerns(text):
+    """
+    Detect mental health concerns and their severity, without touching any user's history.
     
     Args:
-        text (str): The user's message text
-        user_id (str): Unique identifier for the user
+        text (str or NormalizedMessage): The user's message text
         
     Returns:
-        dict: Analysis results including concerns, severity, and coping strategies
+        dict: Severity and matched keywords keyed by detected concern
     """
-    text = text.lower()
-    
-    # Initialize or get user history
-    if user_id not in user_mental_health_history:
-        user_mental_health_history[user_id] = {
-            "messages": [],
-            "concerns": {
-                "depression": {"count": 0, "severity": "none", "first_detected": None, "last_detected": None},
-                "anxiety": {"count": 0, "severity": "none", "first_detected": None, "last_detected": None},
-                "anger": {"count": 0, "severity": "none", "first_detected": None, "last_detected": None},
-                "self_harm": {"count": 0, "severity": "none", "first_detected": None, "last_detected": None}
-            },
-            "last_strategy_provided": {
-                "depression": None,
-                "anxiety": None,
-                "anger": None,
-                "self_harm": None
-            }
-        }
+    message = normalize(text)
     
-    # Add message to history
-    user_mental_health_history[user_id]["messages"].append({
-        "text": text,
-        "timestamp": datetime.now().isoformat()
-    })
+    # Group the keyword hits by concern
+    keywords_by_concern = {}
+    for index in message.hits("mental_health"):
+        keywords_by_concern.setdefault(MENTAL_HEALTH_TABLE.labels[index], []).append(MENTAL_HEALTH_TABLE.patterns[index])
     
-    # Limit history to last 20 messages
-    if len(user_mental_health_history[user_id]["messages"]) > 20:
-        user_mental_health_history[user_id]["messages"] = user_mental_health_history[user_id]["messages"][-20:]
-    
-    # Detect concerns and their severity
     detected_concerns = {}
-    
     for concern, data in MENTAL_HEALTH_INDICATORS.items():
-        # Check for keywords
-        found_keywords = [keyword for keyword in data["keywords"] if keyword in text or re.search(r'\b' + re.escape(keyword) + r'\b', text)]
+        found_keywords = keywords_by_concern.get(concern, [])
         
         if found_keywords:
             # Determine severity
@@ -233,20 +348,52 @@ def analyze_text(text, user_id):
                     severity = level
                     break
             
-            # Update user history
-            user_mental_health_history[user_id]["concerns"][concern]["count"] += 1
-            user_mental_health_history[user_id]["concerns"][concern]["severity"] = severity
-            user_mental_health_history[user_id]["concerns"][concern]["last_detected"] = datetime.now().isoformat()
-            
-            if not user_mental_health_history[user_id]["concerns"][concern]["first_detected"]:
-                user_mental_health_history[user_id]["concerns"][concern]["first_detected"] = datetime.now().isoformat()
-            
-            # Add to detected concerns
             detected_concerns[concern] = {
                 "severity": severity,
                 "keywords": found_keywords
             }
     
+    return detected_concerns
+
+def analyze_text(text, user_id):
+    """
+    Analyze text for mental health indicators and track changes over time.
+    
+    Args:
+        text (str or NormalizedMessage): The user's message text
+        user_id (str): Unique identifier for the user
+        
+    Returns:
+        dict: Analysis results including concerns, severity, and coping strategies
+    """
+    message = normalize(text)
+    text = message.text
+    
+    # Initialize or get user history
+    user_data = user_mental_health_history.get(user_id)
+    if user_data is None:
+        user_data = MentalHealthRecord()
+    
+    now = time.time()
+    
+    # Detect concerns and their severity
+    detected_concerns = detect_concerns(message)
+    message_severities = [0] * len(CONCERNS)
+    
+    for concern, data in detected_concerns.items():
+        # Update user history
+        i = CONCERN_INDEX[concern]
+        message_severities[i] = SEVERITY_INDEX[data["severity"]]
+        user_data.counts[i] += 1
+        user_data.severities[i] = SEVERITY_INDEX[data["severity"]]
+        user_data.last_detected[i] = now
+        
+        if not user_data.first_detected[i]:
+            user_data.first_detected[i] = now
+    
+    # Add message to history, the ring keeps the last 20 messages and updates the trend
+    user_data.add_message(now, text, message_severities)
+    
     # Prepare response with coping strategies
     response = {
         "detected_concerns": detected_concerns,
@@ -259,14 +406,12 @@ def analyze_text(text, user_id):
         severity = data["severity"]
         
         # Only provide strategies if we haven't recently provided them for this concern
-        last_provided = user_mental_health_history[user_id]["last_strategy_provided"][concern]
+        last_provided = user_data.last_strategy_provided[CONCERN_INDEX[concern]]
         should_provide = True
         
-        if last_provided:
-            last_time = datetime.fromisoformat(last_provided)
-            # Don't provide strategies for the same concern more than once per hour
-            if datetime.now() - last_time < timedelta(hours=1):
-                should_provide = False
+        # Don't provide strategies for the same concern more than once per hour
+        if last_provided and now - last_provided < STRATEGY_INTERVAL:
+            should_provide = False
         
         if should_provide and severity in COPING_STRATEGIES.get(concern, {}):
             # Get strategies for this concern and severity
@@ -276,7 +421,7 @@ def analyze_text(text, user_id):
             response["coping_strategies"][concern] = selected_strategy
             
             # Update last provided timestamp
-            user_mental_health_history[user_id]["last_strategy_provided"][concern] = datetime.now().isoformat()
+            user_data.last_strategy_provided[CONCERN_INDEX[concern]] = now
     
     # Add crisis resources for high severity concerns
     high_severity_concerns = [concern for concern, data in detected_concerns.items() 
@@ -285,45 +430,52 @@ def analyze_text(text, user_id):
     if "self_harm" in detected_concerns or high_severity_concerns:
         response["crisis_resources"] = CRISIS_RESOURCES
     
+    # Store the updated history
+    user_mental_health_history[user_id] = user_data
+    
     return response
 
 def get_mental_health_trend(user_id):
     """
     Analyze the user's mental health trend over time.
     
+    The trend is read from the values analyze_text keeps up to date, so
+    this doesn't depend on the number of messages.
+    
     Args:
         user_id (str): Unique identifier for the user
         
     Returns:
-        dict: Trend analysis for each concern
+        dict: {"trend": "insufficient_data"} for users with fewer than
+            TREND_MIN_MESSAGES messages. Otherwise "trend" maps each concern
+            to one of the other TREND_STATES, and "scores" and "slopes" map
+            each concern to its decayed severity score and the decayed change
+            of that score, as floats; callers that only read "trend" see the
+            same values as before the scores were kept
     """
-    if user_id not in user_mental_health_history:
+    user_data = user_mental_health_history.get(user_id)
+    if user_data is None:
         return {"trend": "insufficient_data"}
     
-    user_data = user_mental_health_history[user_id]
-    
     # Need at least 5 messages for trend analysis
-    if len(user_data["messages"]) < 5:
+    if len(user_data) < TREND_MIN_MESSAGES:
         return {"trend": "insufficient_data"}
     
     trends = {}
     
-    for concern, data in user_data["concerns"].items():
-        if data["count"] == 0:
+    for i, concern in enumerate(CONCERNS):
+        if user_data.counts[i] == 0:
             trends[concern] = "not_detected"
             continue
         
         # Check if concern was detected in recent messages
-        recent_messages = user_data["messages"][-3:]
-        recent_text = " ".join([msg["text"] for msg in recent_messages])
-        
-        concern_keywords = MENTAL_HEALTH_INDICATORS[concern]["keywords"]
-        recent_mentions = sum(1 for keyword in concern_keywords if keyword in recent_text.lower())
+        recent_mentions = user_data.window_counts[i]
+        severity = SEVERITIES[user_data.severities[i]]
         
         if recent_mentions > 0:
-            if data["severity"] == "high":
+            if severity == "high":
                 trends[concern] = "active_high"
-            elif data["severity"] == "medium":
+            elif severity == "medium":
                 trends[concern] = "active_medium"
             else:
                 trends[concern] = "active_low"
@@ -331,7 +483,78 @@ def get_mental_health_trend(user_id):
             # Concern was detected before but not in recent messages
             trends[concern] = "improving"
     
-    return {"trend": trends}
+    return {
+        "trend": trends,
+        "scores": dict(zip(CONCERNS, user_data.scores)),
+        "slopes": dict(zip(CONCERNS, user_data.slopes))
+    }
+
+def _trend_states(message_counts, counts, severities, window_counts):
+    """Get the TREND_STATES codes of sessions x concerns matrices with NumPy."""
+    # Severities 1-3 map onto active_low-active_high, concerns with a count always have one
+    states = np.where(window_counts > 0, TREND_STATES.index("active_low") - 1 + np.maximum(severities, 1),
+                      TREND_STATES.index("improving"))
+    states = np.where(counts == 0, TREND_STATES.index("not_detected"), states)
+    return np.where(message_counts < TREND_MIN_MESSAGES, TREND_STATES.index("insufficient_data"), states)
+
+def mental_health_trend_report(user_ids=None):
+    """
+    Summarize the mental health trends of many users at once.
+    
+    With NumPy installed the records are stacked into sessions x concerns
+    matrices and every trend is computed in a few array operations;
+    otherwise the records are summarized one by one.
+    
+    Args:
+        user_ids (list, optional): Users to include, defaults to every user in the store
+        
+    Returns:
+        dict: Number of users, and per concern the number of users in each trend
+            state, the mean decayed severity score and the number of users whose
+            score is rising
+    """
+    if user_ids is None:
+        records = [record for _, record in user_mental_health_history.items()]
+    else:
+        records = [record for record in map(user_mental_health_history.get, user_ids) if record is not None]
+    
+    report = {"users": len(records), "concerns": {}}
+    if not records:
+        return report
+    
+    if np is not None:
+        shape = (len(records), len(CONCERNS))
+        message_counts = np.fromiter((len(record) for record in records), dtype=np.int64, count=len(records))
+        counts = np.frombuffer(b"".join(record.counts.tobytes() for record in records), dtype=np.uint32).reshape(shape)
+        severities = np.frombuffer(b"".join(record.severities.tobytes() for record in records), dtype=np.uint8).reshape(shape)
+        window_counts = np.frombuffer(b"".join(record.window_counts.tobytes() for record in records), dtype=np.uint8).reshape(shape)
+        scores = np.frombuffer(b"".join(record.scores.tobytes() for record in records)).reshape(shape)
+        slopes = np.frombuffer(b"".join(record.slopes.tobytes() for record in records)).reshape(shape)
+        
+        states = _trend_states(message_counts[:, None], counts, severities, window_counts)
+        for i, concern in enumerate(CONCERNS):
+            state_counts = np.bincount(states[:, i], minlength=len(TREND_STATES))
+            report["concerns"][concern] = dict(zip(TREND_STATES, state_counts.tolist()))
+            report["concerns"][concern]["mean_score"] = float(scores[:, i].mean())
+            report["concerns"][concern]["rising"] = int((slopes[:, i] > 0).sum())
+        return report
+    
+    for i, concern in enumerate(CONCERNS):
+        summary = dict.fromkeys(TREND_STATES, 0)
+        summary["mean_score"] = sum(record.scores[i] for record in records) / len(records)
+        summary["rising"] = sum(1 for record in records if record.slopes[i] > 0)
+        for record in records:
+            if len(record) < TREND_MIN_MESSAGES:
+                state = "insufficient_data"
+            elif record.counts[i] == 0:
+                state = "not_detected"
+            elif record.window_counts[i]:
+                state = TREND_STATES[TREND_STATES.index("active_low") - 1 + max(record.severities[i], 1)]
+            else:
+                state = "improving"
+            summary[state] += 1
+        report["concerns"][concern] = summary
+    return report
 
 def format_analysis_response(analysis_result, trend_result=None):
     """
@@ -0,0 +1,46 @@
+"""
+Message pipeline module that routes a normalized message through analyzer
+stages in priority order, stopping at the first stage that produces a reply.
+"""
+
+from pattern_matcher import normalize
+
+
+class MessagePipeline:
+    """
+    Ordered list of analyzer stages evaluated lazily.
+
+    Each stage is a callable taking (message, session_id) and returning a
+    reply string, or None to pass the message on to the next stage; any
+    string, even an empty one, is a reply. Stages after the winning one
+    never run, so a high-priority match (for example a therapist request)
+    does not pay for the analyzers below it, and doesn't get the side
+    effects of the stages below it either, such as recording a mood.
+    """
+
+    def __init__(self, stages):
+        """
+        Create a pipeline.
+
+        Args:
+            stages (list): (name, stage) pairs in priority order
+        """
+        self.stages = list(stages)
+
+    def run(self, text, session_id):
+        """
+        Route a message through the stages.
+
+        Args:
+            text (str or NormalizedMessage): The user's message
+            session_id (str): Unique identifier for the session
+
+        Returns:
+            tuple: (name of the winning stage, reply), or (None, None) if no stage replied
+        """
+        message = normalize(text)
+        for name, stage in self.stages:
+            reply = stage(message, session_id)
+            if reply is not None:
+                return name, reply
+        return None, None
@@ -3,9 +3,11 @@ Mood encouragement module for detecting negative moods and providing
 encouraging quotes and lovable lines to uplift the user.
 """
 
-import re
 import random
-from datetime import datetime, timedelta
+import time
+from array import array
+from pattern_matcher import MATCHER, normalize
+from session_store import get_session_store, session_record
 
 # Patterns to identify negative moods
 NEGATIVE_MOOD_PATTERNS = {
@@ -234,6 +236,13 @@ NEGATIVE_MOOD_PATTERNS = {
     ]
 }
 
+# Negative mood patterns compiled once into the shared matcher, labelled by mood type
+NEGATIVE_MOOD_TABLE = MATCHER.register(
+    "negative_mood",
+    [pattern for patterns in NEGATIVE_MOOD_PATTERNS.values() for pattern in patterns],
+    labels=[mood_type for mood_type, patterns in NEGATIVE_MOOD_PATTERNS.items() for _ in patterns]
+)
+
 # Encouraging quotes for different moods
 ENCOURAGING_QUOTES = {
     "sadness": [
@@ -314,57 +323,113 @@ LOVABLE_LINES = {
     ]
 }
 
-# User mood tracking
-user_mood_history = {}
+# Moods in the order the per-user arrays are indexed by
+MOODS = tuple(NEGATIVE_MOOD_PATTERNS)
+MOOD_INDEX = {mood: i for i, mood in enumerate(MOODS)}
+
+# Mood entries kept per user, and seconds before encouragement for a mood is repeated
+MAX_MOODS = 20
+ENCOURAGEMENT_INTERVAL = 3600
+
+@session_record
+class MoodRecord:
+    """
+    Mood history of one user.
+
+    The last MAX_MOODS moods are kept in a fixed-size ring of parallel
+    timestamp and mood index slots, and the last encouragement per mood in
+    an array indexed like MOODS. Timestamps are epoch seconds, 0 meaning
+    never.
+    """
+
+    __slots__ = ("mood_times", "mood_types", "mood_count", "last_encouragement")
+
+    def __init__(self):
+        self.mood_times = array("d", [0.0] * MAX_MOODS)
+        self.mood_types = array("B", [0] * MAX_MOODS)
+        # Moods ever added, the next one goes to slot mood_count % MAX_MOODS
+        self.mood_count = 0
+        self.last_encouragement = array("d", [0.0] * len(MOODS))
+
+    def __len__(self):
+        return min(self.mood_count, MAX_MOODS)
+
+    def add_mood(self, timestamp, mood_type):
+        """Add a mood, replacing the oldest one once the ring is full."""
+        slot = self.mood_count % MAX_MOODS
+        self.mood_times[slot] = timestamp
+        self.mood_types[slot] = MOOD_INDEX[mood_type]
+        self.mood_count += 1
+
+    def to_state(self):
+        """Get the record as JSON compatible lists, moods oldest first."""
+        slots = [(self.mood_count - i) % MAX_MOODS for i in range(len(self), 0, -1)]
+        return [[self.mood_times[slot] for slot in slots], [MOODS[self.mood_types[slot]] for slot in slots],
+                list(self.last_encouragement)]
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a record from to_state()."""
+        record = cls()
+        times, mood_types, last_encouragement = state
+        for timestamp, mood_type in zip(times, mood_types):
+            record.add_mood(timestamp, mood_type)
+        record.last_encouragement = array("d", last_encouragement)
+        return record
+
+# User mood tracking, bounded by the session store's caps
+user_mood_history = get_session_store("mood_history")
+
+def detect_moods(text):
+    """
+    Detect negative moods in the user's message, without touching any user's history.
+
+    Args:
+        text (str or NormalizedMessage): The user's message
+
+    Returns:
+        dict: Matched patterns keyed by detected mood type
+    """
+    message = normalize(text)
+
+    detected_moods = {}
+    for index in message.hits("negative_mood"):
+        mood_type = NEGATIVE_MOOD_TABLE.labels[index]
+        if mood_type not in detected_moods:
+            detected_moods[mood_type] = []
+        detected_moods[mood_type].append(NEGATIVE_MOOD_TABLE.patterns[index])
+    return detected_moods
 
 def detect_negative_mood(text, user_id):
     """
     Detect negative moods in the user's message.
 
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
         user_id (str): Unique identifier for the user
 
     Returns:
         dict: Detection results including mood type and matched patterns
     """
-    text = text.lower()
-
     # Initialize or get user history
-    if user_id not in user_mood_history:
-        user_mood_history[user_id] = {
-            "moods": [],
-            "last_encouragement": {
-                "sadness": None,
-                "depression": None,
-                "bad_mood": None
-            }
-        }
+    user_data = user_mood_history.get(user_id)
+    if user_data is None:
+        user_data = MoodRecord()
 
     # Check for mood patterns
-    detected_moods = {}
-
-    for mood_type, patterns in NEGATIVE_MOOD_PATTERNS.items():
-        for pattern in patterns:
-            if re.search(pattern, text):
-                if mood_type not in detected_moods:
-                    detected_moods[mood_type] = []
-                detected_moods[mood_type].append(pattern)
+    detected_moods = detect_moods(text)
 
     if not detected_moods:
+        user_mood_history[user_id] = user_data
         return {"has_negative_mood": False}
 
-    # Update user mood history
-    timestamp = datetime.now().isoformat()
+    # Update user mood history, the ring keeps the last 20 mood entries
+    timestamp = time.time()
     for mood_type in detected_moods:
-        user_mood_history[user_id]["moods"].append({
-            "type": mood_type,
-            "timestamp": timestamp
-        })
+        user_data.add_mood(timestamp, mood_type)
 
-    # Limit history to last 20 mood entries
-    if len(user_mood_history[user_id]["moods"]) > 20:
-        user_mood_history[user_id]["moods"] = user_mood_history[user_id]["moods"][-20:]
+    # Store the updated history
+    user_mood_history[user_id] = user_data
 
     return {
         "has_negative_mood": True,
@@ -398,14 +463,14 @@ def get_encouragement(mood_info, user_id):
         primary_mood = "depression"
 
     # Check if we've recently provided encouragement for this mood
-    last_encouragement = user_mood_history[user_id]["last_encouragement"].get(primary_mood)
+    user_data = user_mood_history.setdefault(user_id, MoodRecord())
+    last_encouragement = user_data.last_encouragement[MOOD_INDEX[primary_mood]]
     should_provide = True
 
-    if last_encouragement:
-        last_time = datetime.fromisoformat(last_encouragement)
-        # Don't provide encouragement for the same mood more than once per hour
-        if datetime.now() - last_time < timedelta(hours=1):
-            should_provide = False
+    # Don't provide encouragement for the same mood more than once per hour
+    now = time.time()
+    if last_encouragement and now - last_encouragement < ENCOURAGEMENT_INTERVAL:
+        should_provide = False
 
     if not should_provide:
         return None
@@ -415,7 +480,8 @@ def get_encouragement(mood_info, user_id):
     lovable_line = random.choice(LOVABLE_LINES.get(primary_mood, []))
 
     # Update last encouragement timestamp
-    user_mood_history[user_id]["last_encouragement"][primary_mood] = datetime.now().isoformat()
+    user_data.last_encouragement[MOOD_INDEX[primary_mood]] = now
+    user_mood_history[user_id] = user_data
 
     return {
         "mood_type": primary_mood,
@@ -457,7 +523,7 @@ def process_mood(text, user_id):
     Process text to detect negative moods and generate encouragement.
 
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
         user_id (str): Unique identifier for the user
 
     Returns:
@@ -0,0 +1,301 @@
+"""
+Pattern matching module that compiles the analyzer pattern tables once at
+import time and finds the hits of every table in a single pass over a message.
+
+Every pattern is indexed by the literal words it cannot match without (for
+example "sad" in "i feel (?:so )?sad", or any of "therapist", "psychologist", ...
+for an alternation). A scan finds all trigger words in one Aho-Corasick pass,
+and only runs the regular expressions of the patterns they point to, so the
+cost of a message no longer grows with the number of registered patterns.
+"""
+
+import os
+import re
+import threading
+from keyword_index import KeywordIndex
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+WORD_RE = re.compile(r"\w+")
+
+
+def _word_runs(chars):
+    """Split a run of literal characters into its word-character runs."""
+    return WORD_RE.findall("".join(chars))
+
+
+def _best(candidates):
+    """Pick the most selective trigger set: longest shortest word, then fewest words."""
+    if not candidates:
+        return None
+    return max(candidates, key=lambda words: (min(len(word) for word in words), -len(words)))
+
+
+def _triggers(items):
+    """
+    Find a set of literal words of which at least one must appear in any match.
+
+    Args:
+        items: Parsed regular expression (sequence of (opcode, argument) pairs)
+
+    Returns:
+        frozenset: Trigger words, or None if the pattern has no usable literal
+    """
+    candidates = []
+    literal = []
+
+    def flush():
+        candidates.extend(frozenset([word]) for word in _word_runs(literal))
+        literal.clear()
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            literal.append(chr(av))
+            continue
+        flush()
+        if op is sre_constants.SUBPATTERN:
+            words = _triggers(av[-1])
+        elif op is sre_constants.BRANCH:
+            alternatives = [_triggers(branch) for branch in av[1]]
+            words = None if None in alternatives else frozenset().union(*alternatives)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            words = _triggers(av[2])
+        else:
+            words = None
+        if words:
+            candidates.append(words)
+    flush()
+    return _best(candidates)
+
+
+class PatternTable:
+    """
+    A compiled table of patterns belonging to one analyzer module.
+    """
+
+    def __init__(self, name, patterns, labels=None, word_boundary=False, literal=False):
+        """
+        Compile a pattern table.
+
+        Args:
+            name (str): Name of the table, used as the key in scan results
+            patterns (list): Regular expressions (or keywords when literal is True)
+            labels (list, optional): Label for each pattern, e.g. the mood type
+            word_boundary (bool): Wrap every pattern in \\b ... \\b
+            literal (bool): Treat every pattern as a plain substring
+        """
+        self.name = name
+        self.patterns = list(patterns)
+        self.labels = list(labels) if labels is not None else [None] * len(self.patterns)
+
+        self.compiled = []
+        self.triggers = []
+        for pattern in self.patterns:
+            source = re.escape(pattern) if literal else pattern
+            if word_boundary:
+                source = r'\b' + source + r'\b'
+            self.compiled.append(re.compile(source))
+            self.triggers.append(_triggers(sre_parse.parse(source)))
+
+    def matched_patterns(self, indices):
+        """Map pattern indices back to their pattern strings."""
+        return [self.patterns[index] for index in indices]
+
+
+class PatternMatcher:
+    """
+    Registry of pattern tables that finds the candidates of all of them in
+    one combined pass.
+
+    Analyzer modules register their tables at import time.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._index = {}
+        self._always = []
+        self._triggers = None
+        self._lock = threading.Lock()
+
+    def register(self, name, patterns, labels=None, word_boundary=False, literal=False):
+        """
+        Compile and register a pattern table.
+
+        Args:
+            name (str): Name of the table
+            patterns (list): Regular expressions (or keywords when literal is True)
+            labels (list, optional): Label for each pattern
+            word_boundary (bool): Wrap every pattern in \\b ... \\b
+            literal (bool): Treat every pattern as a plain substring
+
+        Returns:
+            PatternTable: The compiled table
+        """
+        table = PatternTable(name, patterns, labels, word_boundary, literal)
+        with self._lock:
+            self._tables[name] = table
+            for index, words in enumerate(table.triggers):
+                entry = (name, index, table.compiled[index])
+                if not words:
+                    self._always.append(entry)
+                    continue
+                for word in words:
+                    self._index.setdefault(word, []).append(entry)
+            self._triggers = None
+        return table
+
+    def _trigger_index(self):
+        triggers = self._triggers
+        if triggers is not None:
+            return triggers
+        with self._lock:
+            if self._triggers is None:
+                self._triggers = KeywordIndex({"triggers": self._index})
+            return self._triggers
+
+    def candidates(self, text):
+        """
+        Collect the patterns whose trigger words occur somewhere in the text.
+
+        Args:
+            text (str): The (lowercased) message
+
+        Returns:
+            dict: (index, compiled pattern) pairs to verify, keyed by table name
+        """
+        seen = set()
+        candidates = {name: [] for name in self._tables}
+        entries = list(self._always)
+        for word in self._trigger_index().scan(text)["triggers"]:
+            entries.extend(self._index[word])
+        for name, index, pattern in entries:
+            if (name, index) not in seen:
+                seen.add((name, index))
+                candidates[name].append((index, pattern))
+        for found in candidates.values():
+            found.sort(key=lambda candidate: candidate[0])
+        return candidates
+
+    def scan(self, text):
+        """
+        Find the hits of every registered table in one pass over the text.
+
+        Args:
+            text (str): The (lowercased) message
+
+        Returns:
+            dict: Sorted pattern indices keyed by table name
+        """
+        message = NormalizedMessage(text, self)
+        return {name: message.hits(name) for name in self._tables}
+
+
+class NormalizedMessage:
+    """
+    A user message normalized once and shared by every analyzer.
+
+    Holds the lowercase text and its word tokens. Pattern hits (with their
+    match spans) and keyword hits are computed on first use and cached, so
+    analyzers that never run cost nothing and analyzers that share a table
+    or keyword index share its scan.
+    """
+
+    def __init__(self, text, matcher=None):
+        """
+        Normalize a message.
+
+        Args:
+            text (str): The user's message
+            matcher (PatternMatcher, optional): Matcher to scan with, defaults to MATCHER
+        """
+        self.raw = text
+        self.text = text.lower()
+        self.tokens = WORD_RE.findall(self.text)
+        self._matcher = matcher if matcher is not None else MATCHER
+        self._candidates = None
+        self._spans = {}
+        self._keyword_hits = {}
+
+    def spans(self, name):
+        """
+        Get the matching patterns of one table with their match spans.
+
+        Args:
+            name (str): Name of the table
+
+        Returns:
+            list: (pattern index, (start, end)) pairs sorted by pattern index
+        """
+        if name not in self._spans:
+            if self._candidates is None:
+                self._candidates = self._matcher.candidates(self.text)
+            found = []
+            for index, pattern in self._candidates.get(name, ()):
+                match = pattern.search(self.text)
+                if match:
+                    found.append((index, match.span()))
+            self._spans[name] = found
+        return self._spans[name]
+
+    def set_spans(self, name, spans):
+        """
+        Store the spans of a table scanned elsewhere, for example in a worker process.
+
+        Args:
+            name (str): Name of the table
+            spans (list): Result of spans(name) for the same text
+        """
+        self._spans[name] = spans
+
+    def hits(self, name):
+        """
+        Get the matching pattern indices of one table.
+
+        Args:
+            name (str): Name of the table
+
+        Returns:
+            list: Sorted indices of the matching patterns
+        """
+        return [index for index, _ in self.spans(name)]
+
+    def keyword_hits(self, index):
+        """
+        Scan the message with a keyword index, once per index.
+
+        Args:
+            index (KeywordIndex): The keyword index
+
+        Returns:
+            dict: Set of matched keywords keyed by list name
+        """
+        if index not in self._keyword_hits:
+            self._keyword_hits[index] = index.scan(self.text)
+        return self._keyword_hits[index]
+
+
+def normalize(text):
+    """
+    Normalize a message unless it already is normalized.
+
+    Args:
+        text (str or NormalizedMessage): The user's message
+
+    Returns:
+        NormalizedMessage: The normalized message
+    """
+    return text if isinstance(text, NormalizedMessage) else NormalizedMessage(text)
+
+
+def _reset_lock_after_fork():
+    # A request thread may have held the lock when the analyzer pool forked a worker
+    MATCHER._lock = threading.Lock()
+
+
+# Shared matcher used by all analyzer modules
+MATCHER = PatternMatcher()
+os.register_at_fork(after_in_child=_reset_lock_after_fork)
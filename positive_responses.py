@@ -3,9 +3,9 @@ Positive responses module for detecting happy moods and providing
 enthusiastic, celebratory responses to reinforce positive emotions.
 """
 
-import re
 import random
 from datetime import datetime
+from pattern_matcher import MATCHER, normalize
 
 # Patterns to identify positive moods
 POSITIVE_MOOD_PATTERNS = [
@@ -201,6 +201,9 @@ POSITIVE_MOOD_PATTERNS = [
     r"today is a focused day"
 ]
 
+# Positive mood patterns compiled once into the shared matcher
+POSITIVE_MOOD_TABLE = MATCHER.register("positive_mood", POSITIVE_MOOD_PATTERNS, word_boundary=True)
+
 # Enthusiastic responses for positive moods
 POSITIVE_RESPONSES = [
     "That's fantastic! 🎉 I'm so happy to hear you're feeling good. Your positive energy is contagious!",
@@ -292,18 +295,15 @@ def detect_positive_mood(text):
     Detect positive moods in the user's message.
     
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
         
     Returns:
         dict: Detection results including matched patterns
     """
-    text = text.lower()
+    message = normalize(text)
     
     # Check for positive mood patterns
-    matches = []
-    for pattern in POSITIVE_MOOD_PATTERNS:
-        if re.search(r'\b' + pattern + r'\b', text):
-            matches.append(pattern)
+    matches = POSITIVE_MOOD_TABLE.matched_patterns(message.hits("positive_mood"))
     
     if not matches:
         return {"has_positive_mood": False}
@@ -353,7 +353,7 @@ def process_positive_mood(text):
     Process text to detect positive moods and generate enthusiastic responses.
     
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
         
     Returns:
         dict: Processing results including detection and response
@@ -0,0 +1,243 @@
+"""
+Logging module that writes log records as JSON lines from a background
+thread, so request threads only queue them, and logs chat requests as
+sampled summaries with their bodies only at DEBUG level.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line, with the structured fields it carries."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that drops records instead of blocking when its queue is full.
+
+    Records are queued as they are, without formatting them on the logging
+    thread; stats counts the records queued and dropped.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        # Counted without a lock, so they can be slightly off under contention
+        self.stats = {"queued": 0, "dropped": 0}
+
+    def prepare(self, record):
+        # The queue stays in this process, so the listener thread can do all the formatting;
+        # only merge %-style arguments now, before the objects they refer to change
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.stats["queued"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+
+class DropReportingListener(logging.handlers.QueueListener):
+    """Queue listener that logs a warning with the number of records dropped since its last one."""
+
+    def __init__(self, log_queue, queue_handler, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self._reported = 0
+
+    def handle(self, record):
+        dropped = self.queue_handler.stats["dropped"]
+        if dropped > self._reported:
+            warning = logging.makeLogRecord({
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Dropped {dropped - self._reported} log records, the log queue was full",
+                "fields": {"dropped_total": dropped}
+            })
+            self._reported = dropped
+            super().handle(warning)
+        super().handle(record)
+
+
+class RequestLogger:
+    """
+    Logger for chat requests.
+
+    info() logs one summary record per request, for a sample_rate share of
+    requests; debug() logs request and reply bodies, and only builds them
+    when DEBUG level is enabled. Warnings and errors are logged as usual.
+    stats counts the summaries sampled out.
+    """
+
+    def __init__(self, logger, sample_rate=1.0):
+        """
+        Create a request logger.
+
+        Args:
+            logger (logging.Logger): Logger the records go to
+            sample_rate (float): Share of request summaries logged, between 0 and 1
+        """
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.stats = {"sampled_out": 0}
+
+    def info(self, message, **fields):
+        """
+        Log a request summary, if the request is sampled.
+
+        Args:
+            message (str): Summary message
+            **fields: Structured fields of the record
+        """
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self.stats["sampled_out"] += 1
+            return
+        self.logger.info(message, extra={"fields": fields})
+
+    def debug(self, message, build_fields):
+        """
+        Log request or reply bodies, if DEBUG level is enabled.
+
+        Args:
+            message (str): Record message
+            build_fields (callable): Returns the record's fields, only called when the record is logged
+        """
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(message, extra={"fields": build_fields()})
+
+
+_listener = None
+_listener_pid = None
+_queue_handler = None
+_request_logger = None
+_logging_lock = threading.Lock()
+
+
+def start_logging():
+    """
+    Send the root logger's records through a queue to a background writer thread.
+
+    Replaces the root logger's handlers; safe to call more than once, and
+    starts a new writer in a forked process, whose parent's writer thread
+    didn't survive the fork.
+
+    Environment variables:
+        LOG_LEVEL: Root logger level (default INFO), DEBUG also logs request and reply bodies
+        LOG_FORMAT: json or text (default json)
+        LOG_QUEUE_SIZE: Records queued before new ones are dropped (default 10000)
+
+    Returns:
+        logging.handlers.QueueListener: The running listener
+    """
+    global _listener, _listener_pid, _queue_handler
+    with _logging_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return _listener
+
+        output = logging.StreamHandler(sys.stderr)
+        if os.getenv("LOG_FORMAT", "json") == "text":
+            output.setFormatter(logging.Formatter(TEXT_FORMAT))
+        else:
+            output.setFormatter(JsonFormatter())
+
+        log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+        handler = DroppingQueueHandler(log_queue)
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+        if _listener is None:
+            # Write out what's still queued when the process exits
+            atexit.register(stop_logging)
+        _queue_handler = handler
+        _listener = DropReportingListener(log_queue, handler, output)
+        _listener.start()
+        _listener_pid = os.getpid()
+        return _listener
+
+
+def stop_logging():
+    """Write out the queued records and stop the writer thread, if this process started one."""
+    global _listener
+    with _logging_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            _listener = None
+
+
+def _restart_after_fork():
+    # A forked child, such as a restarted analyzer pool's worker, has no writer thread, and another
+    # thread may have held the queue's or this module's lock when the parent forked: give it its own
+    global _logging_lock
+    _logging_lock = threading.Lock()
+    if _listener is not None:
+        start_logging()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def logging_stats():
+    """
+    Get the counters of the logging queue and the request logger.
+
+    Returns:
+        dict: Records queued, dropped and sampled out
+    """
+    stats = {"queued": 0, "dropped": 0, "sampled_out": 0}
+    if _queue_handler is not None:
+        stats.update(_queue_handler.stats)
+    if _request_logger is not None:
+        stats.update(_request_logger.stats)
+    return stats
+
+
+def get_request_logger():
+    """
+    Get the shared chat request logger, creating it from the environment on first use.
+
+    Environment variables:
+        LOG_SAMPLE_RATE: Share of chat request summaries logged (default 1)
+
+    Returns:
+        RequestLogger: The shared request logger
+    """
+    global _request_logger
+    with _logging_lock:
+        if _request_logger is None:
+            _request_logger = RequestLogger(
+                logging.getLogger("chat.requests"),
+                sample_rate=float(os.getenv("LOG_SAMPLE_RATE", 1))
+            )
+        return _request_logger
@@ -0,0 +1,178 @@
+"""
+Serving module that runs one of the chat backends under a production WSGI
+server instead of Flask's development server.
+
+Usage:
+    python serve.py llama_api --bind 0.0.0.0:5000
+    python serve.py app --workers 1 --threads 32
+
+Under gunicorn, send SIGHUP to the master process to reload the code and
+replace the workers gracefully, without dropping connections.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+try:
+    import gunicorn.app.base
+except ImportError:  # Only needed for the gunicorn server
+    gunicorn = None
+
+try:
+    import waitress
+except ImportError:  # Only needed for the waitress server
+    waitress = None
+
+# Backends by name: the modules defining a Flask app
+BACKENDS = ("app", "gpti", "llama_api")
+
+# Message run through every analyzer once before serving, so the first user doesn't pay for it
+WARM_UP_MESSAGE = "Hi, I feel sad and anxious today, can you recommend a therapist, a morning routine or a song?"
+
+
+def default_workers():
+    """
+    Get the default number of worker processes.
+
+    Every worker keeps its own copy of in-memory session state, so several
+    workers only serve a conversation consistently when sessions are
+    shared through Redis; otherwise one worker with many threads is used.
+
+    Returns:
+        int: One worker per CPU with the redis session store, else 1
+    """
+    if os.getenv("SESSION_STORE_BACKEND", "memory") == "redis":
+        return os.cpu_count() or 1
+    return 1
+
+
+def default_threads():
+    """
+    Get the default number of threads per worker.
+
+    Chat turns mostly wait on the model endpoint, so a worker needs many
+    more threads than there are CPUs.
+
+    Returns:
+        int: Four threads per CPU, between 8 and 64
+    """
+    return min(64, max(8, 4 * (os.cpu_count() or 1)))
+
+
+def load_backend(name):
+    """
+    Import a backend and warm up its analyzers.
+
+    Importing a backend imports every analyzer module it uses and compiles
+    their patterns; running a message through the shared pattern matcher
+    then builds its lazily created keyword automaton.
+
+    Args:
+        name (str): Backend module name, one of BACKENDS
+
+    Returns:
+        flask.Flask: The backend's app
+    """
+    module = importlib.import_module(name)
+    from pattern_matcher import MATCHER
+    MATCHER.scan(WARM_UP_MESSAGE.lower())
+    logging.info(f"Loaded and warmed up the {name} backend in process {os.getpid()}")
+    return module.app
+
+
+if gunicorn is not None:
+    class GunicornServer(gunicorn.app.base.BaseApplication):
+        """Gunicorn application loading a chat backend in every worker."""
+
+        def __init__(self, backend, options):
+            self.backend = backend
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Workers load the backend themselves: the backends start background
+            # threads on import, which wouldn't survive a fork from a preloaded master
+            return load_backend(self.backend)
+
+
+def serve(backend, bind="0.0.0.0:5000", server=None, workers=None, threads=None, keep_alive=5, timeout=60,
+          graceful_timeout=30, max_requests=0, reload=False):
+    """
+    Serve a backend until interrupted.
+
+    Args:
+        backend (str): Backend module name, one of BACKENDS
+        bind (str): host:port to listen on
+        server (str, optional): "gunicorn" or "waitress", defaults to gunicorn where it's installed
+        workers (int, optional): Worker processes, see default_workers() (gunicorn only)
+        threads (int, optional): Threads per worker, see default_threads()
+        keep_alive (int): Seconds an idle keep-alive connection is kept open
+        timeout (int): Seconds a worker may be silent before it's restarted
+        graceful_timeout (int): Seconds workers get to finish their requests on reload or shutdown
+        max_requests (int): Requests after which a worker is replaced, 0 never (gunicorn only)
+        reload (bool): Restart the workers when the code changes, for development (gunicorn only)
+
+    Raises:
+        RuntimeError: If neither gunicorn nor waitress is installed
+    """
+    if server is None:
+        server = "gunicorn" if gunicorn is not None else "waitress"
+    workers = workers or default_workers()
+    threads = threads or default_threads()
+
+    if server == "gunicorn":
+        if gunicorn is None:
+            raise RuntimeError("Serving with gunicorn needs the gunicorn package: pip install gunicorn")
+        logging.info(f"Serving {backend} on {bind} with gunicorn, {workers} workers x {threads} threads")
+        GunicornServer(backend, {
+            "bind": bind,
+            "workers": workers,
+            "worker_class": "gthread",
+            "threads": threads,
+            "keepalive": keep_alive,
+            "timeout": timeout,
+            "graceful_timeout": graceful_timeout,
+            "max_requests": max_requests,
+            "max_requests_jitter": max_requests // 10,
+            "reload": reload
+        }).run()
+    elif server == "waitress":
+        if waitress is None:
+            raise RuntimeError("Serving needs gunicorn or waitress: pip install gunicorn (or waitress on Windows)")
+        app = load_backend(backend)
+        logging.info(f"Serving {backend} on {bind} with waitress, {threads} threads")
+        waitress.serve(app, listen=bind, threads=threads, channel_timeout=timeout)
+    else:
+        raise ValueError(f"Unknown server {server}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Serve a chat backend with a production WSGI server.")
+    parser.add_argument("backend", choices=BACKENDS)
+    parser.add_argument("--bind", default=f"0.0.0.0:{os.getenv('PORT', 5000)}", help="host:port to listen on")
+    parser.add_argument("--server", choices=("gunicorn", "waitress"), help="default: gunicorn if installed")
+    parser.add_argument("--workers", type=int, help="worker processes (default: see default_workers)")
+    parser.add_argument("--threads", type=int, help="threads per worker (default: 4 per CPU, 8 to 64)")
+    parser.add_argument("--keep-alive", type=int, default=5, help="idle keep-alive seconds")
+    parser.add_argument("--timeout", type=int, default=60, help="seconds before a stuck worker is restarted")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds to finish requests on reload")
+    parser.add_argument("--max-requests", type=int, default=0, help="requests before a worker is replaced")
+    parser.add_argument("--reload", action="store_true", help="restart workers on code changes")
+    args = parser.parse_args()
+
+    # The backends live next to this file
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    serve(args.backend, args.bind, args.server, args.workers, args.threads, args.keep_alive, args.timeout,
+          args.graceful_timeout, args.max_requests, args.reload)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,369 @@
+"""
+Static file server for the frontend.
+
+Serves the project directory from a threading server with HTTP/1.1
+keep-alive. Files are kept in memory, with gzip and brotli copies of text
+files compressed once, and reloaded when their modification time changes;
+responses carry ETag and Last-Modified headers so browsers revalidate with
+a 304 instead of downloading a file again. Files too large to keep in
+memory are streamed from disk with sendfile.
+
+Usage:
+    python server.py --port 8000
+"""
+
+import argparse
+import email.utils
+import gzip
 import http.server
-import socketserver
-import os
 import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
+from stat import S_ISREG
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+try:
+    import brotli
+except ImportError:  # Only needed for brotli-compressed responses
+    brotli = None
 
-# Define the port
+# Port the frontend is served on by default
 PORT = 8000
 
-# Change directory to the current directory
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+# Content types worth compressing
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
 
-# Create a simple HTTP server
-Handler = http.server.SimpleHTTPRequestHandler
-Handler.extensions_map.update({
-    '.html': 'text/html',
-    '.js': 'application/javascript',
-    '.css': 'text/css',
-})
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 15
 
-# Create the server
-httpd = socketserver.TCPServer(("", PORT), Handler)
 
-# Print server information
-logging.info(f"Serving at http://localhost:{PORT}")
-logging.info(f"Open http://localhost:{PORT}/index.html in your browser")
+def precompress(body, content_type, min_bytes=1024):
+    """
+    Compress a response body once, for every content coding worth sending.
 
-# Start the server
-try:
-    httpd.serve_forever()
-except KeyboardInterrupt:
-    logging.info("Server stopped by user")
-    httpd.server_close()
+    Args:
+        body (bytes): The uncompressed body
+        content_type (str): The body's content type
+        min_bytes (int): Smallest body compressed
+
+    Returns:
+        dict: Content coding ("gzip", or "br" if brotli is installed) -> compressed body
+    """
+    encoded = {}
+    if len(body) >= min_bytes and content_type.startswith(COMPRESSIBLE_TYPES):
+        encoded["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            encoded["br"] = brotli.compress(body, quality=11)
+    # Keep only the copies that are worth sending
+    return {coding: data for coding, data in encoded.items() if len(data) < len(body) * 0.9}
+
+
+class CachedFile:
+    """A file's contents, precompressed copies and validators, as of one modification time."""
+
+    __slots__ = ("path", "mtime_ns", "size", "content_type", "body", "encoded", "etags", "last_modified")
+
+    def __init__(self, path, stat, content_type, body, encoded):
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.content_type = content_type
+        # None for files streamed from disk
+        self.body = body
+        # content coding -> compressed body
+        self.encoded = encoded
+        tag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        self.etags = {None: f'"{tag}"'}
+        self.etags.update((coding, f'"{tag}-{coding}"') for coding in encoded)
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+
+    def nbytes(self):
+        return len(self.body or b"") + sum(len(body) for body in self.encoded.values())
+
+
+class StaticFileCache:
+    """
+    In-memory cache of static files, invalidated by modification time.
+
+    Every lookup stats the file and reloads it if its modification time or
+    size changed. Files up to max_file_bytes are held in memory together
+    with gzip and, if the brotli package is installed, brotli copies of
+    compressible ones; larger files are only described, to be streamed from
+    disk. The least recently used files are evicted beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_file_bytes=1024 * 1024, min_compress_bytes=1024):
+        """
+        Create an empty cache.
+
+        Args:
+            max_bytes (int): Most bytes of file contents and compressed copies kept
+            max_file_bytes (int): Largest file kept in memory
+            min_compress_bytes (int): Smallest file compressed
+        """
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.min_compress_bytes = min_compress_bytes
+        self.stats = {"hits": 0, "loads": 0}
+
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, content_type):
+        """
+        Get a file, loading it if it isn't cached or changed on disk.
+
+        Args:
+            path (str): Filesystem path of the file
+            content_type (str): The file's content type
+
+        Returns:
+            CachedFile: The file, or None if it isn't a regular file
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not S_ISREG(stat.st_mode):
+            return None
+
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+                self._files.move_to_end(path)
+                self.stats["hits"] += 1
+                return cached
+
+        cached = self._load(path, stat, content_type)
+        with self._lock:
+            self.stats["loads"] += 1
+            previous = self._files.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes()
+            self._files[path] = cached
+            self._bytes += cached.nbytes()
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                _, evicted = self._files.popitem(last=False)
+                self._bytes -= evicted.nbytes()
+        return cached
+
+    def _load(self, path, stat, content_type):
+        if stat.st_size > self.max_file_bytes:
+            return CachedFile(path, stat, content_type, None, {})
+        with open(path, "rb") as f:
+            body = f.read()
+            # The file may have changed since it was stat'ed: describe what was read
+            stat = os.fstat(f.fileno())
+
+        encoded = precompress(body, content_type, self.min_compress_bytes)
+        return CachedFile(path, stat, content_type, body, encoded)
+
+
+def accepted_encodings(header):
+    """
+    Parse an Accept-Encoding header.
+
+    Args:
+        header (str): The header value
+
+    Returns:
+        set: Content codings the client accepts
+    """
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def etag_matches(header, etags):
+    """
+    Check an If-None-Match header against the ETags of a resource's representations.
+
+    Args:
+        header (str): The header value
+        etags (iterable): The resource's ETags
+
+    Returns:
+        bool: True if the client has a current representation
+    """
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or not tags.isdisjoint(etags)
+
+
+def preferred_encoding(header, encoded):
+    """
+    Pick the content coding to send a precompressed body in.
+
+    Args:
+        header (str): The request's Accept-Encoding header
+        encoded (dict): Content coding -> compressed body, as returned by precompress()
+
+    Returns:
+        str: "br" or "gzip", or None to send the body uncompressed
+    """
+    accepted = accepted_encodings(header)
+    return next((coding for coding in ("br", "gzip") if coding in encoded and coding in accepted), None)
+
+
+class CachingHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Request handler serving files from the server's StaticFileCache over HTTP/1.1.
+
+    Directory listings, redirects and errors are left to SimpleHTTPRequestHandler.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = KEEP_ALIVE_TIMEOUT
+    # Headers and body are separate writes: with Nagle's algorithm the body would wait for
+    # the client's delayed ACK of the headers on every keep-alive request
+    disable_nagle_algorithm = True
+    extensions_map = dict(http.server.SimpleHTTPRequestHandler.extensions_map, **{
+        '.html': 'text/html',
+        '.js': 'application/javascript',
+        '.css': 'text/css',
+    })
+
+    def do_GET(self):
+        if not self.serve_cached(send_body=True):
+            super().do_GET()
+
+    def do_HEAD(self):
+        if not self.serve_cached(send_body=False):
+            super().do_HEAD()
+
+    def serve_cached(self, send_body):
+        """
+        Serve the requested file from the cache.
+
+        Args:
+            send_body (bool): False to send only the headers, for HEAD requests
+
+        Returns:
+            bool: False if the path isn't a file, or a directory with an index.html
+        """
+        path = self.translate_path(self.path)
+        if path.endswith("/") or os.path.isdir(path):
+            if not self.path.split("?", 1)[0].endswith("/"):
+                # Let the base class redirect to the path with a slash
+                return False
+            path = os.path.join(path, "index.html")
+        content_type = self.guess_type(path)
+        cached = self.server.cache.get(path, content_type)
+        if cached is None:
+            return False
+
+        coding = preferred_encoding(self.headers.get("Accept-Encoding", ""), cached.encoded)
+
+        if self.not_modified(cached):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_validators(cached, coding)
+            self.end_headers()
+            return True
+
+        body = cached.encoded[coding] if coding else cached.body
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body) if body is not None else cached.size))
+        if coding:
+            self.send_header("Content-Encoding", coding)
+        self.send_validators(cached, coding)
+        self.end_headers()
+        if not send_body:
+            return True
+
+        if body is not None:
+            self.wfile.write(body)
+        else:
+            with open(path, "rb") as f:
+                # Copies the file to the socket in the kernel where the platform supports it
+                self.connection.sendfile(f, count=cached.size)
+        return True
+
+    def not_modified(self, cached):
+        """
+        Check the request's validators against a file.
+
+        Args:
+            cached (CachedFile): The requested file
+
+        Returns:
+            bool: True if the client's copy is current
+        """
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag_matches(if_none_match, cached.etags.values())
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, IndexError, OverflowError, ValueError):
+                return False
+            return cached.mtime_ns // 1_000_000_000 <= since
+        return False
+
+    def send_validators(self, cached, coding):
+        self.send_header("ETag", cached.etags[coding])
+        self.send_header("Last-Modified", cached.last_modified)
+        # Revalidate on every use, which costs a 304 while the file is unchanged
+        self.send_header("Cache-Control", "no-cache")
+        if cached.encoded:
+            self.send_header("Vary", "Accept-Encoding")
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+def create_server(port=PORT, directory=None, cache=None, host=""):
+    """
+    Create a static file server; call serve_forever() on it to start serving.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free port
+        directory (str, optional): Directory to serve, defaults to the directory of this file
+        cache (StaticFileCache, optional): Cache to serve from, defaults to a new one
+        host (str): Address to listen on, all interfaces by default
+
+    Returns:
+        http.server.ThreadingHTTPServer: The server, with the cache as its cache attribute
+    """
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    httpd = http.server.ThreadingHTTPServer((host, port), partial(CachingHTTPRequestHandler, directory=directory))
+    httpd.daemon_threads = True
+    httpd.cache = cache or StaticFileCache()
+    return httpd
+
+
+def main():
+    # Set up logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Serve the frontend.")
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+
+    httpd = create_server(args.port)
+
+    # Print server information
+    logging.info(f"Serving at http://localhost:{args.port}")
+    logging.info(f"Open http://localhost:{args.port}/index.html in your browser")
+
+    # Start the server
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Server stopped by user")
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Session expiry module that removes idle sessions from every session store on
+a background thread, off the request path.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from session_store import session_stores
+
+
+class ExpiryScheduler:
+    """
+    Background thread that expires idle sessions.
+
+    Every session store sits in a min-heap keyed by the time its least
+    recently used session expires. The thread sleeps until the earliest of
+    those times, expires that store and pushes it back keyed by its new
+    earliest expiry. Using a session only postpones its expiry, so a key is
+    never later than the real expiry; at worst the thread wakes early and
+    finds nothing to remove. Each wake-up costs O(log stores) plus the
+    sessions actually removed, no matter how many sessions are active.
+    """
+
+    def __init__(self, resolution=1.0, poll_interval=60.0):
+        """
+        Create a scheduler.
+
+        Args:
+            resolution (float): Minimum seconds between two expiry runs of the same
+                store, so sessions expiring close together are removed in one run
+            poll_interval (float): Maximum seconds between checks for new stores
+        """
+        self.resolution = resolution
+        self.poll_interval = poll_interval
+        self.stats = {"runs": 0, "expired": 0}
+
+        # (due time, tie breaker, store)
+        self._heap = []
+        self._scheduled = set()
+        self._counter = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _push(self, store, due):
+        heapq.heappush(self._heap, (due, next(self._counter), store))
+
+    def _schedule_new_stores(self, now):
+        for store in session_stores():
+            if id(store) not in self._scheduled:
+                self._scheduled.add(id(store))
+                self._push(store, now)
+
+    def run_pending(self):
+        """
+        Expire the stores whose earliest session expiry has passed.
+
+        Returns:
+            int: Number of sessions removed
+        """
+        now = time.monotonic()
+        self._schedule_new_stores(now)
+
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, _, store = heapq.heappop(self._heap)
+            count = store.expire()
+            if count:
+                logging.info(f"Expired {count} idle sessions from {store.name}, {len(store)} left")
+            removed += count
+
+            # An empty store can't expire anything sooner than one TTL from now
+            due = store.next_expiry()
+            self._push(store, max(due if due is not None else now + store.ttl, now + self.resolution))
+
+        self.stats["runs"] += 1
+        self.stats["expired"] += removed
+        return removed
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logging.error(f"Error expiring sessions: {e}", exc_info=True)
+
+            wait = self.poll_interval
+            if self._heap:
+                wait = min(wait, max(0.0, self._heap[0][0] - time.monotonic()))
+            self._stop.wait(wait)
+
+    def start(self):
+        """Start the background thread unless it's already running."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-expiry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_session_expiry():
+    """
+    Start the shared expiry scheduler, creating it from the environment on first use.
+
+    Environment variables:
+        SESSION_EXPIRY_RESOLUTION: Minimum seconds between expiry runs of a store (default 1)
+
+    Returns:
+        ExpiryScheduler: The running scheduler
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ExpiryScheduler(resolution=float(os.getenv("SESSION_EXPIRY_RESOLUTION", 1)))
+            _scheduler.start()
+        return _scheduler
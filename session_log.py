@@ -0,0 +1,398 @@
+"""
+Session log module that appends every chat turn, with the session state it
+changed, to durable segment files, and replays them on startup to rebuild
+the session stores after a restart.
+"""
+
+import hashlib
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from session_store import decode_state, encode_state, get_session_store, session_stores
+
+# Each record is framed by its body length, the body's CRC32, the time it was
+# appended and the lengths of the session id and store name the body starts
+# with; the JSON payload follows them. A turn's own record has an empty store name
+FRAME_HEADER = struct.Struct("<IIdHH")
+SEGMENT_SUFFIX = ".log"
+
+# (session, store) pairs whose last logged state the writer remembers, to skip logging it again unchanged
+LOGGED_STATES = 100000
+
+# Times the writer serializes a record whose state a request thread keeps changing before dropping it
+ENCODE_ATTEMPTS = 3
+
+
+class SessionLog:
+    """
+    Append-only log of chat turns split into segment files.
+
+    Every turn is logged as a record of its own, followed by one record per
+    session store whose state for the session changed since it was last
+    logged. Records are framed by their length, a CRC32, their time, the
+    session id and the store name, so replay can find the latest state of
+    each session's stores without parsing the ones before it. Request
+    threads only queue the turn, holding the live session state; a writer
+    thread serializes and frames everything queued since its last commit,
+    skips the states that haven't changed, writes the rest and fsyncs once
+    for the whole batch, so under load many turns share one fsync and
+    request threads don't spend time encoding JSON.
+
+    A segment is closed and a new one started once it reaches
+    segment_bytes, and segments not written to for longer than retention
+    seconds are deleted when a segment rolls; a state that hasn't changed
+    for half of retention is logged again, so it outlives its segment.
+    Segment names carry the writing process id, so the workers of a
+    multi-process server can share a directory without sharing segments.
+    """
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, retention=86400):
+        """
+        Open a log, starting a new segment after the existing ones.
+
+        Args:
+            directory (str): Directory holding the segment files
+            segment_bytes (int): Size at which a segment is closed and a new one started
+            retention (float): Seconds a closed segment is kept after its last write
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention = retention
+        self.stats = {"records": 0, "commits": 0, "bytes": 0}
+
+        os.makedirs(directory, exist_ok=True)
+        self._sequence = 0
+        self._segment = None
+        self._segment_size = 0
+        # (session id, store name) -> (digest, time) of the state last logged
+        self._logged = OrderedDict()
+        self._roll()
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="session-log", daemon=True)
+        self._thread.start()
+
+    def _roll(self):
+        if self._segment is not None:
+            self._segment.close()
+        # Other workers may have started segments since this one did, keep the sequence ahead of theirs
+        segments = segment_paths(self.directory)
+        self._sequence = max([self._sequence] + [segment_name(path)[0] for path in segments]) + 1
+        pid = os.getpid()
+        self._segment = open(os.path.join(self.directory, f"{self._sequence:08d}-{pid}{SEGMENT_SUFFIX}"), "ab")
+        self._segment_size = 0
+
+        cutoff = time.time() - self.retention
+        for old in segments:
+            writer = segment_name(old)[1]
+            # Another live worker may still be writing its segment, however long it has been idle
+            if writer not in (None, pid) and _process_exists(writer):
+                continue
+            try:
+                if os.path.getmtime(old) < cutoff:
+                    os.remove(old)
+            except FileNotFoundError:
+                # Another worker deleted it first
+                pass
+
+    def append(self, session_id, turn, state):
+        """
+        Queue a turn and its session's state for the next group commit.
+
+        Args:
+            session_id (str): Unique identifier for the session the turn belongs to
+            turn (dict): JSON compatible record of the turn
+            state (dict): Session state by store name, None for stores without any, serialized by the writer thread
+        """
+        self._queue.put((time.time(), session_id, turn, state))
+
+    def _frames(self, created, session_id, turn, state):
+        # The turn's record, then the records of the stores whose state changed since they were last logged
+        frames = [_frame(created, session_id, "", encode_state(turn).encode("utf-8"))]
+        for name, value in state.items():
+            try:
+                payload = _encode(value)
+            except Exception as e:
+                logging.error(f"Error serializing the {name} state of session {session_id}: {e}")
+                continue
+            key = (session_id, name)
+            digest = hashlib.blake2b(payload, digest_size=16).digest()
+            logged = self._logged.get(key)
+            if logged is not None:
+                self._logged.move_to_end(key)
+                if logged[0] == digest and created - logged[1] < self.retention / 2:
+                    continue
+            self._logged[key] = (digest, created)
+            if len(self._logged) > LOGGED_STATES:
+                self._logged.popitem(last=False)
+            frames.append(_frame(created, session_id, name, payload))
+        return frames
+
+    def flush(self, timeout=None):
+        """
+        Wait until every record queued so far is written and fsynced.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most
+
+        Returns:
+            bool: Whether the records were committed in time
+        """
+        committed = threading.Event()
+        self._queue.put(committed)
+        return committed.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Everything queued while the last batch was being written joins this commit
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiters = []
+            stop = False
+            try:
+                for item in batch:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        try:
+                            frames = self._frames(*item)
+                        except Exception as e:
+                            logging.error(f"Error serializing the session log record of {item[1]}: {e}")
+                            continue
+                        if self._segment_size >= self.segment_bytes:
+                            self._segment.flush()
+                            os.fsync(self._segment.fileno())
+                            self._roll()
+                        for frame in frames:
+                            self._segment.write(frame)
+                            self._segment_size += len(frame)
+                            self.stats["bytes"] += len(frame)
+                        self.stats["records"] += len(frames)
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+                self.stats["commits"] += 1
+            except Exception as e:
+                # States remembered as logged may not have been written, log them all again from now on
+                self._logged.clear()
+                logging.error(f"Error writing session log: {e}", exc_info=True)
+
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._segment.close()
+                return
+
+    def close(self):
+        """Commit the queued records and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def _encode(value):
+    for attempt in range(ENCODE_ATTEMPTS):
+        try:
+            return encode_state(value).encode("utf-8")
+        except RuntimeError:
+            # A request thread changed the session state while it was serialized
+            if attempt == ENCODE_ATTEMPTS - 1:
+                raise
+
+
+def _frame(created, session_id, store, payload):
+    session_key = session_id.encode("utf-8")
+    store_key = store.encode("utf-8")
+    body = session_key + store_key + payload
+    return FRAME_HEADER.pack(len(body), zlib.crc32(body), created, len(session_key), len(store_key)) + body
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def segment_name(path):
+    """
+    Parse the name of a segment file.
+
+    Args:
+        path (str): Path of the segment file
+
+    Returns:
+        tuple: (sequence number, id of the process writing it, None for segments named without one)
+    """
+    sequence, _, pid = os.path.basename(path)[:-len(SEGMENT_SUFFIX)].partition("-")
+    return int(sequence), int(pid) if pid else None
+
+
+def segment_paths(directory):
+    """
+    Get the segment files of a log in write order.
+
+    Args:
+        directory (str): Directory holding the segment files
+
+    Returns:
+        list: Paths of the segments, oldest first
+    """
+    names = [name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)]
+    paths = [os.path.join(directory, name) for name in names]
+    return sorted(paths, key=segment_name)
+
+
+def read_segment(path):
+    """
+    Read the records of a segment.
+
+    Reading stops at the first incomplete or corrupt record, which is where
+    a crash interrupted the last write.
+
+    Args:
+        path (str): Path of the segment file
+
+    Yields:
+        tuple: (time, session id, store name, JSON payload bytes) of each record in write order,
+            with an empty store name for a turn's own record
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = 0
+    while offset + FRAME_HEADER.size <= len(data):
+        length, checksum, created, id_length, store_length = FRAME_HEADER.unpack_from(data, offset)
+        start = offset + FRAME_HEADER.size
+        body = data[start:start + length]
+        if len(body) < length or zlib.crc32(body) != checksum:
+            logging.warning(f"Session log {path} ends with a torn record at byte {offset}")
+            return
+        store_end = id_length + store_length
+        yield created, body[:id_length].decode("utf-8"), body[id_length:store_end].decode("utf-8"), body[store_end:]
+        offset = start + length
+
+
+def replay(directory):
+    """
+    Rebuild the session stores from the records in a log.
+
+    Only the latest record of each session's stores is parsed and loaded,
+    the latest by the time it was appended, since workers write segments
+    side by side. Sessions whose last turn is older than a store's TTL are
+    skipped, since they would have expired, and so are stores whose latest
+    record says the session had no state in them.
+
+    Args:
+        directory (str): Directory holding the segment files
+
+    Returns:
+        tuple: (turns read, sessions restored)
+    """
+    if not os.path.isdir(directory):
+        return 0, 0
+
+    turns = 0
+    latest = {}
+    last_used = {}
+    for path in segment_paths(directory):
+        for created, session_id, store, payload in read_segment(path):
+            last_used[session_id] = max(created, last_used.get(session_id, created))
+            if not store:
+                turns += 1
+                continue
+            previous = latest.get((session_id, store))
+            if previous is None or created >= previous[0]:
+                latest[(session_id, store)] = (created, payload)
+
+    # Restore the sessions in least recently used order
+    now = time.time()
+    restored = set()
+    for (session_id, name), (_, payload) in sorted(latest.items(), key=lambda item: last_used[item[0][0]]):
+        store = get_session_store(name)
+        if now - last_used[session_id] > store.ttl:
+            continue
+        state = decode_state(payload.decode("utf-8"))
+        if state is not None:
+            store[session_id] = state
+            restored.add(session_id)
+    return turns, len(restored)
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def start_session_log():
+    """
+    Replay the session log and open it for new turns, if SESSION_LOG_DIR is set.
+
+    Environment variables:
+        SESSION_LOG_DIR: Directory of the log segments, logging is off when unset
+        SESSION_LOG_SEGMENT_BYTES: Size at which a segment rolls (default 16 MB)
+        SESSION_TTL: Seconds closed segments are kept (default 86400)
+
+    Returns:
+        SessionLog: The shared log, or None if logging is off
+    """
+    global _log
+    directory = os.getenv("SESSION_LOG_DIR")
+    if not directory:
+        return None
+
+    with _log_lock:
+        if _log is None:
+            start = time.perf_counter()
+            turns, sessions = replay(directory)
+            logging.info(f"Replayed {turns} turns of {sessions} sessions from {directory} "
+                         f"in {time.perf_counter() - start:.3f}s")
+
+            _log = SessionLog(
+                directory,
+                segment_bytes=int(os.getenv("SESSION_LOG_SEGMENT_BYTES", 16 * 1024 * 1024)),
+                retention=float(os.getenv("SESSION_TTL", 86400))
+            )
+        return _log
+
+
+def log_turn(session_id, message, reply, stage=None):
+    """
+    Append a chat turn and the session state it changed to the session log.
+
+    The state of every store is queued as it is, and the log's writer
+    thread only writes the stores whose state changed since they were last
+    logged; it may already include changes of the session's next turns,
+    which are logged after it anyway.
+    Does nothing unless start_session_log() opened the log.
+
+    Args:
+        session_id (str): Unique identifier for the session
+        message (str): The user's message
+        reply (str): The bot's reply
+        stage (str, optional): Name of the analyzer stage that produced the reply
+    """
+    if _log is None:
+        return
+
+    # Stores without state for the session are logged as None, so a deleted state isn't restored
+    state = {store.name: store.get(session_id) for store in session_stores()}
+    _log.append(session_id, {
+        "session_id": session_id,
+        "message": message,
+        "reply": reply,
+        "stage": stage
+    }, state)
@@ -0,0 +1,917 @@
+"""
+Session store module that keeps per-session state in bounded memory, with
+least-recently-used and idle-timeout eviction, or in Redis so that several
+worker processes share it, or in memory backed by SQLite so that it survives
+restarts.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+try:
+    import redis
+except ImportError:  # Only needed for the redis backend
+    redis = None
+
+_MISSING = object()
+
+
+def estimate_size(value):
+    """
+    Estimate the memory held by a session value.
+
+    Counts the containers and the strings, numbers and other leaves they
+    hold, which is what session state is made of.
+
+    Args:
+        value: A session value built from dicts, lists, tuples and scalars
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key) + estimate_size(item)
+    elif isinstance(value, (list, tuple, set, deque)):
+        for item in value:
+            size += estimate_size(item)
+    elif type(value).__name__ in RECORD_TYPES:
+        for name in type(value).__slots__:
+            size += estimate_size(getattr(value, name))
+    return size
+
+
+# Session record classes by name, so the redis backend can rebuild them from JSON
+RECORD_TYPES = {}
+
+
+def session_record(cls):
+    """
+    Register a class whose instances are stored as session state.
+
+    The class must define __slots__, a to_state() method returning a JSON
+    compatible value and a from_state(state) classmethod rebuilding the
+    instance from it.
+
+    Args:
+        cls (type): The record class
+
+    Returns:
+        type: The same class, so this can be used as a decorator
+    """
+    RECORD_TYPES[cls.__name__] = cls
+    return cls
+
+
+def _encode_record(value):
+    if type(value).__name__ not in RECORD_TYPES:
+        raise TypeError(f"Object of type {type(value).__name__} is not a session record")
+    return {"__record__": type(value).__name__, "state": value.to_state()}
+
+
+def _decode_record(data):
+    if "__record__" in data:
+        return RECORD_TYPES[data["__record__"]].from_state(data["state"])
+    return data
+
+
+def encode_state(value):
+    """Serialize session state, including registered records, to JSON."""
+    return json.dumps(value, default=_encode_record)
+
+
+def decode_state(data):
+    """Rebuild session state serialized by encode_state()."""
+    return json.loads(data, object_hook=_decode_record)
+
+
+class SessionStore:
+    """
+    Bounded in-memory mapping of session ids to session state.
+
+    Sessions are kept in an OrderedDict in least-recently-used order, so
+    reads, writes and evictions are O(1). A session expires once it hasn't
+    been used for ttl seconds; since the least recently used sessions come
+    first, expired sessions are always at the front and expire() only looks
+    at the ones it removes. Whenever the store holds more than max_sessions
+    sessions or max_bytes of state, the least recently used sessions are
+    evicted.
+
+    Values are measured when they're stored, so code that mutates a value
+    in place must store it again with store[session_id] = value for the
+    byte budget to see the change.
+    """
+
+    def __init__(self, name, max_sessions=10000, max_bytes=64 * 1024 * 1024, ttl=86400):
+        """
+        Create a store.
+
+        Args:
+            name (str): Namespace of the store, used in logs and by shared backends
+            max_sessions (int): Maximum number of sessions kept
+            max_bytes (int): Budget for the estimated size of all session state
+            ttl (float): Seconds a session is kept after it was last used
+        """
+        self.name = name
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = {"evictions": 0, "expirations": 0}
+        self.size = 0
+
+        # session id -> [last used, value, size in bytes]
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _drop(self, session_id):
+        entry = self._entries.pop(session_id)
+        self.size -= entry[2]
+
+    def _live_entry(self, session_id):
+        entry = self._entries.get(session_id)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            self._drop(session_id)
+            self.stats["expirations"] += 1
+            entry = None
+        return entry
+
+    def get(self, session_id, default=None):
+        """
+        Get a session's state and mark the session as used.
+
+        Args:
+            session_id (str): Unique identifier for the session
+            default: Value returned if the session doesn't exist or expired
+
+        Returns:
+            The session's state, or default
+        """
+        with self._lock:
+            entry = self._live_entry(session_id)
+            if entry is None:
+                return default
+            entry[0] = time.monotonic()
+            self._entries.move_to_end(session_id)
+            return entry[1]
+
+    def __getitem__(self, session_id):
+        with self._lock:
+            entry = self._live_entry(session_id)
+            if entry is None:
+                raise KeyError(session_id)
+            entry[0] = time.monotonic()
+            self._entries.move_to_end(session_id)
+            return entry[1]
+
+    def __setitem__(self, session_id, value):
+        value_size = estimate_size(value)
+        with self._lock:
+            if session_id in self._entries:
+                self._drop(session_id)
+            self._entries[session_id] = [time.monotonic(), value, value_size]
+            self.size += value_size
+
+            while self._entries and (len(self._entries) > self.max_sessions or self.size > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def __delitem__(self, session_id):
+        with self._lock:
+            self._drop(session_id)
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return self._live_entry(session_id) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def items(self):
+        """
+        Get every live session without marking any as used, for reports.
+
+        Returns:
+            list: (session id, state) pairs, least recently used first
+        """
+        with self._lock:
+            cutoff = time.monotonic() - self.ttl
+            return [(session_id, entry[1]) for session_id, entry in self._entries.items() if entry[0] >= cutoff]
+
+    def setdefault(self, session_id, default):
+        """
+        Get a session's state, storing default first if the session doesn't exist.
+
+        Args:
+            session_id (str): Unique identifier for the session
+            default: Initial state for a new session
+
+        Returns:
+            The session's state
+        """
+        with self._lock:
+            value = self.get(session_id, _MISSING)
+            if value is _MISSING:
+                self[session_id] = value = default
+            return value
+
+    def next_expiry(self):
+        """
+        Get the time at which the least recently used session expires.
+
+        Returns:
+            float: time.monotonic() value, or None if the store is empty
+        """
+        with self._lock:
+            if not self._entries:
+                return None
+            return next(iter(self._entries.values()))[0] + self.ttl
+
+    def expire(self):
+        """
+        Remove the sessions that haven't been used for ttl seconds.
+
+        Returns:
+            int: Number of sessions removed
+        """
+        removed = 0
+        with self._lock:
+            cutoff = time.monotonic() - self.ttl
+            while self._entries:
+                session_id, entry = next(iter(self._entries.items()))
+                if entry[0] >= cutoff:
+                    break
+                self._drop(session_id)
+                removed += 1
+            self.stats["expirations"] += removed
+        return removed
+
+    def clear(self):
+        """Remove every session."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class SessionTurn:
+    """
+    Session state of one chat turn, read and written in batches.
+
+    While a turn is active on a thread, the Redis stores serve the turn's
+    session from the values loaded up front and keep writes until the turn
+    ends, so a turn costs one pipelined round trip to load the state of
+    every store and one to save what changed.
+    """
+
+    def __init__(self, session_id, stores):
+        self.session_id = session_id
+        self.stores = stores
+        self.values = {}
+        self.dirty = set()
+
+    def load(self):
+        """Read the session from every store in one pipeline, refreshing each TTL."""
+        pipeline = self.stores[0].client.pipeline(transaction=False)
+        for store in self.stores:
+            pipeline.getex(store.key(self.session_id), ex=int(store.ttl))
+        for store, data in zip(self.stores, pipeline.execute()):
+            self.values[store.name] = decode_state(data) if data is not None else _MISSING
+
+    def save(self):
+        """Write the changed sessions back in one pipeline."""
+        if not self.dirty:
+            return
+        pipeline = self.stores[0].client.pipeline(transaction=False)
+        for store in self.stores:
+            if store.name not in self.dirty:
+                continue
+            value = self.values[store.name]
+            if value is _MISSING:
+                pipeline.delete(store.key(self.session_id))
+            else:
+                pipeline.set(store.key(self.session_id), encode_state(value), ex=int(store.ttl))
+        pipeline.execute()
+        self.dirty.clear()
+
+
+_turn = threading.local()
+
+
+class RedisSessionStore:
+    """
+    Session store kept in Redis, shared by every worker process and host.
+
+    Each session is one JSON string key under "<prefix><name>:<session id>"
+    with the idle TTL as its expiry, refreshed on every read and write, so
+    Redis expires idle sessions itself. Redis bounds the memory instead of
+    the store: run it with maxmemory and an allkeys-lru eviction policy, so
+    max_sessions and max_bytes only exist for a common constructor.
+
+    Inside session_turn() reads and writes are batched for the whole turn;
+    outside of one, every call is its own round trip.
+    """
+
+    def __init__(self, name, max_sessions=10000, max_bytes=64 * 1024 * 1024, ttl=86400, client=None,
+                 prefix="session:"):
+        """
+        Create a store.
+
+        Args:
+            name (str): Namespace of the store, part of every key
+            max_sessions (int): Unused, Redis' maxmemory bounds the sessions
+            max_bytes (int): Unused, Redis' maxmemory bounds the sessions
+            ttl (float): Seconds a session is kept after it was last used
+            client (redis.Redis, optional): Client to use, defaults to the shared client
+            prefix (str): Prefix of every key
+        """
+        self.name = name
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.prefix = prefix
+        self.client = client if client is not None else get_redis_client()
+        self.stats = {"evictions": 0, "expirations": 0}
+        self.size = 0
+
+    def key(self, session_id):
+        """Get the Redis key of a session."""
+        return f"{self.prefix}{self.name}:{session_id}"
+
+    def _turn(self, session_id):
+        turn = getattr(_turn, "turn", None)
+        if turn is not None and turn.session_id == session_id and self.name in turn.values:
+            return turn
+        return None
+
+    def get(self, session_id, default=None):
+        """
+        Get a session's state and refresh its TTL.
+
+        Args:
+            session_id (str): Unique identifier for the session
+            default: Value returned if the session doesn't exist or expired
+
+        Returns:
+            The session's state, or default
+        """
+        turn = self._turn(session_id)
+        if turn is not None:
+            value = turn.values[self.name]
+        else:
+            data = self.client.getex(self.key(session_id), ex=int(self.ttl))
+            value = decode_state(data) if data is not None else _MISSING
+        return default if value is _MISSING else value
+
+    def __getitem__(self, session_id):
+        value = self.get(session_id, _MISSING)
+        if value is _MISSING:
+            raise KeyError(session_id)
+        return value
+
+    def __setitem__(self, session_id, value):
+        turn = self._turn(session_id)
+        if turn is not None:
+            turn.values[self.name] = value
+            turn.dirty.add(self.name)
+        else:
+            self.client.set(self.key(session_id), encode_state(value), ex=int(self.ttl))
+
+    def __delitem__(self, session_id):
+        turn = self._turn(session_id)
+        if turn is not None:
+            turn.values[self.name] = _MISSING
+            turn.dirty.add(self.name)
+        else:
+            self.client.delete(self.key(session_id))
+
+    def __contains__(self, session_id):
+        turn = self._turn(session_id)
+        if turn is not None:
+            return turn.values[self.name] is not _MISSING
+        return bool(self.client.exists(self.key(session_id)))
+
+    def __len__(self):
+        # Scans the keyspace, meant for monitoring rather than the request path
+        return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}{self.name}:*", count=1000))
+
+    def items(self):
+        """
+        Get every session of this store, for reports.
+
+        Scans the keyspace and reads the sessions in batches, without
+        refreshing their TTLs.
+
+        Returns:
+            list: (session id, state) pairs
+        """
+        items = []
+        keys = []
+        start = len(self.prefix) + len(self.name) + 1
+        for key in self.client.scan_iter(match=f"{self.prefix}{self.name}:*", count=1000):
+            keys.append(key)
+            if len(keys) == 1000:
+                items.extend(self._read_keys(keys, start))
+                keys = []
+        if keys:
+            items.extend(self._read_keys(keys, start))
+        return items
+
+    def _read_keys(self, keys, start):
+        return [(key[start:].decode("utf-8"), decode_state(data))
+                for key, data in zip(keys, self.client.mget(keys)) if data is not None]
+
+    def setdefault(self, session_id, default):
+        """
+        Get a session's state, storing default first if the session doesn't exist.
+
+        Args:
+            session_id (str): Unique identifier for the session
+            default: Initial state for a new session
+
+        Returns:
+            The session's state
+        """
+        value = self.get(session_id, _MISSING)
+        if value is _MISSING:
+            self[session_id] = value = default
+        return value
+
+    def next_expiry(self):
+        """Redis expires the sessions itself, so there's nothing to schedule."""
+        return None
+
+    def expire(self):
+        """Redis expires the sessions itself, so there's nothing to remove."""
+        return 0
+
+    def clear(self):
+        """Remove every session of this store."""
+        keys = list(self.client.scan_iter(match=f"{self.prefix}{self.name}:*", count=1000))
+        if keys:
+            self.client.delete(*keys)
+
+
+_redis_client = None
+_redis_client_lock = threading.Lock()
+
+
+def get_redis_client():
+    """
+    Get the shared Redis client, creating it from the environment on first use.
+
+    Environment variables:
+        REDIS_URL: Redis server URL (default redis://localhost:6379/0)
+        REDIS_TIMEOUT: Socket timeout in seconds (default 2)
+
+    Returns:
+        redis.Redis: The shared client, backed by a connection pool
+
+    Raises:
+        RuntimeError: If the redis package isn't installed
+    """
+    global _redis_client
+    if redis is None:
+        raise RuntimeError("The redis session store backend needs the redis package: pip install redis")
+    with _redis_client_lock:
+        if _redis_client is None:
+            timeout = float(os.getenv("REDIS_TIMEOUT", 2))
+            _redis_client = redis.Redis.from_url(
+                os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+                socket_timeout=timeout,
+                socket_connect_timeout=timeout
+            )
+        return _redis_client
+
+
+class SessionDatabase:
+    """
+    SQLite database the sqlite session stores persist to, with a single writer thread.
+
+    Request threads never touch the database when they write: a write only
+    puts the session's live state in a dict of pending writes, so a session
+    written several times before the writer gets to it is serialized and
+    written once. The writer thread takes everything pending, serializes it
+    and writes it in one transaction, so under load many sessions share one
+    commit and request threads don't spend time encoding JSON. The database runs in WAL
+    mode, so reads from request threads don't wait for the writer.
+
+    Sessions are keyed by store and session id, and indexed by session id
+    and by store and last activity, for loading the most recently active
+    sessions on startup and deleting the expired ones.
+    """
+
+    def __init__(self, path):
+        """
+        Open a database, creating the schema if needed.
+
+        Args:
+            path (str): Path of the SQLite database file
+        """
+        self.path = path
+        self.stats = {"writes": 0, "deletes": 0, "commits": 0}
+
+        # (store name, session id) -> (state, last activity), or None to delete
+        self._pending = {}
+        # Pending writes taken by the writer but not yet committed, still visible to reads
+        self._writing = {}
+        # store name -> delete rows last active before this time
+        self._purges = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._local = threading.local()
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "store TEXT NOT NULL, session_id TEXT NOT NULL, state TEXT NOT NULL, last_activity REAL NOT NULL, "
+                "PRIMARY KEY (store, session_id)) WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_session_id ON sessions (session_id)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_last_activity ON sessions (store, last_activity)"
+            )
+
+        self._thread = threading.Thread(target=self._run, name="session-db", daemon=True)
+        self._thread.start()
+
+    def _connection(self):
+        # SQLite connections can't be shared between threads, so each thread opens its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # WAL with synchronous=NORMAL survives process crashes and fsyncs only on checkpoints
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def write(self, store, session_id, state):
+        """
+        Queue a session's state for the next commit.
+
+        Args:
+            store (str): Name of the session store
+            session_id (str): Unique identifier for the session
+            state: The session's state, serialized by the writer thread when it's committed
+        """
+        with self._condition:
+            self._pending[(store, session_id)] = (state, time.time())
+            self._condition.notify()
+
+    def delete(self, store, session_id):
+        """Queue the removal of a session for the next commit."""
+        with self._condition:
+            self._pending[(store, session_id)] = None
+            self._condition.notify()
+
+    def purge(self, store, cutoff):
+        """
+        Queue the removal of a store's sessions last active before a time.
+
+        Args:
+            store (str): Name of the session store
+            cutoff (float): time.time() value, sessions last active before it are removed
+        """
+        with self._condition:
+            self._purges[store] = max(cutoff, self._purges.get(store, cutoff))
+            for key, row in list(self._pending.items()):
+                if key[0] == store and row is not None and row[1] < cutoff:
+                    del self._pending[key]
+            self._condition.notify()
+
+    def read(self, store, session_id, since):
+        """
+        Read a session's state, including writes that aren't committed yet.
+
+        Args:
+            store (str): Name of the session store
+            session_id (str): Unique identifier for the session
+            since (float): time.time() value, sessions last active before it are ignored
+
+        Returns:
+            tuple: (state, last activity), or None if the session doesn't exist
+        """
+        key = (store, session_id)
+        with self._condition:
+            for pending in (self._pending, self._writing):
+                if key in pending:
+                    row = pending[key]
+                    return row if row is not None and row[1] >= since else None
+
+        row = self._connection().execute(
+            "SELECT state, last_activity FROM sessions WHERE store = ? AND session_id = ? AND last_activity >= ?",
+            (store, session_id, since)
+        ).fetchone()
+        return (decode_state(row[0]), row[1]) if row is not None else None
+
+    def recent(self, store, since, limit):
+        """
+        Read a store's most recently active sessions.
+
+        Args:
+            store (str): Name of the session store
+            since (float): time.time() value, sessions last active before it are ignored
+            limit (int): Maximum number of sessions read
+
+        Returns:
+            list: (session id, encoded state, last activity) rows, least recently active first
+        """
+        rows = self._connection().execute(
+            "SELECT session_id, state, last_activity FROM sessions WHERE store = ? AND last_activity >= ? "
+            "ORDER BY last_activity DESC LIMIT ?",
+            (store, since, limit)
+        ).fetchall()
+        rows.reverse()
+        return rows
+
+    def _run(self):
+        connection = self._connection()
+        while True:
+            with self._condition:
+                while not self._pending and not self._purges and not self._closed:
+                    self._condition.wait()
+                if self._closed and not self._pending and not self._purges:
+                    return
+                self._writing, self._pending = self._pending, {}
+                purges, self._purges = self._purges, {}
+
+            writes = []
+            retries = {}
+            for key, row in self._writing.items():
+                if row is None:
+                    continue
+                try:
+                    writes.append((key[0], key[1], encode_state(row[0]), row[1]))
+                except RuntimeError:
+                    # A request thread changed the state while it was serialized; it stores the
+                    # state again after changing it, and otherwise the next commit retries it
+                    retries[key] = row
+                except Exception as e:
+                    logging.error(f"Error serializing session {key[1]} of {key[0]}: {e}")
+            deletes = [key for key, row in self._writing.items() if row is None]
+            try:
+                with connection:
+                    # purge() dropped the pending writes it covers, so the writes left are newer and go last
+                    for store, cutoff in purges.items():
+                        connection.execute(
+                            "DELETE FROM sessions WHERE store = ? AND last_activity < ?", (store, cutoff)
+                        )
+                    connection.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)", writes)
+                    connection.executemany("DELETE FROM sessions WHERE store = ? AND session_id = ?", deletes)
+                self.stats["writes"] += len(writes)
+                self.stats["deletes"] += len(deletes)
+                self.stats["commits"] += 1
+            except Exception as e:
+                logging.error(f"Error writing sessions to {self.path}: {e}", exc_info=True)
+
+            with self._condition:
+                for key, row in retries.items():
+                    self._pending.setdefault(key, row)
+                self._writing = {}
+                self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Wait until every write queued so far is committed.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most
+
+        Returns:
+            bool: Whether the writes were committed in time
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._purges and not self._writing, timeout
+            )
+
+    def close(self):
+        """Commit the queued writes and stop the writer thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_session_database():
+    """
+    Get the shared session database, opening it from the environment on first use.
+
+    Environment variables:
+        SESSION_DB_PATH: Path of the SQLite database file (default "sessions.db")
+
+    Returns:
+        SessionDatabase: The shared database
+    """
+    global _database
+    with _database_lock:
+        if _database is None:
+            _database = SessionDatabase(os.getenv("SESSION_DB_PATH", "sessions.db"))
+        return _database
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    In-memory session store that persists every session to SQLite.
+
+    Reads are served from memory like SessionStore; every write also queues
+    the session's state for the database's writer thread, which serializes
+    it. Session state is mutated in place and stored again afterwards, so
+    the writer always ends up with the state of the last write. A new store
+    loads the most recently active sessions that haven't expired from the
+    database, and a session missing from memory, because it was evicted to
+    stay within max_sessions or max_bytes, is read back from the database
+    by its session id. Session ids known not to be in the database, because
+    this process just created them or an earlier read didn't find them,
+    are remembered so they aren't looked up again. Expiring sessions also
+    deletes the expired rows.
+    """
+
+    def __init__(self, name, max_sessions=10000, max_bytes=64 * 1024 * 1024, ttl=86400, database=None):
+        """
+        Create a store and load its recent sessions.
+
+        Args:
+            name (str): Namespace of the store, the store column of its rows
+            max_sessions (int): Maximum number of sessions kept in memory
+            max_bytes (int): Budget for the estimated size of the session state in memory
+            ttl (float): Seconds a session is kept after it was last used
+            database (SessionDatabase, optional): Database to use, defaults to the shared database
+        """
+        super().__init__(name, max_sessions=max_sessions, max_bytes=max_bytes, ttl=ttl)
+        self.database = database if database is not None else get_session_database()
+        # Session ids not in the database, least recently added first
+        self._absent = OrderedDict()
+
+        now = time.time()
+        for session_id, data, last_activity in self.database.recent(name, now - ttl, max_sessions):
+            self._load(session_id, decode_state(data), now - last_activity)
+
+    def _load(self, session_id, value, idle):
+        with self._lock:
+            SessionStore.__setitem__(self, session_id, value)
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry[0] -= idle
+
+    def mark_absent(self, session_id):
+        """
+        Remember that a session isn't in the database, so reading it doesn't query the database.
+
+        Args:
+            session_id (str): Unique identifier for the session
+        """
+        with self._lock:
+            self._absent[session_id] = None
+            self._absent.move_to_end(session_id)
+            if len(self._absent) > self.max_sessions:
+                self._absent.popitem(last=False)
+
+    def _live_entry(self, session_id):
+        entry = super()._live_entry(session_id)
+        if entry is None and session_id not in self._entries and session_id not in self._absent:
+            row = self.database.read(self.name, session_id, time.time() - self.ttl)
+            if row is None:
+                self.mark_absent(session_id)
+            else:
+                # The session is being used now, which keeps the least recently used order
+                self._load(session_id, row[0], 0)
+                entry = self._entries.get(session_id)
+        return entry
+
+    def __setitem__(self, session_id, value):
+        self.database.write(self.name, session_id, value)
+        with self._lock:
+            self._absent.pop(session_id, None)
+            super().__setitem__(session_id, value)
+
+    def __delitem__(self, session_id):
+        self.database.delete(self.name, session_id)
+        with self._lock:
+            if session_id in self._entries:
+                self._drop(session_id)
+            self.mark_absent(session_id)
+
+    def expire(self):
+        """
+        Remove the sessions that haven't been used for ttl seconds, from memory and the database.
+
+        Returns:
+            int: Number of sessions removed from memory
+        """
+        removed = super().expire()
+        self.database.purge(self.name, time.time() - self.ttl)
+        return removed
+
+    def clear(self):
+        """Remove every session of this store, from memory and the database."""
+        super().clear()
+        self.database.purge(self.name, float("inf"))
+
+
+# Session store backends by name, selected with SESSION_STORE_BACKEND
+BACKENDS = {
+    "memory": SessionStore,
+    "redis": RedisSessionStore,
+    "sqlite": SQLiteSessionStore
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def session_stores():
+    """
+    Get every session store created so far.
+
+    Returns:
+        list: The shared session stores
+    """
+    with _stores_lock:
+        return list(_stores.values())
+
+
+def get_session_store(name):
+    """
+    Get the shared session store for a namespace, creating it from the environment on first use.
+
+    Environment variables:
+        SESSION_STORE_BACKEND: Backend name (default "memory")
+        SESSION_MAX_SESSIONS: Sessions kept per namespace (default 10000)
+        SESSION_MAX_BYTES: Byte budget per namespace (default 64 MB)
+        SESSION_TTL: Seconds an idle session is kept (default 86400)
+
+    Args:
+        name (str): Namespace of the store, one per kind of session state
+
+    Returns:
+        SessionStore: The shared store for the namespace
+    """
+    with _stores_lock:
+        if name not in _stores:
+            backend = BACKENDS[os.getenv("SESSION_STORE_BACKEND", "memory")]
+            _stores[name] = backend(
+                name,
+                max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", 10000)),
+                max_bytes=int(os.getenv("SESSION_MAX_BYTES", 64 * 1024 * 1024)),
+                ttl=float(os.getenv("SESSION_TTL", 86400))
+            )
+        return _stores[name]
+
+
+def new_session_id():
+    """
+    Create an id for a new session.
+
+    The sqlite stores are told the session isn't in their database, so its
+    first turn doesn't look it up there.
+
+    Returns:
+        str: A new unique session id
+    """
+    session_id = str(uuid.uuid4())
+    for store in session_stores():
+        if isinstance(store, SQLiteSessionStore):
+            store.mark_absent(session_id)
+    return session_id
+
+
+@contextmanager
+def session_turn(session_id):
+    """
+    Batch the session reads and writes of one chat turn.
+
+    With the redis backend the state of every store is loaded in one round
+    trip when the turn starts and the changes are saved in one round trip
+    when it ends. The memory backend needs no batching, so this does
+    nothing. Nested turns join the outer turn.
+
+    Args:
+        session_id (str): Unique identifier for the session
+    """
+    stores = [store for store in session_stores() if isinstance(store, RedisSessionStore)]
+    if not stores or getattr(_turn, "turn", None) is not None:
+        yield
+        return
+
+    turn = SessionTurn(session_id, stores)
+    turn.load()
+    _turn.turn = turn
+    try:
+        yield
+    finally:
+        _turn.turn = None
+        turn.save()
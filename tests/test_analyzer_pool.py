@@ -0,0 +1,121 @@
+"""
+Tests for the analyzer pool's parallel scans, its restart after a worker
+dies, and the start timeout that turns it off when workers don't start.
+"""
+
+import time
+
+import pytest
+
+import analyzer_pool
+from analyzer_pool import ANALYZER_MODULES, TABLES, AnalyzerPool
+from pattern_matcher import MATCHER, NormalizedMessage
+
+# Register the tables in this process too, as the backends do, to compare the workers' scans with
+for module in ANALYZER_MODULES:
+    __import__(module)
+
+pytestmark = pytest.mark.skipif("fork" not in __import__("multiprocessing").get_all_start_methods(),
+                                reason="the pool forks its workers")
+
+MESSAGE = ("I feel so sad and anxious lately, I can't sleep and I'm overwhelmed at work. "
+           "Can you recommend a therapist or a morning routine that could help me feel calm? ") * 4
+
+
+def stuck_warm_up():
+    # A worker that never finishes starting, as if it waited on a lock copied held by the fork
+    time.sleep(60)
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**options):
+        pool = AnalyzerPool(**{"workers": 2, "deadline": 5, "min_length": 100, **options})
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def wait_for_restart(pool, timeout=10):
+    deadline = time.monotonic() + timeout
+    while pool._restarting and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not pool._restarting
+
+
+def kill_workers(pool):
+    # Once one worker dies the executor may terminate the others itself
+    for process in list(pool._executor._processes.values()):
+        process.kill()
+        process.join(5)
+
+
+def test_scans_every_table_in_the_workers(make_pool):
+    pool = make_pool()
+    message = NormalizedMessage(MESSAGE)
+
+    assert pool.scan(message) == len(TABLES)
+
+    # The workers find the same spans the request process would
+    for name in TABLES:
+        assert message.spans(name) == NormalizedMessage(MESSAGE).spans(name)
+    assert pool.stats == {"messages": 1, "scans": len(TABLES), "missed": 0}
+
+
+def test_short_messages_are_scanned_in_the_request_process(make_pool):
+    pool = make_pool()
+
+    assert pool.scan(NormalizedMessage("I feel sad")) == 0
+    assert pool.stats["messages"] == 0
+
+
+def test_broken_pool_falls_back_and_restarts(make_pool):
+    pool = make_pool()
+    broken = pool._executor
+    kill_workers(pool)
+
+    # The message is left to the request process while a new pool starts
+    assert pool.scan(NormalizedMessage(MESSAGE)) < len(TABLES)
+    wait_for_restart(pool)
+
+    assert pool._executor is not broken
+    assert pool.scan(NormalizedMessage(MESSAGE)) == len(TABLES)
+
+
+def test_workers_that_miss_the_start_timeout_are_killed(monkeypatch):
+    monkeypatch.setattr(analyzer_pool, "_warm_worker", stuck_warm_up)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        AnalyzerPool(workers=2, start_timeout=0.5)
+    assert time.monotonic() - start < 5
+
+
+def test_restart_that_misses_the_start_timeout_turns_the_pool_off(make_pool, monkeypatch):
+    pool = make_pool()
+    pool.start_timeout = 0.5
+    monkeypatch.setattr(analyzer_pool, "_warm_worker", stuck_warm_up)
+    kill_workers(pool)
+
+    pool.scan(NormalizedMessage(MESSAGE))
+    wait_for_restart(pool)
+
+    # Every message is scanned in the request process from now on
+    assert pool._executor is None
+    message = NormalizedMessage(MESSAGE)
+    assert pool.scan(message) == 0
+    assert message.spans(TABLES[0]) == NormalizedMessage(MESSAGE).spans(TABLES[0])
+
+
+def test_workers_start_while_the_matcher_lock_is_held(make_pool, monkeypatch):
+    # Make the workers build the trigger index, which takes the matcher's lock, while it's held here
+    monkeypatch.setattr(MATCHER, "_triggers", None)
+    with MATCHER._lock:
+        pool = make_pool(start_timeout=5)
+
+    assert pool.scan(NormalizedMessage(MESSAGE)) == len(TABLES)
@@ -0,0 +1,119 @@
+"""
+Tests for the batch analysis command line over JSONL and CSV transcripts,
+in this process and on a worker pool, with malformed rows in the input.
+"""
+
+import csv
+import json
+import logging
+import sys
+
+import pytest
+
+import batch_analysis
+
+MESSAGES = [
+    ("a", "I feel so sad and hopeless today"),
+    ("b", "Can you recommend a therapist near me?"),
+    ("c", "I feel so happy and excited today!"),
+    ("d", "Just checking in")
+]
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["batch_analysis.py", *map(str, args)])
+    batch_analysis.main()
+
+
+def read_labels(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def transcript(tmp_path):
+    path = tmp_path / "transcript.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for session_id, message in MESSAGES:
+            f.write(json.dumps({"session_id": session_id, "message": message}) + "\n")
+    return path
+
+
+def test_labels_a_jsonl_transcript(monkeypatch, tmp_path, transcript):
+    output = tmp_path / "labels.jsonl"
+
+    run_main(monkeypatch, transcript, output, "--id-field", "session_id", "--workers", "1")
+
+    labels = read_labels(output)
+    assert [(label["index"], label["id"]) for label in labels] == [(0, "a"), (1, "b"), (2, "c"), (3, "d")]
+    assert labels[0] == {"index": 0, "id": "a", **batch_analysis.label_message(MESSAGES[0][1])}
+    assert labels[0]["negative_moods"]
+    assert labels[1]["therapist_request"]
+    assert labels[2]["positive_mood"]
+
+
+def test_labels_a_csv_transcript(monkeypatch, tmp_path):
+    transcript = tmp_path / "transcript.csv"
+    with open(transcript, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["session_id", "text"])
+        writer.writerows(MESSAGES)
+    output = tmp_path / "labels.jsonl"
+
+    run_main(monkeypatch, transcript, output, "--field", "text", "--id-field", "session_id", "--workers", "1")
+
+    labels = read_labels(output)
+    assert [label["id"] for label in labels] == ["a", "b", "c", "d"]
+    assert labels[1]["therapist_request"]
+
+
+def test_worker_pool_writes_the_same_labels_in_input_order(monkeypatch, tmp_path, transcript):
+    in_process, pooled = tmp_path / "in_process.jsonl", tmp_path / "pooled.jsonl"
+
+    run_main(monkeypatch, transcript, in_process, "--workers", "1")
+    # One message per chunk, so the chunks are spread over both workers
+    run_main(monkeypatch, transcript, pooled, "--workers", "2", "--chunk-size", "1")
+
+    assert read_labels(pooled) == read_labels(in_process)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_malformed_rows_are_skipped_and_counted(monkeypatch, tmp_path, caplog, workers):
+    transcript = tmp_path / "transcript.jsonl"
+    transcript.write_text("\n".join([
+        json.dumps({"id": 1, "message": "I feel so sad and hopeless today"}),
+        "{not json",
+        json.dumps({"id": 2, "message": 42}),
+        json.dumps({"id": 3, "message": ["a", "list"]}),
+        json.dumps(["not", "an", "object"]),
+        json.dumps({"id": [4], "message": "a list id"}),
+        json.dumps({"id": 5}),
+        json.dumps({"id": 6, "message": "Can you recommend a therapist near me?"})
+    ]) + "\n", encoding="utf-8")
+    output = tmp_path / "labels.jsonl"
+    skipped = batch_analysis.Counter()
+
+    with caplog.at_level(logging.WARNING):
+        count = batch_analysis.run(str(transcript), str(output), id_field="id", workers=workers, skipped=skipped)
+
+    # The row without a message isn't malformed, it has nothing to label
+    assert count == 2
+    assert [(label["index"], label["id"]) for label in read_labels(output)] == [(0, 1), (7, 6)]
+    assert sum(skipped.values()) == 5
+    assert skipped["not a JSON object"] == 2
+    assert skipped["message is a int, not a string"] == 1
+    assert "Skipping row 1" in caplog.text
+    assert "Skipped 5 malformed rows" in caplog.text
+
+
+def test_only_the_first_malformed_rows_are_logged(tmp_path, caplog, monkeypatch):
+    monkeypatch.setattr(batch_analysis, "MAX_ROW_WARNINGS", 2)
+    transcript = tmp_path / "transcript.jsonl"
+    transcript.write_text("{broken\n" * 5, encoding="utf-8")
+    skipped = batch_analysis.Counter()
+
+    with caplog.at_level(logging.WARNING):
+        assert list(batch_analysis.read_messages(str(transcript), skipped=skipped)) == []
+
+    assert skipped == {"not a JSON object": 5}
+    assert caplog.text.count("Skipping row") == 2
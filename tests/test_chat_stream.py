@@ -0,0 +1,124 @@
+"""
+Tests for the server-sent event stream of the Llama backend's /chat/stream,
+against the local mock inference endpoint.
+"""
+
+import json
+
+import pytest
+
+import llama_api
+from benchmarks.mock_inference_server import MOCK_REPLY, start_mock_server
+from completion_cache import CompletionCache
+from inference_client import InferenceClient
+
+# A message none of the rule-based stages answer, so the reply is streamed from the endpoint
+MESSAGE = "what is the capital of france"
+
+
+@pytest.fixture
+def mock_server():
+    server, url = start_mock_server(latency=0)
+    yield server, url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(mock_server, monkeypatch):
+    inference_client = InferenceClient(api_url=mock_server[1], max_retries=0)
+    monkeypatch.setattr(llama_api, "get_inference_client", lambda: inference_client)
+    # One sample per prompt, so the first streamed completion fills the cache
+    completion_cache = CompletionCache(samples_per_key=1)
+    monkeypatch.setattr(llama_api, "get_completion_cache", lambda: completion_cache)
+    yield llama_api.app.test_client()
+    inference_client.close()
+
+
+def parse_events(body):
+    """Split an event stream into (event name, data) pairs."""
+    assert body.endswith("\n\n")
+    events = []
+    for block in body[:-2].split("\n\n"):
+        name = "message"
+        data = []
+        for line in block.split("\n"):
+            field, _, value = line.partition(":")
+            if field == "event":
+                name = value.strip()
+            elif field == "data":
+                data.append(value.strip())
+        events.append((name, json.loads("\n".join(data))))
+    return events
+
+
+def chunks_and_reply(events):
+    assert [name for name, _ in events[:-1]] == ["message"] * (len(events) - 1)
+    assert events[-1][0] == "done"
+    return [data["chunk"] for _, data in events[:-1]], events[-1][1]["reply"]
+
+
+def test_streams_one_event_per_token_then_done(client):
+    response = client.post("/chat/stream", json={"message": MESSAGE})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert response.headers["X-Accel-Buffering"] == "no"
+    assert "session_id=" in response.headers["Set-Cookie"]
+
+    chunks, reply = chunks_and_reply(parse_events(response.get_data(as_text=True)))
+    assert chunks == ["This", " is", " a", " mock", " reply."]
+    assert reply == MOCK_REPLY
+
+
+def test_fills_the_completion_cache(client, mock_server):
+    server = mock_server[0]
+    # The completion is cached once the stream is read to the end
+    client.post("/chat/stream", json={"message": MESSAGE}).get_data()
+    assert server.requests_served == 1
+
+    # The cached completion comes back as a single chunk without asking the endpoint
+    response = client.post("/chat/stream", json={"message": MESSAGE})
+    chunks, reply = chunks_and_reply(parse_events(response.get_data(as_text=True)))
+    assert chunks == [MOCK_REPLY]
+    assert reply == MOCK_REPLY
+    assert server.requests_served == 1
+
+
+def test_endpoint_error_streams_the_fallback_reply(client, mock_server):
+    server = mock_server[0]
+    server.failures.append(500)
+
+    response = client.post("/chat/stream", json={"message": MESSAGE})
+
+    chunks, reply = chunks_and_reply(parse_events(response.get_data(as_text=True)))
+    assert len(chunks) == 1
+    assert reply == chunks[0] and reply != MOCK_REPLY
+    assert llama_api.get_completion_cache().get(llama_api.CHAT_PROMPT.format(message=MESSAGE),
+                                                llama_api.CHAT_PARAMETERS) is None
+
+
+def test_error_mid_stream_ends_with_the_partial_reply(client, monkeypatch):
+    def broken_stream(prompt, **parameters):
+        yield "Partial"
+        yield " reply"
+        raise ConnectionError("Connection reset mid-stream")
+
+    monkeypatch.setattr(llama_api.get_inference_client(), "stream", broken_stream)
+
+    response = client.post("/chat/stream", json={"message": MESSAGE})
+
+    chunks, reply = chunks_and_reply(parse_events(response.get_data(as_text=True)))
+    assert chunks == ["Partial", " reply"]
+    assert reply == "Partial reply"
+    # A cut-off completion isn't cached
+    assert llama_api.get_completion_cache().get(llama_api.CHAT_PROMPT.format(message=MESSAGE),
+                                                llama_api.CHAT_PARAMETERS) is None
+
+
+def test_empty_message_is_rejected(client):
+    response = client.post("/chat/stream", json={"message": "  "})
+
+    assert response.status_code == 400
+    assert response.get_json() == {"reply": "Please provide a message."}
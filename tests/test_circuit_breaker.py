@@ -0,0 +1,187 @@
+"""
+Tests for the circuit breaker's transitions on a fake clock, and for the
+Llama backend falling back while the circuit is open, against the local
+mock inference endpoint.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import circuit_breaker
+import llama_api
+from benchmarks.mock_inference_server import start_mock_server
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, PROBE, CircuitBreaker, CircuitOpenError
+from completion_cache import CompletionCache
+from inference_client import InferenceClient
+from inference_gateway import InferenceGateway
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def make_breaker(**options):
+    options = {"error_rate": 0.5, "slow_seconds": 1.0, "min_requests": 4, "open_seconds": 30, **options}
+    return CircuitBreaker(**options)
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.min_requests):
+        assert breaker.allow()
+        breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+
+
+def test_opens_once_the_error_rate_is_reached_with_enough_calls(clock):
+    breaker = make_breaker()
+
+    for succeeded in (False, False, True):
+        assert breaker.allow() is True
+        breaker.record(succeeded, 0.01)
+    # Two failures in three calls, but fewer calls than min_requests
+    assert breaker.state == CLOSED
+
+    breaker.record(True, 0.01)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.is_open()
+    assert breaker.stats == {"calls": 4, "failures": 2, "rejected": 2, "opened": 1}
+
+
+def test_opens_when_the_latency_percentile_is_slow(clock):
+    breaker = make_breaker(percentile=0.5)
+
+    for latency in (0.1, 2.0, 2.0, 2.0):
+        breaker.allow()
+        breaker.record(True, latency)
+
+    assert breaker.state == OPEN
+
+
+def test_calls_age_out_of_the_window(clock):
+    breaker = make_breaker(window_seconds=10)
+
+    for _ in range(3):
+        breaker.record(False, 0.01)
+    clock[0] += 11
+    breaker.record(False, 0.01)
+
+    # The old failures left the window, so it's one call short of min_requests
+    assert breaker.state == CLOSED
+
+
+def test_successful_probe_closes_the_circuit_with_an_empty_window(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert not breaker.is_open()
+    assert breaker.allow() == PROBE
+    assert breaker.state == HALF_OPEN
+    # One probe at a time
+    assert not breaker.allow()
+
+    breaker.record(True, 0.01, probe=True)
+    assert breaker.state == CLOSED
+    assert breaker.allow() is True
+    assert breaker.latency_percentile() is None
+
+
+@pytest.mark.parametrize("succeeded, latency", [(False, 0.01), (True, 5.0)])
+def test_failed_or_slow_probe_opens_the_circuit_again(clock, succeeded, latency):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock[0] += 30
+
+    assert breaker.allow() == PROBE
+    breaker.record(succeeded, latency, probe=True)
+
+    assert breaker.state == OPEN
+    assert breaker.stats["opened"] == 2
+    # The open period starts over from the failed probe
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow() == PROBE
+
+
+def test_only_the_probe_decides_while_half_open(clock):
+    breaker = make_breaker()
+    # A call let through while the circuit was still closed
+    assert breaker.allow() is True
+    open_breaker(breaker)
+    clock[0] += 30
+    assert breaker.allow() == PROBE
+
+    # The earlier call finishing now neither closes nor reopens the circuit, nor frees the probe slot
+    breaker.record(True, 0.01)
+    assert breaker.state == HALF_OPEN
+    breaker.record(False, 0.01)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record(True, 0.01, probe=True)
+    assert breaker.state == CLOSED
+
+
+def test_results_arriving_while_open_are_ignored(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+
+    breaker.record(True, 0.01)
+
+    assert breaker.state == OPEN
+    assert breaker.stats["opened"] == 1
+
+
+@pytest.fixture
+def mock_server():
+    server, url = start_mock_server(latency=0)
+    yield server, url
+    server.shutdown()
+    server.server_close()
+
+
+def test_open_circuit_fails_requests_without_calling_the_endpoint(mock_server, clock):
+    server, url = mock_server
+    server.failures.extend([503] * 4)
+    breaker = make_breaker()
+    client = InferenceClient(api_url=url, max_retries=0, breaker=breaker)
+
+    for _ in range(4):
+        assert client.generate("hello").status_code == 503
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        client.generate("hello")
+    assert server.requests_served == 4
+
+    # Once the open period is over, the next request is the probe, and its success closes the circuit
+    clock[0] += 30
+    assert client.generate("hello").status_code == 200
+    assert breaker.state == CLOSED
+    client.close()
+
+
+def test_llama_stage_falls_back_while_the_circuit_is_open(mock_server, clock, monkeypatch):
+    server, url = mock_server
+    breaker = make_breaker()
+    client = InferenceClient(api_url=url, max_retries=0, breaker=breaker)
+    gateway = InferenceGateway(client, max_batch_size=1)
+    monkeypatch.setattr(llama_api, "get_inference_gateway", lambda: gateway)
+    monkeypatch.setattr(llama_api, "get_completion_cache", lambda: CompletionCache())
+    open_breaker(breaker)
+
+    message = "what is the capital of france"
+    reply = llama_api.llama_stage(llama_api.normalize(message), "s1")
+
+    assert reply == llama_api.fallback_response(message)
+    assert server.requests_served == 0
+    gateway.close()
+    client.close()
@@ -0,0 +1,112 @@
+"""
+Tests for the CORS middleware's preflight responses, echoed origins with
+credentials, Vary: Origin and allowed origin lists, through a Flask app.
+"""
+
+import pytest
+from flask import Flask
+
+from cors import ALLOW_HEADERS, ALLOW_METHODS, CORSMiddleware, enable_cors
+
+ORIGIN = "https://chat.example.com"
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    def make(origins="*", max_age=None):
+        monkeypatch.setenv("CORS_ORIGINS", origins)
+        if max_age is None:
+            monkeypatch.delenv("CORS_MAX_AGE", raising=False)
+        else:
+            monkeypatch.setenv("CORS_MAX_AGE", str(max_age))
+        app = Flask(__name__)
+        app.calls = 0
+
+        @app.route("/chat", methods=["GET", "POST", "OPTIONS"])
+        def chat():
+            app.calls += 1
+            return {"response": "hi"}
+
+        enable_cors(app)
+        return app, app.test_client()
+
+    return make
+
+
+def test_preflight_is_answered_without_entering_the_app(make_client):
+    app, client = make_client(max_age=600)
+
+    response = client.options("/chat", headers={
+        "Origin": ORIGIN,
+        "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "Content-Type"
+    })
+
+    assert response.status_code == 204
+    assert response.headers["Content-Length"] == "0" and response.data == b""
+    assert response.headers["Access-Control-Allow-Origin"] == ORIGIN
+    assert response.headers["Access-Control-Allow-Methods"] == ", ".join(ALLOW_METHODS)
+    assert response.headers["Access-Control-Allow-Headers"] == ", ".join(ALLOW_HEADERS)
+    assert response.headers["Access-Control-Max-Age"] == "600"
+    assert response.headers["Vary"] == "Origin"
+    assert app.calls == 0
+
+
+def test_preflight_is_cached_for_a_day_by_default(make_client):
+    _, client = make_client()
+    response = client.options("/chat", headers={"Origin": ORIGIN})
+    assert response.headers["Access-Control-Max-Age"] == "86400"
+
+
+def test_any_origin_is_echoed_with_credentials(make_client):
+    app, client = make_client("*")
+
+    for origin in (ORIGIN, "http://localhost:8000"):
+        response = client.post("/chat", json={"message": "hello"}, headers={"Origin": origin})
+        assert response.status_code == 200 and response.json == {"response": "hi"}
+        # "*" is refused by browsers for requests with credentials, so the origin itself is allowed
+        assert response.headers["Access-Control-Allow-Origin"] == origin
+        assert response.headers["Access-Control-Allow-Credentials"] == "true"
+        assert response.headers.get_all("Vary") == ["Origin"]
+        # Preflight headers are only sent on preflights
+        assert "Access-Control-Max-Age" not in response.headers
+    assert app.calls == 2
+
+
+def test_only_listed_origins_are_allowed(make_client):
+    app, client = make_client(f"{ORIGIN}, http://localhost:8000")
+
+    response = client.post("/chat", json={}, headers={"Origin": "http://localhost:8000"})
+    assert response.headers["Access-Control-Allow-Origin"] == "http://localhost:8000"
+
+    response = client.post("/chat", json={}, headers={"Origin": "https://evil.example.com"})
+    assert response.status_code == 200
+    assert "Access-Control-Allow-Origin" not in response.headers
+
+    # A disallowed preflight still ends at the middleware, without any CORS headers
+    response = client.options("/chat", headers={"Origin": "https://evil.example.com"})
+    assert response.status_code == 204 and response.headers["Content-Length"] == "0"
+    assert "Access-Control-Allow-Origin" not in response.headers
+    assert app.calls == 2
+
+
+def test_requests_without_an_origin_pass_through(make_client):
+    app, client = make_client()
+
+    response = client.options("/chat")
+    assert response.status_code == 200
+    assert "Access-Control-Allow-Origin" not in response.headers
+    assert app.calls == 1
+
+
+def test_header_lists_are_cached_per_origin_up_to_the_bound():
+    middleware = CORSMiddleware(lambda environ, start_response: [], max_cached_origins=2)
+
+    first = middleware.headers_for("https://a.example.com")
+    assert middleware.headers_for("https://a.example.com") is first
+    middleware.headers_for("https://b.example.com")
+    middleware.headers_for("https://c.example.com")
+
+    assert set(middleware._headers) == {"https://a.example.com", "https://b.example.com"}
+    assert dict(middleware.headers_for("https://c.example.com")[0])["Access-Control-Allow-Origin"] == \
+        "https://c.example.com"
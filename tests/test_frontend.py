@@ -0,0 +1,112 @@
+"""
+Tests for the frontend bundle's fingerprinting, the rewriting of index.html
+to the fingerprinted URLs, and the caching headers the assets are served with.
+"""
+
+import gzip
+import hashlib
+import re
+
+import pytest
+from flask import Flask
+
+from frontend import ASSET_PREFIX, IMMUTABLE_CACHE_CONTROL, build_bundle, register_frontend
+
+STYLE = b"body { color: #333; }\n" * 100
+SCRIPT = b"console.log('hello');\n"
+IMAGE = b"\xff\xd8\xff\xe0 not really a jpeg"
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+    <link rel="stylesheet" href="style.css">
+    <script src="/js/app.js"></script>
+    <script src='./app.js'></script>
+    <style>body { background: url(bg.jpg); }</style>
+</head>
+<body>
+    <img src="https://example.com/bg.jpg">
+    <p>See notes.css and mybg.jpg for details</p>
+</body>
+</html>
+"""
+
+
+def fingerprint(name, body):
+    stem, _, extension = name.rpartition(".")
+    return f"{ASSET_PREFIX}{stem}.{hashlib.sha256(body).hexdigest()[:12]}.{extension}"
+
+
+@pytest.fixture
+def site(tmp_path):
+    (tmp_path / "index.html").write_text(PAGE, encoding="utf-8")
+    (tmp_path / "style.css").write_bytes(STYLE)
+    (tmp_path / "app.js").write_bytes(SCRIPT)
+    (tmp_path / "bg.jpg").write_bytes(IMAGE)
+    (tmp_path / "notes.txt").write_text("not an asset")
+    return tmp_path
+
+
+def test_assets_are_fingerprinted_by_their_contents(site):
+    _, assets = build_bundle(str(site))
+
+    assert {ASSET_PREFIX + name for name in assets} == {
+        fingerprint("style.css", STYLE), fingerprint("app.js", SCRIPT), fingerprint("bg.jpg", IMAGE)}
+    assert all(asset.cache_control == IMMUTABLE_CACHE_CONTROL for asset in assets.values())
+
+    # A changed file gets a new name
+    (site / "app.js").write_bytes(SCRIPT + b"// changed\n")
+    _, changed = build_bundle(str(site))
+    assert fingerprint("app.js", SCRIPT + b"// changed\n")[len(ASSET_PREFIX):] in changed
+    assert fingerprint("app.js", SCRIPT)[len(ASSET_PREFIX):] not in changed
+
+
+def test_page_refers_to_the_fingerprinted_urls(site):
+    page, _ = build_bundle(str(site))
+    html = page.body.decode("utf-8")
+
+    assert f'href="{fingerprint("style.css", STYLE)}"' in html
+    assert f"src='{fingerprint('app.js', SCRIPT)}'" in html
+    assert f"url({fingerprint('bg.jpg', IMAGE)})" in html
+    # Only whole quoted or url(...) references to the bundled files are rewritten
+    assert 'src="/js/app.js"' in html
+    assert 'src="https://example.com/bg.jpg"' in html
+    assert "See notes.css and mybg.jpg for details" in html
+    assert '<meta name="api-base" content="" />' in html
+    assert page.cache_control == "no-cache"
+
+
+@pytest.fixture
+def client(site, monkeypatch):
+    monkeypatch.setenv("SERVE_FRONTEND", "1")
+    monkeypatch.setenv("FRONTEND_DIR", str(site))
+    app = Flask(__name__)
+    assert register_frontend(app)
+    return app.test_client()
+
+
+def test_assets_are_served_immutable_and_revalidated_by_etag(client):
+    page = client.get("/")
+    assert page.headers["Cache-Control"] == "no-cache"
+    assert client.get("/index.html").data == page.data
+
+    url = re.search(r'href="([^"]+)"', page.get_data(as_text=True)).group(1)
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content_type == "text/css; charset=utf-8"
+    assert gzip.decompress(response.data) == STYLE
+
+    revalidated = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304 and revalidated.data == b""
+
+    assert client.get(f"{ASSET_PREFIX}style.css").status_code == 404
+
+
+def test_frontend_is_off_unless_enabled(monkeypatch):
+    monkeypatch.delenv("SERVE_FRONTEND", raising=False)
+    app = Flask(__name__)
+    assert not register_frontend(app)
+    assert app.test_client().get("/").status_code == 404
@@ -0,0 +1,218 @@
+"""
+Tests for the inference client's retries, backoff and jitter against the
+local mock inference endpoint, and for request hedging against a slow stub.
+"""
+
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from benchmarks.mock_inference_server import start_mock_server
+from inference_client import HedgePolicy, InferenceClient
+
+
+@pytest.fixture
+def mock_server():
+    servers = []
+
+    def start(**options):
+        server, url = start_mock_server(latency=0, **options)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(url, delays, **options):
+    client = InferenceClient(api_url=url, connect_timeout=1, read_timeout=2, **options)
+    retry_delay = client._retry_delay
+
+    # Record every backoff, but don't sleep through it
+    def record_delay(attempt):
+        delays.append((attempt, retry_delay(attempt)))
+        return 0
+
+    client._retry_delay = record_delay
+    return client
+
+
+def test_retries_transient_statuses_until_success(mock_server):
+    server, url = mock_server(failures=[503, 429])
+    delays = []
+    client = make_client(url, delays, max_retries=2)
+
+    response = client.generate("hello")
+
+    assert response.status_code == 200
+    assert response.json()[0]["generated_text"].startswith("hello")
+    assert server.requests_served == 3
+    assert [attempt for attempt, _ in delays] == [0, 1]
+    client.close()
+
+
+def test_returns_last_response_after_max_retries(mock_server):
+    server, url = mock_server(failures=[503, 502, 500, 504])
+    delays = []
+    client = make_client(url, delays, max_retries=2)
+
+    response = client.generate("hello")
+
+    assert response.status_code == 500
+    assert server.requests_served == 3
+    assert len(delays) == 2
+    client.close()
+
+
+def test_does_not_retry_client_errors(mock_server):
+    server, url = mock_server(failures=[400])
+    delays = []
+    client = make_client(url, delays, max_retries=2)
+
+    response = client.generate("hello")
+
+    assert response.status_code == 400
+    assert server.requests_served == 1
+    assert delays == []
+    client.close()
+
+
+def test_retries_connection_errors_then_raises():
+    # A port nothing listens on refuses every connection
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    delays = []
+    client = make_client(f"http://127.0.0.1:{port}/", delays, max_retries=2)
+
+    with pytest.raises(requests.ConnectionError):
+        client.generate("hello")
+
+    assert [attempt for attempt, _ in delays] == [0, 1]
+    client.close()
+
+
+def test_backoff_grows_exponentially_up_to_the_cap_with_full_jitter():
+    client = InferenceClient(api_url="http://127.0.0.1:9/", backoff=0.25, max_backoff=2.0)
+
+    for attempt, ceiling in [(0, 0.25), (1, 0.5), (2, 1.0), (3, 2.0), (6, 2.0)]:
+        delays = [client._retry_delay(attempt) for _ in range(200)]
+        assert all(0 <= delay <= ceiling for delay in delays)
+        # Full jitter spreads the delays over the whole range instead of a fixed step
+        assert max(delays) - min(delays) > ceiling / 2
+    client.close()
+
+
+class StubResponse:
+    def __init__(self, attempt):
+        self.attempt = attempt
+        self.status_code = 200
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def make_hedged_client(latencies, policy=None):
+    """
+    Make a hedging client whose posts are answered by a stub.
+
+    Args:
+        latencies (list): Seconds each attempt takes, negative for an attempt that fails
+        policy (HedgePolicy, optional): Defaults to hedging everything slower than 20 ms
+
+    Returns:
+        tuple: (client, responses of the attempts started so far)
+    """
+    if policy is None:
+        policy = HedgePolicy(percentile=0.5, budget=1, burst=1, min_samples=1)
+    policy.record(0.02)
+    client = InferenceClient(api_url="http://127.0.0.1:9/", pool_size=1, hedge=policy)
+    responses = []
+
+    def slow_post(payload, timeout=None, stream=False):
+        response = StubResponse(len(responses))
+        responses.append(response)
+        latency = latencies[response.attempt]
+        time.sleep(abs(latency))
+        if latency < 0:
+            raise requests.ConnectionError(f"Attempt {response.attempt} failed")
+        return response
+
+    client.post = slow_post
+    return client, responses
+
+
+def test_hedge_fires_for_a_slow_request_and_wins():
+    client, responses = make_hedged_client([0.5, 0.01])
+
+    response = client.generate("hello")
+
+    assert response.attempt == 1
+    assert len(responses) == 2
+    assert client.hedge.stats == {"requests": 1, "hedged": 1, "hedge_wins": 1}
+    assert not response.closed.is_set()
+    client.close()
+
+
+def test_losing_attempt_is_closed_once_it_completes():
+    client, responses = make_hedged_client([0.3, 0.01])
+
+    assert client.generate("hello").attempt == 1
+
+    # The slow attempt was already running, so its response is closed when it arrives
+    assert responses[0].closed.wait(2)
+    client.close()
+
+
+def test_hedge_that_has_not_started_is_cancelled():
+    client, responses = make_hedged_client([0.1, 0.01])
+    executor = client._hedge_executor
+    submitted = []
+
+    # Run the first attempt, and leave the hedge queued as if every worker were busy
+    def submit(fn, *args, **kwargs):
+        submitted.append(executor.submit(fn, *args, **kwargs) if not submitted else Future())
+        return submitted[-1]
+
+    client._hedge_executor = SimpleNamespace(submit=submit, shutdown=executor.shutdown)
+
+    response = client.generate("hello")
+
+    assert response.attempt == 0
+    assert len(submitted) == 2 and submitted[1].cancelled()
+    assert len(responses) == 1
+    assert client.hedge.stats == {"requests": 1, "hedged": 1, "hedge_wins": 0}
+    client.close()
+
+
+def test_fast_requests_and_spent_budgets_are_not_hedged():
+    client, responses = make_hedged_client([0.0])
+    assert client.generate("hello").attempt == 0
+    assert len(responses) == 1
+    client.close()
+
+    policy = HedgePolicy(percentile=0.5, budget=0, min_samples=1)
+    client, responses = make_hedged_client([0.1, 0.01], policy)
+    assert client.generate("hello").attempt == 0
+    assert len(responses) == 1
+    assert policy.stats == {"requests": 1, "hedged": 0, "hedge_wins": 0}
+    client.close()
+
+
+def test_hedged_request_fails_only_when_both_attempts_fail():
+    client, _ = make_hedged_client([0.1, -0.01])
+    assert client.generate("hello").attempt == 0
+    client.close()
+
+    client, _ = make_hedged_client([-0.1, -0.01])
+    with pytest.raises(requests.ConnectionError):
+        client.generate("hello")
+    client.close()
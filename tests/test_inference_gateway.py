@@ -0,0 +1,121 @@
+"""
+Tests for the inference gateway's micro-batching and coalescing against the
+local mock inference endpoint, which answers batched inputs.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.mock_inference_server import MOCK_REPLY, start_mock_server
+from inference_client import InferenceClient
+from inference_gateway import InferenceGateway
+
+
+@pytest.fixture
+def mock_server():
+    server, url = start_mock_server(latency=0.05)
+    yield server, url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_gateway(mock_server):
+    gateways = []
+
+    def make(**options):
+        client = InferenceClient(api_url=mock_server[1], max_retries=0)
+        gateway = InferenceGateway(client, **options)
+        gateways.append(gateway)
+        return gateway
+
+    yield make
+    for gateway in gateways:
+        gateway.close()
+        gateway.client.close()
+
+
+def generate_all(gateway, prompts, **parameters):
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        return list(pool.map(lambda prompt: gateway.generate(prompt, **parameters), prompts))
+
+
+def test_prompts_within_the_window_share_one_request(make_gateway, mock_server):
+    server = mock_server[0]
+    gateway = make_gateway(max_batch_size=8, batch_window=0.2)
+    prompts = [f"prompt {i}" for i in range(5)]
+
+    responses = generate_all(gateway, prompts)
+
+    # Every caller gets the response a request of its own would have got
+    assert [response.json() for response in responses] == [
+        [{"generated_text": f"{prompt} {MOCK_REPLY}"}] for prompt in prompts
+    ]
+    assert server.batches_served == 1
+    assert server.prompts_served == 5
+    stats = gateway.batcher.stats
+    assert stats["batches"] == 1 and stats["prompts"] == 5
+    assert stats["fill_rate"] == pytest.approx(5 / 8)
+    assert 0 < stats["max_queue_delay"] <= 1
+    assert gateway.stats["upstream"] == 1
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window(make_gateway, mock_server):
+    server = mock_server[0]
+    gateway = make_gateway(max_batch_size=4, batch_window=30)
+
+    responses = generate_all(gateway, [f"prompt {i}" for i in range(4)])
+
+    assert all(response.status_code == 200 for response in responses)
+    assert server.batches_served == 1
+    assert gateway.batcher.stats["fill_rate"] == 1
+    assert gateway.batcher.stats["max_queue_delay"] < 5
+
+
+def test_prompts_with_different_parameters_are_batched_separately(make_gateway, mock_server):
+    server = mock_server[0]
+    gateway = make_gateway(max_batch_size=8, batch_window=0.1)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(gateway.generate, f"prompt {i}", temperature=0.2 if i % 2 else 0.9)
+                   for i in range(4)]
+        responses = [future.result() for future in futures]
+
+    assert all(response.status_code == 200 for response in responses)
+    assert server.batches_served == 2
+    assert server.prompts_served == 4
+
+
+def test_identical_prompts_are_coalesced_before_batching(make_gateway, mock_server):
+    server = mock_server[0]
+    gateway = make_gateway(max_batch_size=8, batch_window=0.1)
+
+    responses = generate_all(gateway, ["same prompt"] * 4 + ["other prompt"])
+
+    assert server.prompts_served == 2
+    assert gateway.stats["coalesced"] == 3
+    assert responses[0] is responses[1]
+    assert responses[-1].json()[0]["generated_text"].startswith("other prompt")
+
+
+def test_failed_batch_fails_every_prompt_with_its_response(make_gateway, mock_server):
+    server = mock_server[0]
+    server.failures.append(503)
+    gateway = make_gateway(max_batch_size=8, batch_window=0.1)
+
+    responses = generate_all(gateway, [f"prompt {i}" for i in range(3)])
+
+    assert [response.status_code for response in responses] == [503] * 3
+    assert server.requests_served == 1
+
+
+def test_without_batching_every_prompt_is_its_own_request(make_gateway, mock_server):
+    server = mock_server[0]
+    gateway = make_gateway(max_batch_size=1)
+
+    generate_all(gateway, [f"prompt {i}" for i in range(3)])
+
+    assert gateway.batcher is None
+    assert server.batches_served == 0
+    assert server.prompts_served == 3
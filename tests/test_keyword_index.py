@@ -0,0 +1,54 @@
+"""
+Tests for the Aho-Corasick keyword index: a scan must find exactly the
+keywords `keyword in text` finds, overlapping and nested ones included.
+"""
+
+import random
+
+from keyword_index import KeywordIndex
+
+
+def naive_scan(keyword_lists, text):
+    return {name: {keyword for keyword in keywords if keyword in text} for name, keywords in keyword_lists.items()}
+
+
+def test_finds_overlapping_and_nested_keywords():
+    lists = {
+        "words": ["he", "she", "his", "hers", "her"],
+        "phrases": ["mental health", "health", "heal", "al he"]
+    }
+    index = KeywordIndex(lists)
+
+    for text in ["ushers", "shehis", "hers", "mental health check", "healthy", "h", "", "hhhhe"]:
+        assert index.scan(text) == naive_scan(lists, text), text
+
+
+def test_same_keyword_in_several_lists():
+    lists = {"feelings": ["sad", "stress"], "music": ["sad songs", "sad"]}
+    index = KeywordIndex(lists)
+
+    assert index.scan("i want sad songs") == {"feelings": {"sad"}, "music": {"sad songs", "sad"}}
+    assert index.counts("stressed and sad") == {"feelings": 2, "music": 1}
+
+
+def test_matches_substrings_like_in_on_random_text():
+    rng = random.Random(0)
+    alphabet = "abc "
+    lists = {
+        f"list{i}": ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(8)]
+        for i in range(3)
+    }
+    index = KeywordIndex(lists)
+
+    for _ in range(500):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        assert index.scan(text) == naive_scan(lists, text), text
+
+
+def test_first_follows_list_order():
+    index = KeywordIndex({"moods": ["happy", "sad", "calm"], "other": ["tired"]})
+    hits = index.scan("calm, then sad, then tired")
+
+    assert index.first(hits, "moods") == "sad"
+    assert index.first(hits, "other", "moods") == "tired"
+    assert index.first(index.scan("nothing"), "moods", "other") is None
@@ -0,0 +1,92 @@
+"""
+Tests for the shape of the mental health trend and for the vectorized trend
+report against its pure-Python fallback.
+"""
+
+import random
+
+import pytest
+
+import mental_health_analysis
+from mental_health_analysis import (CONCERNS, TREND_DECAY, TREND_MIN_MESSAGES, TREND_STATES, analyze_text,
+                                    get_mental_health_trend, mental_health_trend_report)
+from session_store import SessionStore
+
+MESSAGES = [
+    "hello there",
+    "I feel sad today",
+    "I'm so depressed and hopeless",
+    "everything feels empty, I'm giving up",
+    "I'm worried about work",
+    "I keep having a panic attack",
+    "I'm stressed and can't relax",
+    "thanks, that helped"
+]
+
+
+@pytest.fixture
+def history(monkeypatch):
+    store = SessionStore("test.mental_health_history")
+    monkeypatch.setattr(mental_health_analysis, "user_mental_health_history", store)
+    return store
+
+
+def test_trend_needs_enough_messages(history):
+    assert get_mental_health_trend("unknown") == {"trend": "insufficient_data"}
+
+    for _ in range(TREND_MIN_MESSAGES - 1):
+        analyze_text("I feel sad today", "user")
+    assert get_mental_health_trend("user") == {"trend": "insufficient_data"}
+
+
+def test_trend_has_a_state_score_and_slope_per_concern(history):
+    for _ in range(TREND_MIN_MESSAGES - 1):
+        analyze_text("hello there", "user")
+    analyze_text("I feel sad today", "user")
+
+    result = get_mental_health_trend("user")
+
+    assert set(result) == {"trend", "scores", "slopes"}
+    for key in ("trend", "scores", "slopes"):
+        assert list(result[key]) == list(CONCERNS)
+    assert set(result["trend"].values()) <= set(TREND_STATES) - {"insufficient_data"}
+    assert all(isinstance(value, float) for value in result["scores"].values())
+    assert all(isinstance(value, float) for value in result["slopes"].values())
+
+    # One low severity mention in the last message: the score jumps to 1 and the slope follows a share of it
+    assert result["trend"]["depression"] == "active_low"
+    assert result["scores"]["depression"] == pytest.approx(1.0)
+    assert result["slopes"]["depression"] == pytest.approx(1 - TREND_DECAY)
+    assert result["trend"]["anxiety"] == "not_detected"
+    assert result["scores"]["anxiety"] == 0.0
+
+
+def test_trend_report_matches_the_pure_python_fallback(history, monkeypatch):
+    if mental_health_analysis.np is None:
+        pytest.skip("NumPy is not installed")
+
+    rng = random.Random(0)
+    for user in range(60):
+        for _ in range(rng.randrange(1, 2 * TREND_MIN_MESSAGES)):
+            analyze_text(rng.choice(MESSAGES), f"user-{user}")
+
+    vectorized = mental_health_trend_report()
+    subset = mental_health_trend_report([f"user-{user}" for user in range(0, 60, 7)] + ["unknown"])
+    monkeypatch.setattr(mental_health_analysis, "np", None)
+    fallback = mental_health_trend_report()
+    fallback_subset = mental_health_trend_report([f"user-{user}" for user in range(0, 60, 7)] + ["unknown"])
+
+    for expected, report in ((fallback, vectorized), (fallback_subset, subset)):
+        assert report["users"] == expected["users"]
+        assert list(report["concerns"]) == list(CONCERNS)
+        for concern in CONCERNS:
+            summary = dict(report["concerns"][concern])
+            expected_summary = dict(expected["concerns"][concern])
+            assert summary.pop("mean_score") == pytest.approx(expected_summary.pop("mean_score"))
+            assert summary == expected_summary
+    # The report counts every user once per concern
+    assert sum(vectorized["concerns"]["depression"][state] for state in TREND_STATES) == vectorized["users"] == 60
+
+
+def test_trend_report_without_records(history):
+    assert mental_health_trend_report() == {"users": 0, "concerns": {}}
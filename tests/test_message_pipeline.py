@@ -0,0 +1,82 @@
+"""
+Tests for the lazy message pipeline and the Llama backend's stages: which
+stage replies, what an empty completion turns into, and the analyzers'
+side effects skipped when an earlier stage answers.
+"""
+
+import pytest
+
+import llama_api
+from mental_health_analysis import user_mental_health_history
+from message_pipeline import MessagePipeline
+from mood_encouragement import user_mood_history
+from session_store import new_session_id
+
+# A message none of the rule-based stages answer
+MESSAGE = "what is the capital of france"
+
+
+def test_first_stage_with_a_reply_wins_and_later_stages_never_run():
+    calls = []
+
+    def stage(name, reply):
+        def run(message, session_id):
+            calls.append(name)
+            return reply
+        return name, run
+
+    pipeline = MessagePipeline([stage("none", None), stage("empty", ""), stage("later", "later reply")])
+
+    # An empty string is still a reply, only None passes the message on
+    assert pipeline.run("Hello", "s1") == ("empty", "")
+    assert calls == ["none", "empty"]
+    assert MessagePipeline([stage("none", None)]).run("Hello", "s1") == (None, None)
+
+
+@pytest.fixture
+def completion(monkeypatch):
+    completions = []
+    monkeypatch.setattr(llama_api, "generate_completion", lambda prompt, **parameters: completions[0])
+    return completions
+
+
+@pytest.mark.parametrize("generated", ["", "   "])
+def test_empty_completion_falls_back_to_a_rule_based_reply(completion, generated):
+    completion.append(f"{llama_api.CHAT_PROMPT.format(message=MESSAGE)}{generated}")
+
+    stage, reply = llama_api.get_llama_response(MESSAGE, new_session_id())
+
+    assert stage == "llama"
+    assert reply == llama_api.fallback_response(MESSAGE)
+
+
+def test_chat_answers_an_empty_completion(completion):
+    completion.append(llama_api.CHAT_PROMPT.format(message=MESSAGE))
+
+    response = llama_api.app.test_client().post("/chat", json={"message": MESSAGE})
+
+    assert response.status_code == 200
+    assert response.get_json()["reply"]
+
+
+def test_llama_reply_is_the_text_after_the_prompt(completion):
+    completion.append(f"{llama_api.CHAT_PROMPT.format(message=MESSAGE)} Paris.")
+
+    assert llama_api.get_llama_response(MESSAGE, new_session_id()) == ("llama", "Paris.")
+
+
+def test_stages_below_the_reply_record_nothing():
+    session_id = new_session_id()
+
+    # The music stage answers first, so the mood and mental health stages never see the message
+    stage, _ = llama_api.get_llama_response("I feel so sad and hopeless, recommend me a song", session_id)
+
+    assert stage == "music"
+    assert session_id not in user_mood_history
+    assert session_id not in user_mental_health_history
+
+    # Without a music request the mood stage runs, and records the mood
+    stage, _ = llama_api.get_llama_response("I feel so sad and hopeless", session_id)
+
+    assert stage == "negative_mood"
+    assert session_id in user_mood_history
@@ -0,0 +1,99 @@
+"""
+Tests for the shared pattern matcher: the candidates its trigger words
+select must find exactly what a plain regular expression search of every
+pattern finds.
+"""
+
+import random
+
+import pytest
+
+from analyzer_pool import ANALYZER_MODULES
+from pattern_matcher import MATCHER, NormalizedMessage, PatternMatcher
+
+for module in ANALYZER_MODULES:
+    __import__(module)
+
+MESSAGES = [
+    "",
+    "hi",
+    "I feel so sad and anxious lately, I can't sleep",
+    "I'm feeling great today, everything is amazing!",
+    "can you recommend a therapist or a psychologist near me?",
+    "I need a morning routine and some healthy habits",
+    "what is the meaning of life, why do we exist?",
+    "I want to hurt myself, I don't see the point anymore",
+    "I am not sad, I'm just tired and stressed about work",
+    "sadness, saddened, unsad: words that contain sad",
+    "THERAPIST!!! Therapy? counselling...",
+    "i feel really hopeless and worthless and nobody cares",
+]
+
+
+def plain_search(table, text):
+    """What searching every pattern of a table finds, without the trigger index."""
+    spans = []
+    for index, pattern in enumerate(table.compiled):
+        match = pattern.search(text)
+        if match:
+            spans.append((index, match.span()))
+    return spans
+
+
+def assert_equivalent(matcher, text):
+    message = NormalizedMessage(text, matcher)
+    for name, table in matcher._tables.items():
+        assert message.spans(name) == plain_search(table, message.text), (name, text)
+
+
+def random_messages(count, seed=0):
+    # Messages built from the trigger words and the words around them, so most patterns get candidates
+    rng = random.Random(seed)
+    words = sorted({word for table in MATCHER._tables.values() for triggers in table.triggers if triggers
+                    for word in triggers})
+    filler = ["i", "i'm", "am", "feel", "feeling", "so", "really", "very", "not", "a", "the", "to", "me", "my",
+              "and", "about", "want", "need", "can't", "don't", "today", "always", "never", ",", ".", "?"]
+    vocabulary = words + filler * 3
+    return [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 25))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("text", MESSAGES)
+def test_candidates_find_what_a_plain_search_finds(text):
+    assert_equivalent(MATCHER, text)
+
+
+def test_candidates_match_a_plain_search_on_random_messages():
+    for text in random_messages(500):
+        assert_equivalent(MATCHER, text)
+
+
+def test_triggers_of_alternations_optional_groups_and_literal_free_patterns():
+    matcher = PatternMatcher()
+    table = matcher.register("test", [
+        r"i feel (?:so |really )?sad",      # the longest word every match contains
+        r"(?:therapist|psychologist)",      # any alternative
+        r"(?:very )?tired",                 # not the optional word
+        r"\d+ days",                        # the literal after the class
+        r"^.{0,3}$",                        # nothing to index: always verified
+    ], word_boundary=True)
+
+    assert table.triggers[0] == frozenset(["feel"])
+    assert table.triggers[1] == frozenset(["therapist", "psychologist"])
+    assert table.triggers[2] == frozenset(["tired"])
+    assert table.triggers[3] == frozenset(["days"])
+    assert table.triggers[4] is None
+
+    for text in ["i feel so sad", "I feel really sad", "a psychologist", "very tired", "tired", "3 days",
+                 "ok", "i feel fine", "sadly", "retired", "psychologists", "days"]:
+        assert_equivalent(matcher, text)
+    assert NormalizedMessage("ok", matcher).hits("test") == [4]
+
+
+def test_literal_tables_match_substrings_like_in():
+    matcher = PatternMatcher()
+    keywords = ["mental health", "c++", "sad"]
+    matcher.register("literal", keywords, literal=True)
+
+    for text in ["my mental health is bad", "i write c++", "sadness", "mental  health", "no match"]:
+        message = NormalizedMessage(text, matcher)
+        assert message.hits("literal") == [i for i, keyword in enumerate(keywords) if keyword in text]
@@ -0,0 +1,124 @@
+"""
+Tests for the Redis session store and batched session turns, against an
+in-process fakeredis server.
+"""
+
+import time
+
+import pytest
+
+import session_store
+from chat_history import ChatHistory
+from session_store import RedisSessionStore, session_turn
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_client():
+    client = fakeredis.FakeRedis()
+    yield client
+    client.flushall()
+
+
+@pytest.fixture
+def stores(redis_client, monkeypatch):
+    # Register the stores like get_session_store() does, so session_turn() batches them
+    created = {}
+    monkeypatch.setattr(session_store, "_stores", created)
+    for name in ("test.history", "test.moods"):
+        created[name] = RedisSessionStore(name, ttl=60, client=redis_client)
+    return created["test.history"], created["test.moods"]
+
+
+def test_round_trips_plain_state_and_session_records(stores):
+    history_store, mood_store = stores
+    history = ChatHistory(3, system={"role": "system", "content": "Be kind."})
+    for i in range(5):
+        history.append({"role": "user", "content": f"message {i}"})
+
+    history_store["s1"] = history
+    mood_store["s1"] = {"moods": ["sad", "calm"], "count": 2}
+
+    restored = history_store["s1"]
+    assert isinstance(restored, ChatHistory)
+    assert list(restored) == list(history)
+    assert mood_store.get("s1") == {"moods": ["sad", "calm"], "count": 2}
+    assert "s1" in mood_store and "s2" not in mood_store
+    assert mood_store.get("s2", "default") == "default"
+    with pytest.raises(KeyError):
+        mood_store["s2"]
+
+    del mood_store["s1"]
+    assert "s1" not in mood_store
+    assert dict(history_store.items()).keys() == {"s1"}
+
+
+def test_sets_and_refreshes_the_ttl(stores, redis_client):
+    history_store, _ = stores
+    key = history_store.key("s1")
+
+    history_store["s1"] = ["hello"]
+    assert 0 < redis_client.ttl(key) <= 60
+
+    # Reads refresh the idle timeout
+    redis_client.expire(key, 5)
+    assert history_store.get("s1") == ["hello"]
+    assert redis_client.ttl(key) > 5
+
+    # Redis removes the session once it expires
+    redis_client.pexpire(key, 1)
+    time.sleep(0.01)
+    assert history_store.get("s1") is None
+
+
+def test_turn_loads_once_and_saves_changes_in_one_pipeline(stores, redis_client, monkeypatch):
+    history_store, mood_store = stores
+    history_store["s1"] = ["hello"]
+    mood_store["s1"] = {"count": 1}
+
+    pipelines = []
+    pipeline = redis_client.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        pipelines.append(kwargs)
+        return pipeline(*args, **kwargs)
+
+    monkeypatch.setattr(redis_client, "pipeline", counting_pipeline)
+    # Outside of the pipelines, a turn must not make its own round trips
+    monkeypatch.setattr(redis_client, "getex", None)
+    monkeypatch.setattr(redis_client, "set", None)
+
+    with session_turn("s1"):
+        history = history_store.get("s1")
+        history.append("how are you?")
+        history_store["s1"] = history
+        assert mood_store["s1"] == {"count": 1}
+        del mood_store["s1"]
+        assert "s1" not in mood_store
+        mood_store.setdefault("s1", {"count": 0})
+
+    assert len(pipelines) == 2
+    monkeypatch.undo()
+    assert history_store["s1"] == ["hello", "how are you?"]
+    assert mood_store["s1"] == {"count": 0}
+    assert 0 < redis_client.ttl(mood_store.key("s1")) <= 60
+
+
+def test_turn_without_changes_saves_nothing(stores, redis_client, monkeypatch):
+    history_store, _ = stores
+    history_store["s1"] = ["hello"]
+
+    pipelines = []
+    pipeline = redis_client.pipeline
+
+    def counting_pipeline(*args, **kwargs):
+        pipelines.append(kwargs)
+        return pipeline(*args, **kwargs)
+
+    monkeypatch.setattr(redis_client, "pipeline", counting_pipeline)
+
+    with session_turn("s1"):
+        assert history_store["s1"] == ["hello"]
+
+    assert len(pipelines) == 1
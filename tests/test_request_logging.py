@@ -0,0 +1,127 @@
+"""
+Tests for the logging queue's drop counting when it is full, the warning
+reporting the drops, and the request logger's sampling and lazy bodies.
+"""
+
+import json
+import logging
+import queue
+
+import pytest
+
+import request_logging
+from request_logging import DroppingQueueHandler, DropReportingListener, JsonFormatter, RequestLogger
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_record(message, *args):
+    return logging.makeLogRecord({"name": "test", "levelno": logging.INFO, "levelname": "INFO",
+                                  "msg": message, "args": args})
+
+
+def test_full_queue_drops_and_counts_records():
+    log_queue = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(log_queue)
+
+    for i in range(5):
+        handler.handle(make_record("record %d", i))
+
+    assert handler.stats == {"queued": 2, "dropped": 3}
+    # Arguments are merged before queueing, so the listener thread formats what was logged
+    record = log_queue.get_nowait()
+    assert record.msg == "record 0" and record.args is None
+
+
+def test_listener_reports_drops_once_before_the_next_record():
+    log_queue = queue.Queue(maxsize=1)
+    handler = DroppingQueueHandler(log_queue)
+    output = ListHandler()
+    listener = DropReportingListener(log_queue, handler, output)
+
+    for i in range(4):
+        handler.handle(make_record(f"record {i}"))
+    listener.handle(log_queue.get_nowait())
+    handler.handle(make_record("record 4"))
+    listener.handle(log_queue.get_nowait())
+
+    assert [record.getMessage() for record in output.records] == [
+        "Dropped 3 log records, the log queue was full",
+        "record 0",
+        "record 4"
+    ]
+    warning = output.records[0]
+    assert warning.levelno == logging.WARNING
+    assert json.loads(JsonFormatter().format(warning))["dropped_total"] == 3
+
+
+def make_request_logger(level, sample_rate=1.0):
+    logger = logging.getLogger(f"test.requests.{level}.{sample_rate}")
+    logger.propagate = False
+    logger.setLevel(level)
+    output = ListHandler()
+    logger.handlers = [output]
+    return RequestLogger(logger, sample_rate), output
+
+
+def test_request_summaries_are_sampled(monkeypatch):
+    request_log, output = make_request_logger(logging.INFO, sample_rate=0.25)
+    draws = iter([0.1, 0.5, 0.24, 0.25])
+    monkeypatch.setattr(request_logging.random, "random", lambda: next(draws))
+
+    for i in range(4):
+        request_log.info("Chat request", request=i)
+
+    assert [record.fields["request"] for record in output.records] == [0, 2]
+    assert request_log.stats == {"sampled_out": 2}
+
+
+@pytest.mark.parametrize("sample_rate, logged", [(1.0, 3), (0.0, 0)])
+def test_sample_rate_bounds(sample_rate, logged):
+    request_log, output = make_request_logger(logging.INFO, sample_rate)
+
+    for i in range(3):
+        request_log.info("Chat request", request=i)
+
+    assert len(output.records) == logged
+    assert request_log.stats == {"sampled_out": 3 - logged}
+
+
+def test_debug_bodies_are_only_built_at_debug_level():
+    calls = []
+
+    def build_fields():
+        calls.append(1)
+        return {"message": "hello"}
+
+    request_log, output = make_request_logger(logging.INFO)
+    request_log.debug("Chat request body", build_fields)
+    assert calls == [] and output.records == []
+
+    request_log, output = make_request_logger(logging.DEBUG)
+    request_log.debug("Chat request body", build_fields)
+    assert calls == [1]
+    assert output.records[0].fields == {"message": "hello"}
+
+
+def test_logging_stats_merges_the_queue_and_request_logger_counters(monkeypatch):
+    monkeypatch.setattr(request_logging, "_queue_handler", None)
+    monkeypatch.setattr(request_logging, "_request_logger", None)
+    assert request_logging.logging_stats() == {"queued": 0, "dropped": 0, "sampled_out": 0}
+
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record("kept"))
+    handler.handle(make_record("dropped"))
+    request_log, _ = make_request_logger(logging.INFO, sample_rate=0.0)
+    request_log.info("Chat request")
+    monkeypatch.setattr(request_logging, "_queue_handler", handler)
+    monkeypatch.setattr(request_logging, "_request_logger", request_log)
+
+    assert request_logging.logging_stats() == {"queued": 1, "dropped": 1, "sampled_out": 1}
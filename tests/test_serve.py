@@ -0,0 +1,60 @@
+"""
+Tests for the serving command line: the options it hands to gunicorn,
+without starting the server.
+"""
+
+import sys
+
+import pytest
+
+import serve
+
+pytest.importorskip("gunicorn")
+
+
+@pytest.fixture
+def run_main(monkeypatch):
+    configs = []
+
+    def capture_config(server):
+        configs.append(server.cfg)
+
+    monkeypatch.setattr(serve.GunicornServer, "run", capture_config)
+
+    def run(*args):
+        monkeypatch.setattr(sys, "argv", ["serve.py", "llama_api", "--server", "gunicorn", *args])
+        serve.main()
+        return configs[-1]
+
+    return run
+
+
+def test_defaults_reach_the_gunicorn_config(run_main):
+    cfg = run_main()
+
+    assert cfg.worker_class_str == "gthread"
+    assert (cfg.keepalive, cfg.timeout, cfg.graceful_timeout) == (5, 60, 30)
+
+
+@pytest.mark.parametrize("flag, setting", [
+    ("--keep-alive", "keepalive"),
+    ("--timeout", "timeout"),
+    ("--graceful-timeout", "graceful_timeout")
+])
+def test_explicit_timeouts_are_accepted(run_main, flag, setting):
+    cfg = run_main(flag, "7")
+
+    assert getattr(cfg, setting) == 7
+
+
+def test_worker_options_reach_the_gunicorn_config(run_main):
+    cfg = run_main("--bind", "127.0.0.1:8123", "--workers", "3", "--threads", "12", "--max-requests", "500")
+
+    assert cfg.bind == ["127.0.0.1:8123"]
+    assert (cfg.workers, cfg.threads) == (3, 12)
+    assert (cfg.max_requests, cfg.max_requests_jitter) == (500, 50)
+
+
+def test_fractional_timeouts_are_rejected_by_the_parser(run_main):
+    with pytest.raises(SystemExit):
+        run_main("--timeout", "1.5")
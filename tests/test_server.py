@@ -0,0 +1,165 @@
+"""
+Tests for the static file server's revalidation with ETag and
+If-Modified-Since, and its gzip and brotli content negotiation, against a
+server on a free port.
+"""
+
+import email.utils
+import gzip
+import http.client
+import os
+import threading
+import zlib
+from types import SimpleNamespace
+
+import pytest
+
+import server
+from server import StaticFileCache, accepted_encodings, create_server, etag_matches
+
+# Compressible, and well over the smallest body compressed
+SCRIPT = b"function greet(name) { return 'Hello, ' + name + '!'; }\n" * 100
+
+
+@pytest.fixture
+def site(tmp_path):
+    (tmp_path / "app.js").write_bytes(SCRIPT)
+    (tmp_path / "small.txt").write_bytes(b"hello")
+    (tmp_path / "photo.jpg").write_bytes(os.urandom(4096))
+    os.utime(tmp_path / "app.js", (1_700_000_000, 1_700_000_000))
+    return tmp_path
+
+
+@pytest.fixture
+def serve(site):
+    servers = []
+
+    def start(cache=None):
+        httpd = create_server(0, directory=str(site), cache=cache, host="127.0.0.1")
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return http.client.HTTPConnection("127.0.0.1", httpd.server_address[1], timeout=5)
+
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def get(connection, path, headers=None, method="GET"):
+    connection.request(method, path, headers=headers or {})
+    response = connection.getresponse()
+    return response, response.read()
+
+
+def test_etag_revalidates_with_a_304(serve):
+    connection = serve()
+
+    response, body = get(connection, "/app.js")
+    assert response.status == 200 and body == SCRIPT
+    assert response.getheader("Cache-Control") == "no-cache"
+    etag = response.getheader("ETag")
+
+    # The same keep-alive connection revalidates, and a weak comparison is enough
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response, body = get(connection, "/app.js", {"If-None-Match": header})
+        assert response.status == 304 and body == b""
+        assert response.getheader("ETag") == etag
+
+    response, body = get(connection, "/app.js", {"If-None-Match": '"other"'})
+    assert response.status == 200 and body == SCRIPT
+
+
+def test_if_modified_since_revalidates_with_a_304(serve):
+    connection = serve()
+    response, _ = get(connection, "/app.js")
+    last_modified = response.getheader("Last-Modified")
+    assert last_modified == email.utils.formatdate(1_700_000_000, usegmt=True)
+
+    response, body = get(connection, "/app.js", {"If-Modified-Since": last_modified})
+    assert response.status == 304 and body == b""
+
+    earlier = email.utils.formatdate(1_600_000_000, usegmt=True)
+    for header in (earlier, "not a date"):
+        response, body = get(connection, "/app.js", {"If-Modified-Since": header})
+        assert response.status == 200 and body == SCRIPT
+
+    # If-None-Match takes precedence over If-Modified-Since
+    response, _ = get(connection, "/app.js", {"If-None-Match": '"other"', "If-Modified-Since": last_modified})
+    assert response.status == 200
+
+
+def test_changed_file_is_reloaded_with_a_new_etag(serve, site):
+    cache = StaticFileCache()
+    connection = serve(cache)
+    response, _ = get(connection, "/app.js")
+    etag = response.getheader("ETag")
+
+    (site / "app.js").write_bytes(SCRIPT + b"// changed\n")
+    response, body = get(connection, "/app.js", {"If-None-Match": etag})
+
+    assert response.status == 200 and body.endswith(b"// changed\n")
+    assert response.getheader("ETag") != etag
+    assert cache.stats["loads"] == 2
+
+
+def test_gzip_is_negotiated_with_its_own_etag(serve):
+    connection = serve()
+    response, _ = get(connection, "/app.js")
+    identity_etag = response.getheader("ETag")
+    assert response.getheader("Vary") == "Accept-Encoding"
+
+    response, body = get(connection, "/app.js", {"Accept-Encoding": "gzip, deflate"})
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert int(response.getheader("Content-Length")) == len(body) < len(SCRIPT)
+    assert gzip.decompress(body) == SCRIPT
+    gzip_etag = response.getheader("ETag")
+    assert gzip_etag == identity_etag[:-1] + '-gzip"'
+    assert response.getheader("Vary") == "Accept-Encoding"
+
+    # A 304 names the representation the client would have been sent
+    response, _ = get(connection, "/app.js", {"Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+    assert response.status == 304 and response.getheader("ETag") == gzip_etag
+
+    response, body = get(connection, "/app.js", {"Accept-Encoding": "gzip;q=0"})
+    assert response.getheader("Content-Encoding") is None and body == SCRIPT
+
+
+def test_brotli_is_preferred_over_gzip(serve, monkeypatch):
+    # Stands in for the brotli package, which is optional
+    monkeypatch.setattr(server, "brotli", SimpleNamespace(compress=lambda body, quality: zlib.compress(body, 9)))
+    connection = serve()
+
+    response, body = get(connection, "/app.js", {"Accept-Encoding": "gzip, br"})
+    assert response.getheader("Content-Encoding") == "br"
+    assert zlib.decompress(body) == SCRIPT
+    assert response.getheader("ETag").endswith('-br"')
+
+    response, body = get(connection, "/app.js", {"Accept-Encoding": "gzip, br;q=0"})
+    assert response.getheader("Content-Encoding") == "gzip"
+
+
+def test_small_and_binary_files_are_sent_uncompressed(serve):
+    connection = serve()
+    for path in ("/small.txt", "/photo.jpg"):
+        response, _ = get(connection, path, {"Accept-Encoding": "gzip"})
+        assert response.status == 200
+        assert response.getheader("Content-Encoding") is None
+        assert response.getheader("Vary") is None
+
+
+def test_large_files_are_streamed_from_disk(serve, site):
+    connection = serve(StaticFileCache(max_file_bytes=1024))
+
+    response, body = get(connection, "/app.js", {"Accept-Encoding": "gzip"})
+    assert response.status == 200 and body == SCRIPT
+    assert response.getheader("Content-Encoding") is None
+
+    response, body = get(connection, "/app.js", method="HEAD")
+    assert int(response.getheader("Content-Length")) == len(SCRIPT) and body == b""
+
+
+def test_header_parsing():
+    assert accepted_encodings("gzip;q=1.0, br; q=0, identity;q=bad, deflate") == {"gzip", "deflate"}
+    assert etag_matches('W/"a", "b"', ['"a"'])
+    assert not etag_matches('"c"', ['"a"', '"b"'])
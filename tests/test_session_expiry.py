@@ -0,0 +1,125 @@
+"""
+Tests for the session expiry scheduler's ordering of stores by their next
+expiry, on a fake clock, and for its background thread.
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import session_expiry
+import session_store
+from session_expiry import ExpiryScheduler
+from session_store import SessionStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    fake_time = SimpleNamespace(monotonic=lambda: now[0], time=time.time)
+    monkeypatch.setattr(session_store, "time", fake_time)
+    monkeypatch.setattr(session_expiry, "time", fake_time)
+    return now
+
+
+@pytest.fixture
+def stores(monkeypatch):
+    created = []
+    monkeypatch.setattr(session_expiry, "session_stores", lambda: list(created))
+    return created
+
+
+def due_times(scheduler):
+    return sorted((due, store.name) for due, _, store in scheduler._heap)
+
+
+def test_stores_are_expired_in_order_of_their_next_expiry(clock, stores):
+    short, long = SessionStore("short", ttl=10), SessionStore("long", ttl=100)
+    stores.extend([long, short])
+    scheduler = ExpiryScheduler(resolution=1)
+    short["a"] = long["a"] = 1
+
+    # New stores are checked at once, then keyed by when their oldest session expires
+    assert scheduler.run_pending() == 0
+    assert due_times(scheduler) == [(1010.0, "short"), (1100.0, "long")]
+
+    clock[0] = 1009.0
+    assert scheduler.run_pending() == 0
+    assert due_times(scheduler) == [(1010.0, "short"), (1100.0, "long")]
+
+    clock[0] = 1010.5
+    assert scheduler.run_pending() == 1
+    assert "a" not in short and "a" in long
+    # The empty store can't expire anything before one TTL from now
+    assert due_times(scheduler) == [(1020.5, "short"), (1100.0, "long")]
+
+    clock[0] = 1100.5
+    assert scheduler.run_pending() == 1
+    assert "a" not in long
+    assert scheduler.stats == {"runs": 4, "expired": 2}
+
+
+def test_using_a_session_only_postpones_its_store(clock, stores):
+    store = SessionStore("test", ttl=10)
+    stores.append(store)
+    scheduler = ExpiryScheduler(resolution=1)
+    store["a"] = 1
+    scheduler.run_pending()
+
+    clock[0] = 1008.0
+    store.get("a")
+    clock[0] = 1010.5
+
+    # The scheduler wakes at the old key, finds nothing to remove and moves the store to the new expiry
+    assert scheduler.run_pending() == 0
+    assert due_times(scheduler) == [(1018.0, "test")]
+    assert "a" in store
+
+
+def test_resolution_batches_sessions_expiring_close_together(clock, stores):
+    store = SessionStore("test", ttl=10)
+    stores.append(store)
+    scheduler = ExpiryScheduler(resolution=5)
+    for i in range(3):
+        store[f"s{i}"] = i
+        clock[0] += 1
+    scheduler.run_pending()
+
+    clock[0] = 1010.5
+    assert scheduler.run_pending() == 1
+    # s1 and s2 expire within the next 2 seconds, but the store isn't run again for 5
+    assert due_times(scheduler) == [(1015.5, "test")]
+    clock[0] = 1015.5
+    assert scheduler.run_pending() == 2
+
+
+def test_stores_created_later_are_picked_up(clock, stores):
+    scheduler = ExpiryScheduler()
+    scheduler.run_pending()
+    assert scheduler._heap == []
+
+    store = SessionStore("late", ttl=10)
+    stores.append(store)
+    scheduler.run_pending()
+    scheduler.run_pending()
+
+    assert [name for _, name in due_times(scheduler)] == ["late"]
+
+
+def test_background_thread_expires_idle_sessions(stores):
+    store = SessionStore("test", ttl=0.05)
+    stores.append(store)
+    store["a"] = 1
+    scheduler = ExpiryScheduler(resolution=0.01, poll_interval=0.05)
+
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 5
+        while len(store) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        scheduler.stop()
+
+    assert len(store) == 0
+    assert scheduler.stats["expired"] == 1
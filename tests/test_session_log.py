@@ -0,0 +1,231 @@
+"""
+Tests for the session log's framing, torn-tail recovery, segment rollover
+and retention, change-only state records and replay.
+"""
+
+import logging
+import os
+import time
+
+import pytest
+
+import session_log
+import session_store
+from chat_history import ChatHistory
+from session_log import SessionLog, read_segment, replay, segment_name, segment_paths
+from session_store import decode_state, get_session_store
+
+
+@pytest.fixture(autouse=True)
+def stores(monkeypatch):
+    # Fresh stores for every test, so replay restores into empty ones
+    monkeypatch.setattr(session_store, "_stores", {})
+    monkeypatch.setenv("SESSION_STORE_BACKEND", "memory")
+    return get_session_store("test.history"), get_session_store("test.moods")
+
+
+@pytest.fixture
+def open_log(tmp_path):
+    logs = []
+
+    def open_log(**options):
+        log = SessionLog(str(tmp_path), **options)
+        logs.append(log)
+        return log
+
+    yield open_log
+    for log in logs:
+        if log._thread.is_alive():
+            log.close()
+
+
+def turn(session_id, message="hello"):
+    return {"session_id": session_id, "message": message, "reply": f"Reply to {message}", "stage": "llama"}
+
+
+def records(directory):
+    return [record for path in segment_paths(directory) for record in read_segment(path)]
+
+
+def test_frames_a_turn_and_its_states(tmp_path, open_log):
+    log = open_log()
+    history = ChatHistory(3, system={"role": "system", "content": "Be kind."})
+    history.append({"role": "user", "content": "hello"})
+
+    before = time.time()
+    log.append("s1", turn("s1"), {"test.history": history, "test.moods": None})
+    assert log.flush(5)
+
+    (turn_time, session_id, store, payload), *state_records = records(str(tmp_path))
+    assert before <= turn_time <= time.time()
+    assert (session_id, store) == ("s1", "")
+    assert decode_state(payload.decode("utf-8")) == turn("s1")
+    assert [(created, sid, name) for created, sid, name, _ in state_records] == [
+        (turn_time, "s1", "test.history"), (turn_time, "s1", "test.moods")
+    ]
+    assert list(decode_state(state_records[0][3].decode("utf-8"))) == list(history)
+    assert decode_state(state_records[1][3].decode("utf-8")) is None
+    assert log.stats["records"] == 3 and log.stats["commits"] >= 1
+
+
+def test_segment_names_carry_the_process_id(tmp_path, open_log, monkeypatch):
+    pid = os.getpid()
+    first = open_log()
+    monkeypatch.setattr(os, "getpid", lambda: 999999)
+    second = open_log()
+
+    first.append("s1", turn("s1"), {})
+    second.append("s2", turn("s2"), {})
+    first.close()
+    second.close()
+
+    names = [segment_name(path) for path in segment_paths(str(tmp_path))]
+    assert sorted(writer for _, writer in names) == sorted([pid, 999999])
+    assert len({sequence for sequence, _ in names}) == 2
+    # Each worker writes its own segment
+    assert sorted(sid for path in segment_paths(str(tmp_path)) for _, sid, _, _ in read_segment(path)) == ["s1", "s2"]
+
+
+def test_unchanged_states_are_not_logged_again(tmp_path, open_log):
+    log = open_log(retention=100)
+    frames = log._frames
+
+    def stores_logged(frames):
+        path = tmp_path / "frames.bin"
+        path.write_bytes(b"".join(frames))
+        return [store for _, _, store, _ in read_segment(str(path))]
+
+    assert len(frames(1000, "s1", turn("s1"), {"test.history": ["a"], "test.moods": {"mood": "calm"}})) == 3
+    # Only the history changed
+    changed = frames(1001, "s1", turn("s1"), {"test.history": ["a", "b"], "test.moods": {"mood": "calm"}})
+    assert stores_logged(changed) == ["", "test.history"]
+    # Nothing changed, only the turn is logged
+    assert len(frames(1002, "s1", turn("s1"), {"test.history": ["a", "b"], "test.moods": {"mood": "calm"}})) == 1
+    # An unchanged state is logged again once half the retention passed, so it outlives its segment
+    relogged = frames(1051, "s1", turn("s1"), {"test.history": ["a", "b"], "test.moods": {"mood": "calm"}})
+    assert stores_logged(relogged) == ["", "test.history", "test.moods"]
+
+
+def test_torn_tail_is_dropped_and_the_rest_replayed(tmp_path, open_log, stores, caplog):
+    history_store, _ = stores
+    log = open_log()
+    log.append("s1", turn("s1"), {"test.history": ["first"]})
+    log.append("s2", turn("s2"), {"test.history": ["second"]})
+    log.close()
+
+    # A crash cut the last record short
+    path = segment_paths(str(tmp_path))[-1]
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 3)
+
+    with caplog.at_level(logging.WARNING):
+        assert [sid for _, sid, _, _ in read_segment(path)] == ["s1", "s1", "s2"]
+    assert "torn record" in caplog.text
+
+    assert replay(str(tmp_path)) == (2, 1)
+    assert history_store["s1"] == ["first"]
+    assert "s2" not in history_store
+
+
+def test_corrupt_record_ends_the_segment(tmp_path, open_log):
+    log = open_log()
+    log.append("s1", turn("s1"), {})
+    log.append("s2", turn("s2"), {})
+    log.close()
+
+    path = segment_paths(str(tmp_path))[-1]
+    with open(path, "r+b") as f:
+        data = bytearray(f.read())
+        data[-1] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+
+    assert [sid for _, sid, _, _ in read_segment(path)] == ["s1"]
+
+
+def test_rolls_segments_and_deletes_the_expired_ones(tmp_path, open_log):
+    directory = str(tmp_path)
+    old = time.time() - 1000
+    # Closed segments of this process and of a worker that's gone, and an idle live worker's segment
+    for name in ("00000001-%d.log" % os.getpid(), "00000002-999999999.log", "00000003-%d.log" % os.getppid()):
+        path = os.path.join(directory, name)
+        open(path, "wb").close()
+        os.utime(path, (old, old))
+
+    log = open_log(segment_bytes=200, retention=100)
+    for i in range(10):
+        log.append(f"s{i}", turn(f"s{i}", "x" * 50), {})
+        assert log.flush(5)
+    log.close()
+
+    names = [os.path.basename(path) for path in segment_paths(directory)]
+    assert names[0] == "00000003-%d.log" % os.getppid()
+    assert len(names) > 3
+    assert [segment_name(name)[0] for name in names] == sorted(segment_name(name)[0] for name in names)
+    assert all(segment_name(name)[0] > 3 for name in names[1:])
+    assert sorted(sid for _, sid, store, _ in records(directory) if not store) == sorted(f"s{i}" for i in range(10))
+
+
+def test_replay_restores_the_latest_state_of_each_store(tmp_path, open_log, stores):
+    history_store, mood_store = stores
+    log = open_log()
+    log.append("s1", turn("s1"), {"test.history": ["one"], "test.moods": {"mood": "sad"}})
+    log.append("s2", turn("s2"), {"test.history": ["two"], "test.moods": None})
+    log.append("s1", turn("s1"), {"test.history": ["one", "more"], "test.moods": {"mood": "sad"}})
+    log.append("s1", turn("s1"), {"test.history": ["one", "more"], "test.moods": None})
+    log.close()
+
+    assert replay(str(tmp_path)) == (4, 2)
+    # Sessions are restored in least recently used order
+    assert [sid for sid, _ in history_store.items()] == ["s2", "s1"]
+    assert history_store["s1"] == ["one", "more"]
+    assert history_store["s2"] == ["two"]
+    # The mood state was deleted by the last turn, so it isn't restored
+    assert "s1" not in mood_store and "s2" not in mood_store
+
+
+def test_replay_orders_records_of_several_workers_by_time(tmp_path, open_log, stores, monkeypatch):
+    history_store, _ = stores
+    first = open_log()
+    monkeypatch.setattr(os, "getpid", lambda: 999999)
+    second = open_log()
+
+    # The second worker's segment sorts after the first's, but the first worker wrote the latest state
+    second.append("s1", turn("s1"), {"test.history": ["older"]})
+    second.flush(5)
+    first.append("s1", turn("s1"), {"test.history": ["newer"]})
+    first.close()
+    second.close()
+
+    assert segment_name(segment_paths(str(tmp_path))[-1])[1] == 999999
+    replay(str(tmp_path))
+    assert history_store["s1"] == ["newer"]
+
+
+def test_replay_skips_expired_sessions(tmp_path, open_log, stores):
+    history_store, _ = stores
+    log = open_log()
+    log._queue.put((time.time() - history_store.ttl - 10, "old", turn("old"), {"test.history": ["old"]}))
+    log.append("new", turn("new"), {"test.history": ["new"]})
+    log.close()
+
+    assert replay(str(tmp_path)) == (2, 1)
+    assert "old" not in history_store
+    assert history_store["new"] == ["new"]
+
+
+def test_log_turn_logs_every_store(tmp_path, open_log, stores, monkeypatch):
+    history_store, mood_store = stores
+    log = open_log()
+    monkeypatch.setattr(session_log, "_log", log)
+    history_store["s1"] = ["hello"]
+
+    session_log.log_turn("s1", "hello", "hi there", "music")
+    log.close()
+
+    (_, _, _, payload), *states = records(str(tmp_path))
+    assert decode_state(payload.decode("utf-8"))["stage"] == "music"
+    assert {store: decode_state(state.decode("utf-8")) for _, _, store, state in states} == {
+        "test.history": ["hello"], "test.moods": None
+    }
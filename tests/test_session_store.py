@@ -0,0 +1,125 @@
+"""
+Tests for the in-memory session store's least-recently-used order, idle
+timeout and session and byte bounds, on a fake clock.
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import session_store
+from session_store import SessionStore, estimate_size
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store, "time", SimpleNamespace(monotonic=lambda: now[0], time=time.time))
+    return now
+
+
+def test_evicts_the_least_recently_used_session_past_max_sessions(clock):
+    store = SessionStore("test", max_sessions=3)
+    for session_id in ("a", "b", "c"):
+        store[session_id] = session_id
+
+    # Reading a session makes it the most recently used
+    assert store.get("a") == "a"
+    store["d"] = "d"
+
+    assert "b" not in store
+    assert [session_id for session_id, _ in store.items()] == ["c", "a", "d"]
+    assert store.stats["evictions"] == 1
+
+    # Writing an existing session doesn't evict anything, but moves it to the end
+    store["c"] = "c2"
+    assert [session_id for session_id, _ in store.items()] == ["a", "d", "c"]
+    assert store.stats["evictions"] == 1
+
+
+def test_sessions_expire_after_the_idle_timeout(clock):
+    store = SessionStore("test", ttl=60)
+    store["a"] = 1
+    store["b"] = 2
+
+    clock[0] += 45
+    assert store.get("a") == 1  # a is used again, b isn't
+    clock[0] += 30
+
+    assert "b" not in store
+    assert store.get("b", "gone") == "gone"
+    with pytest.raises(KeyError):
+        store["b"]
+    assert store["a"] == 1
+    assert store.stats["expirations"] == 1
+
+
+def test_expire_removes_only_the_idle_sessions_at_the_front(clock):
+    store = SessionStore("test", ttl=60)
+    for i in range(5):
+        store[f"s{i}"] = i
+        clock[0] += 10
+
+    assert store.next_expiry() == 1000.0 + 60
+    clock[0] = 1000.0 + 60 + 15
+
+    assert store.expire() == 2
+    assert [session_id for session_id, _ in store.items()] == ["s2", "s3", "s4"]
+    assert store.next_expiry() == 1020.0 + 60
+    assert store.expire() == 0
+
+
+def test_items_skips_expired_sessions_without_touching_the_order(clock):
+    store = SessionStore("test", ttl=60)
+    store["a"] = 1
+    clock[0] += 30
+    store["b"] = 2
+    clock[0] += 40
+
+    assert store.items() == [("b", 2)]
+    assert len(store) == 2  # a is only removed once it's looked up or expired
+
+
+def test_evicts_down_to_the_byte_budget(clock):
+    size = estimate_size(["x" * 100])
+    store = SessionStore("test", max_bytes=size * 3)
+
+    for session_id in ("a", "b", "c"):
+        store[session_id] = ["x" * 100]
+    assert store.size == size * 3
+
+    # A value as big as two sessions pushes the two least recently used ones out
+    store["d"] = ["x" * 100, "x" * 100]
+    assert [session_id for session_id, _ in store.items()] == ["c", "d"]
+    assert store.size <= store.max_bytes
+    assert store.stats["evictions"] == 2
+
+    # Replacing a value re-measures it, and deleting frees it
+    store["c"] = []
+    del store["d"]
+    assert store.size == estimate_size([])
+
+
+def test_value_bigger_than_the_budget_is_not_kept(clock):
+    store = SessionStore("test", max_bytes=100)
+
+    store["a"] = "x" * 1000
+
+    assert "a" not in store
+    assert store.size == 0
+
+
+def test_setdefault_keeps_an_existing_session(clock):
+    store = SessionStore("test")
+
+    assert store.setdefault("a", {"count": 0}) == {"count": 0}
+    store["a"]["count"] += 1
+    assert store.setdefault("a", {"count": 0}) == {"count": 1}
+
+
+def test_estimate_size_counts_nested_state():
+    flat = estimate_size({"moods": []})
+    nested = estimate_size({"moods": ["sad" * 100, "calm" * 100]})
+
+    assert nested > flat + 700
@@ -0,0 +1,165 @@
+"""
+Tests for the SQLite session store: the database's writer thread, loading
+the sessions back after the database is reopened, and the cache of session
+ids known not to be in the database.
+"""
+
+import time
+
+import pytest
+
+import session_store
+from chat_history import ChatHistory
+from session_store import SessionDatabase, SQLiteSessionStore, new_session_id
+
+
+@pytest.fixture
+def open_database(tmp_path):
+    databases = []
+
+    def open_database():
+        database = SessionDatabase(str(tmp_path / "sessions.db"))
+        databases.append(database)
+        return database
+
+    yield open_database
+    for database in databases:
+        database.close()
+
+
+def rows(database, store):
+    return database._connection().execute(
+        "SELECT session_id, state FROM sessions WHERE store = ? ORDER BY session_id", (store,)
+    ).fetchall()
+
+
+def count_reads(database, monkeypatch):
+    reads = []
+    read = database.read
+
+    def counting_read(*args):
+        reads.append(args[1])
+        return read(*args)
+
+    monkeypatch.setattr(database, "read", counting_read)
+    return reads
+
+
+def test_writer_commits_the_last_state_of_each_session(open_database):
+    database = open_database()
+    store = SQLiteSessionStore("test", database=database)
+
+    state = {"count": 0}
+    for i in range(50):
+        state["count"] = i
+        store["s1"] = state
+    store["s2"] = {"count": -1}
+
+    assert database.flush(5)
+    assert rows(database, "test") == [("s1", '{"count": 49}'), ("s2", '{"count": -1}')]
+    # Writes queued before the writer got to them share a commit
+    assert database.stats["commits"] <= database.stats["writes"] <= 51
+
+
+def test_reads_see_writes_the_writer_has_not_committed(open_database):
+    database = open_database()
+    with database._condition:
+        # Hold the writer back while the write is pending
+        database.write("test", "s1", {"count": 1})
+        assert database.read("test", "s1", 0)[0] == {"count": 1}
+        database.delete("test", "s1")
+        assert database.read("test", "s1", 0) is None
+
+
+def test_sessions_are_loaded_back_after_reopening(open_database):
+    database = open_database()
+    store = SQLiteSessionStore("test", database=database)
+    history = ChatHistory(3, system={"role": "system", "content": "Be kind."})
+    history.append({"role": "user", "content": "hello"})
+    store["old"] = {"count": 1}
+    time.sleep(0.01)
+    store["new"] = history
+    store["gone"] = {"count": 2}
+    del store["gone"]
+    database.close()
+
+    reopened = SQLiteSessionStore("test", database=open_database())
+
+    # The recent sessions are loaded in least recently active order, without asking the database again
+    assert [session_id for session_id, _ in reopened.items()] == ["old", "new"]
+    restored = reopened["new"]
+    assert isinstance(restored, ChatHistory) and list(restored) == list(history)
+    assert "gone" not in reopened
+
+
+def test_loads_only_the_most_recent_unexpired_sessions(open_database):
+    database = open_database()
+    for i in range(5):
+        database.write("test", f"s{i}", i)
+        database.flush(5)
+        time.sleep(0.005)
+    database._connection().execute("UPDATE sessions SET last_activity = 0 WHERE session_id = 's4'")
+    database._connection().commit()
+
+    store = SQLiteSessionStore("test", max_sessions=2, ttl=3600, database=database)
+
+    assert [session_id for session_id, _ in store.items()] == ["s2", "s3"]
+    # Older sessions are read back from the database when they're used, expired ones aren't
+    assert store.get("s0") == 0
+    assert store.get("s4") is None
+
+
+def test_unknown_session_ids_are_looked_up_once(open_database, monkeypatch):
+    database = open_database()
+    store = SQLiteSessionStore("test", database=database)
+    reads = count_reads(database, monkeypatch)
+
+    assert store.get("unknown") is None
+    assert "unknown" not in store
+    assert store.get("unknown", "default") == "default"
+    assert reads == ["unknown"]
+
+    # Writing the session makes it known again, deleting it absent without a lookup
+    store["unknown"] = 1
+    del store["unknown"]
+    assert store.get("unknown") is None
+    assert reads == ["unknown"]
+
+
+def test_new_session_ids_are_never_looked_up(open_database, monkeypatch):
+    database = open_database()
+    monkeypatch.setattr(session_store, "_stores", {"test": SQLiteSessionStore("test", database=database)})
+    reads = count_reads(database, monkeypatch)
+
+    session_id = new_session_id()
+
+    assert session_store._stores["test"].get(session_id) is None
+    assert reads == []
+
+
+def test_absent_cache_is_bounded(open_database):
+    store = SQLiteSessionStore("test", max_sessions=3, database=open_database())
+
+    for i in range(5):
+        store.mark_absent(f"s{i}")
+
+    assert list(store._absent) == ["s2", "s3", "s4"]
+
+
+def test_expire_purges_the_expired_rows(open_database):
+    database = open_database()
+    store = SQLiteSessionStore("test", ttl=3600, database=database)
+    store["old"] = 1
+    store["new"] = 2
+    database.flush(5)
+    database._connection().execute("UPDATE sessions SET last_activity = 0 WHERE session_id = 'old'")
+    database._connection().commit()
+
+    store.expire()
+    database.flush(5)
+
+    assert rows(database, "test") == [("new", "2")]
+
+    store.clear()
+    database.flush(5)
+    assert rows(database, "test") == []
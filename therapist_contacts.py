@@ -2,8 +2,8 @@
 Therapist contacts module for suggesting professional mental health resources.
 """
 
-import re
 import random
+from pattern_matcher import MATCHER, normalize
 
 # Patterns to identify therapist contact requests
 THERAPIST_REQUEST_PATTERNS = [
@@ -21,6 +21,9 @@ THERAPIST_REQUEST_PATTERNS = [
     r"(?:can you|could you|would you) (?:recommend|suggest|provide|give me|share|tell me about) (?:some|any|a few|) (?:wellness center|therapy center|counseling center|mental health center|mental health clinic|psychological service)(?:s|)"
 ]
 
+# Therapist request patterns compiled once into the shared matcher
+THERAPIST_REQUEST_TABLE = MATCHER.register("therapist_request", THERAPIST_REQUEST_PATTERNS)
+
 # List of therapist contacts with detailed information
 THERAPIST_CONTACTS = [
     {
@@ -372,18 +375,15 @@ def detect_therapist_request(text):
     Detect if the text contains a request for therapist contacts.
 
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
 
     Returns:
         dict: Detection results including matched patterns
     """
-    text = text.lower()
+    message = normalize(text)
 
     # Check for therapist request patterns
-    matches = []
-    for pattern in THERAPIST_REQUEST_PATTERNS:
-        if re.search(pattern, text):
-            matches.append(pattern)
+    matches = THERAPIST_REQUEST_TABLE.matched_patterns(message.hits("therapist_request"))
 
     if not matches:
         return {"is_therapist_request": False}
@@ -475,7 +475,7 @@ def process_therapist_request(text):
     Process text to detect therapist requests and generate recommendations.
 
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
 
     Returns:
         dict: Processing results including detection and response
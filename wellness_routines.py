@@ -2,9 +2,10 @@
 Wellness routines module for suggesting daily routines for mental and physical wellness.
 """
 
-import re
 import random
 from datetime import datetime
+from pattern_matcher import MATCHER, normalize
+from keyword_index import KeywordIndex
 
 # Patterns to identify wellness routine requests
 WELLNESS_ROUTINE_PATTERNS = [
@@ -19,6 +20,9 @@ WELLNESS_ROUTINE_PATTERNS = [
     r"(?:what|how) (?:are|about) (?:good|healthy|effective|helpful) (?:daily|morning|evening|night|wellness|mental health|physical|healthy) (?:routine|habits|practices|activities)"
 ]
 
+# Wellness routine patterns compiled once into the shared matcher
+WELLNESS_ROUTINE_TABLE = MATCHER.register("wellness_routine", WELLNESS_ROUTINE_PATTERNS)
+
 # Keywords to identify specific routine types
 ROUTINE_TYPE_KEYWORDS = {
     "morning": ["morning", "wake up", "start the day", "early", "sunrise", "breakfast", "am"],
@@ -28,6 +32,9 @@ ROUTINE_TYPE_KEYWORDS = {
     "general": ["wellness", "wellbeing", "well-being", "health", "routine", "daily", "habits", "lifestyle", "practices", "activities"]
 }
 
+# Routine type keywords indexed once for a single-pass scan
+ROUTINE_TYPE_INDEX = KeywordIndex(ROUTINE_TYPE_KEYWORDS)
+
 # Morning wellness routines
 MORNING_ROUTINES = [
     {
@@ -377,18 +384,15 @@ def detect_wellness_routine_request(text):
     Detect if the text contains a request for wellness routines.
     
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
         
     Returns:
         dict: Detection results including matched patterns and routine type
     """
-    text = text.lower()
+    message = normalize(text)
     
     # Check for wellness routine patterns
-    matches = []
-    for pattern in WELLNESS_ROUTINE_PATTERNS:
-        if re.search(pattern, text):
-            matches.append(pattern)
+    matches = WELLNESS_ROUTINE_TABLE.matched_patterns(message.hits("wellness_routine"))
     
     if not matches:
         return {"is_routine_request": False}
@@ -397,9 +401,7 @@ def detect_wellness_routine_request(text):
     routine_type = "general"  # Default to general wellness
     
     # Check for specific routine types
-    type_matches = {}
-    for type_name, keywords in ROUTINE_TYPE_KEYWORDS.items():
-        type_matches[type_name] = sum(1 for keyword in keywords if keyword in text)
+    type_matches = {type_name: len(found) for type_name, found in message.keyword_hits(ROUTINE_TYPE_INDEX).items()}
     
     # Find the type with the most keyword matches
     if type_matches:
@@ -465,7 +467,7 @@ def process_wellness_routine_request(text):
     Process text to detect wellness routine requests and generate a response.
     
     Args:
-        text (str): The user's message
+        text (str or NormalizedMessage): The user's message
         
     Returns:
         dict: Processing results including detection and response